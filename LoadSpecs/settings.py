@@ -5,6 +5,12 @@ Django settings for LoadSpecs project.
 from pathlib import Path
 import os
 
+try:
+    from celery.schedules import crontab
+except ImportError:
+    # Celery not installed yet - beat schedules are unused without it
+    crontab = None
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -77,13 +83,87 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Cache (per-process). For multiple web/ASGI processes use a shared backend so
+# invalidations are seen everywhere:
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#         'LOCATION': 'redis://127.0.0.1:6379/1',
+#     }
+# }
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Seconds a user's cached chat room memberships live before being rebuilt.
+# The signals invalidating them only reach the cache of the process that
+# saved the change, so with the per-process LocMemCache above other workers
+# may authorize from a stale entry until it expires; keep this short unless
+# CACHES points at the shared Redis cache
+CHAT_MEMBERSHIP_CACHE_TTL = 5
+
+# Chat messages are persisted write-behind: one bulk insert per batch of this
+# many messages, or after this many seconds, whichever comes first
+CHAT_WRITE_BUFFER_SIZE = 100
+CHAT_WRITE_BUFFER_INTERVAL = 0.05
+
+# Chat socket limits: (messages per second, burst) per connection and per user,
+# rejected frames tolerated before closing the socket, and frames buffered
+# for a slow client before the oldest are dropped
+CHAT_RATE_LIMIT_PER_CONNECTION = (5, 10)
+CHAT_RATE_LIMIT_PER_USER = (10, 20)
+CHAT_RATE_LIMIT_MAX_VIOLATIONS = 20
+CHAT_OUTBOUND_QUEUE_SIZE = 100
+
+# Most missed messages replayed to a reconnecting socket per room
+CHAT_REPLAY_LIMIT = 200
+
+# Server-Sent Events fallback (/api/stream/): seconds between keep-alive
+# comments, seconds before a stream is closed for the browser to reconnect,
+# and the reconnect delay suggested to EventSource
+CHAT_SSE_HEARTBEAT = 15
+CHAT_SSE_MAX_AGE = 300
+CHAT_SSE_RETRY_MS = 3000
+
+# Chat messages older than this many days move to compressed day archives;
+# each nightly run archives at most CHAT_ARCHIVE_MAX_DAYS_PER_RUN days
+CHAT_ARCHIVE_AFTER_DAYS = 90
+CHAT_ARCHIVE_MAX_DAYS_PER_RUN = 30
+
+# Streams one multiplexed socket (ws/stream/) may be subscribed to at once
+CHAT_MULTIPLEX_MAX_STREAMS = 50
+
 # Celery Configuration for async tasks
 CELERY_BROKER_URL = 'redis://127.0.0.1:6379/0'
 CELERY_RESULT_BACKEND = 'redis://127.0.0.1:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+# Redis hands an unacknowledged task to another worker after this many
+# seconds, and a countdown task counts as unacknowledged while it waits, so
+# every countdown (see WEEKLY_REPORT_JITTER) must stay well below it
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 60 * 60}
 CELERY_TIMEZONE = 'UTC'
+CELERY_BEAT_SCHEDULE = {
+    'refresh-calendar-tokens': {
+        'task': 'LoadSpecsApp.tasks.refresh_calendar_tokens',
+        'schedule': 300.0,  # every 5 minutes
+    },
+    'archive-old-messages': {
+        'task': 'LoadSpecsApp.tasks.archive_old_messages',
+        'schedule': crontab(hour=3, minute=30) if crontab else 86400.0,  # nightly, off-peak
+    },
+    'prune-old-reports': {
+        'task': 'LoadSpecsApp.tasks.prune_old_reports',
+        'schedule': crontab(hour=4, minute=0) if crontab else 86400.0,  # nightly, off-peak
+    },
+    'schedule-weekly-reports': {
+        'task': 'LoadSpecsApp.tasks.schedule_weekly_reports',
+        'schedule': crontab(hour=1, minute=0, day_of_week='mon') if crontab else 604800.0,  # weekly, off-peak
+    },
+}
 
 # Google Calendar API Configuration
 GOOGLE_CALENDAR_CLIENT_ID = 'your-google-client-id.apps.googleusercontent.com'
@@ -97,6 +177,9 @@ MICROSOFT_REDIRECT_URI = 'http://127.0.0.1:8000/calendar/outlook/callback/'
 MICROSOFT_AUTHORITY = 'https://login.microsoftonline.com/common'
 MICROSOFT_SCOPES = ['Calendars.ReadWrite']
 
+# Refresh calendar OAuth tokens this many seconds before they expire
+CALENDAR_TOKEN_REFRESH_MARGIN = 600
+
 
 # Database
 DATABASES = {
@@ -145,6 +228,28 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Rendered report PDFs, kept out of MEDIA_ROOT so they are only reachable
+# through the permission-checked download view. REPORT_PDF_SENDFILE lets
+# the web server send them: None streams through Django, 'x-sendfile' for
+# Apache/lighttpd, 'x-accel' for nginx with an internal location at
+# REPORT_PDF_ACCEL_PREFIX aliased to REPORT_PDF_ROOT
+REPORT_PDF_ROOT = BASE_DIR / 'private' / 'reports'
+REPORT_PDF_SENDFILE = None
+REPORT_PDF_ACCEL_PREFIX = '/protected/reports/'
+
+# Disk budget for cached report PDFs; least recently downloaded go first
+REPORT_PDF_CACHE_BYTES = 512 * 1024 * 1024
+
+# Seconds a PDF may stay pending before downloads queue it again
+REPORT_PDF_PENDING_TIMEOUT = 15 * 60
+
+# Insight reports, their frozen task tables and PDFs are deleted after this many days
+REPORT_RETENTION_DAYS = 365
+
+# Weekly reports start within this many seconds of the scheduled run; kept
+# below the broker's visibility_timeout so no report is delivered twice
+WEEKLY_REPORT_JITTER = 45 * 60
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
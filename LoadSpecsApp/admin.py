@@ -2,8 +2,10 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import (
     User, Team, TeamLead, Employee, Task, MoodCheckin, InsightReport,
-    Message, Announcement, BurnoutAlert, CalendarSync, TaskPrioritySuggestion, UserPreference
+    Message, MessageArchive, Conversation, ReadCursor, Announcement, BurnoutAlert, CalendarSync, CalendarEvent, CalendarFeed,
+    TaskPrioritySuggestion, UserPreference
 )
+from .utils.message_search import matching_ids
 
 
 @admin.register(User)
@@ -69,8 +71,36 @@ class InsightReportAdmin(admin.ModelAdmin):
 class MessageAdmin(admin.ModelAdmin):
     list_display = ['sender', 'recipient', 'team', 'task', 'timestamp', 'is_read']
     list_filter = ['is_read', 'timestamp', 'team']
-    search_fields = ['sender__username', 'recipient__username', 'content']
+    search_fields = ['sender__username', 'recipient__username']
     readonly_fields = ['timestamp']
+    
+    def get_search_results(self, request, queryset, search_term):
+        # Content goes through the full-text index instead of icontains
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            results |= queryset.filter(pk__in=matching_ids(search_term))
+        return results, may_have_duplicates
+
+
+@admin.register(MessageArchive)
+class MessageArchiveAdmin(admin.ModelAdmin):
+    list_display = ['conversation', 'day', 'message_count', 'archived_at']
+    search_fields = ['conversation']
+    exclude = ['data']
+
+
+@admin.register(Conversation)
+class ConversationAdmin(admin.ModelAdmin):
+    list_display = ['key', 'last_sender', 'last_timestamp', 'last_message_id']
+    search_fields = ['key', 'last_preview']
+    readonly_fields = ['last_timestamp']
+
+
+@admin.register(ReadCursor)
+class ReadCursorAdmin(admin.ModelAdmin):
+    list_display = ['user', 'conversation', 'last_read_message_id', 'updated_at']
+    search_fields = ['user__username', 'conversation']
+    readonly_fields = ['updated_at']
 
 
 @admin.register(Announcement)
@@ -95,6 +125,20 @@ class CalendarSyncAdmin(admin.ModelAdmin):
     readonly_fields = ['last_synced']
 
 
+@admin.register(CalendarEvent)
+class CalendarEventAdmin(admin.ModelAdmin):
+    list_display = ['task', 'calendar_sync', 'event_id', 'synced_due_date', 'removed', 'last_synced']
+    list_filter = ['removed']
+    readonly_fields = ['last_synced']
+
+
+@admin.register(CalendarFeed)
+class CalendarFeedAdmin(admin.ModelAdmin):
+    list_display = ['user', 'created_at']
+    search_fields = ['user__username']
+    readonly_fields = ['token', 'created_at']
+
+
 @admin.register(TaskPrioritySuggestion)
 class TaskPrioritySuggestionAdmin(admin.ModelAdmin):
     list_display = ['task', 'current_priority', 'suggested_priority', 'confidence_score', 'is_applied', 'created_at']
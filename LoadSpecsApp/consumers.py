@@ -2,184 +2,547 @@
 WebSocket consumers for real-time chat and notifications
 """
 
-import json
+import asyncio
+from collections import deque
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
+from .utils import json_utils
+from .utils.conversations import advance_read_cursor, conversation_filter, latest_message_id
+from .utils.membership import aget_accessible_rooms
+from .utils.message_buffer import message_buffer
+from .utils.rate_limit import connection_bucket, user_buckets, violation_bucket
 
-class TeamChatConsumer(AsyncWebsocketConsumer):
-    """WebSocket consumer for team chat rooms"""
+
+# Close code sent to sockets that keep pushing frames past their rate limit
+RATE_LIMIT_CLOSE_CODE = 4029
+
+# Largest id a message primary key can hold; bigger client ids overflow the query
+MAX_MESSAGE_ID = 2 ** 63 - 1
+
+
+class OutboundQueue:
+    """
+    Bounded per-socket send queue
     
-    async def connect(self):
-        self.team_id = self.scope['url_route']['kwargs']['team_id']
-        self.room_group_name = f'team_chat_{self.team_id}'
-        
-        # Join room group
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
+    Frames are written by a single writer task, so a slow client only backs
+    up its own queue. When the queue is full the oldest frame is dropped and
+    the client receives one coalesced 'dropped' notice instead of the frames
+    it missed.
+    """
+    
+    def __init__(self, send, maxsize=None):
+        self._send = send
+        self._frames = deque()
+        self._maxsize = maxsize or getattr(settings, 'CHAT_OUTBOUND_QUEUE_SIZE', 100)
+        self._ready = asyncio.Event()
+        self._dropped = 0
+        self._writer = asyncio.ensure_future(self._run())
+    
+    def put(self, text):
+        if len(self._frames) >= self._maxsize:
+            self._frames.popleft()
+            self._dropped += 1
+        self._frames.append(text)
+        self._ready.set()
+    
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            
+            while self._frames:
+                if self._dropped:
+                    dropped, self._dropped = self._dropped, 0
+                    await self._send(text_data=json_utils.dumps({'type': 'dropped', 'count': dropped}))
+                await self._send(text_data=self._frames.popleft())
+    
+    def close(self):
+        self._writer.cancel()
+
+
+class Room:
+    """A stream a socket can join: its channel-layer group and message target"""
+    
+    def __init__(self, stream, group_name, message_fields=None, history=None):
+        self.stream = stream
+        self.group_name = group_name
+        # Foreign keys stored on messages sent to this room; None if read-only
+        self.message_fields = message_fields
+        # Filter selecting the room's stored messages, for replay
+        self.history = history
+        # Multiplexed frames wrap the shared payload without re-encoding it
+        self.frame_prefix = '{"stream":' + json_utils.dumps(stream) + ',"payload":'
+    
+    @property
+    def writable(self):
+        return self.message_fields is not None
+    
+    def build_message(self, sender_id, content, timestamp):
+        from .models import Message
+        return Message(sender_id=sender_id, content=content, timestamp=timestamp, **self.message_fields)
+    
+    def frame(self, text):
+        return self.frame_prefix + text + '}'
+
+
+async def resolve_stream(user, stream):
+    """
+    Map a stream name to the Room it names, or None if the user may not join
+    
+    Streams are 'team:<id>', 'task:<id>', 'dm:<user id>' and 'notifications'.
+    Each maps onto the same group the dedicated consumers use, so messages
+    reach every subscriber whichever kind of socket they hold.
+    """
+    from .models import User
+    
+    kind, _, key = str(stream).partition(':')
+    if kind == 'notifications' and not key:
+        return Room('notifications', f'notifications_{user.id}')
+    if not key.isdecimal():
+        return None
+    
+    object_id = int(key)
+    stream = f'{kind}:{object_id}'
+    history = conversation_filter(user.id, stream)
+    if kind == 'team':
+        rooms = await aget_accessible_rooms(user)
+        if object_id in rooms['teams']:
+            return Room(stream, f'team_chat_{object_id}', {'team_id': object_id}, history)
+    elif kind == 'task':
+        rooms = await aget_accessible_rooms(user)
+        if object_id in rooms['tasks']:
+            return Room(stream, f'task_chat_{object_id}', {'task_id': object_id}, history)
+    elif kind == 'dm':
+        if await User.objects.filter(id=object_id).aexists():
+            # Both participants share one group, whoever opened it
+            low, high = sorted([user.id, object_id])
+            return Room(stream, f'direct_chat_{low}_{high}', {'recipient_id': object_id}, history)
+    return None
+
+
+def parse_message_id(value):
+    """A message id from client input, or None unless it fits a 64-bit key"""
+    value = str(value)
+    if not (value.isascii() and value.isdigit()) or len(value) > 19:
+        return None
+    message_id = int(value)
+    return message_id if message_id <= MAX_MESSAGE_ID else None
+
+
+def parse_cursor(last_seen_id=None, since=None):
+    """Validate replay cursors from a query string or subscribe frame"""
+    last_seen_id = parse_message_id(last_seen_id)
+    try:
+        since = parse_datetime(since) if isinstance(since, str) else None
+    except ValueError:
+        since = None
+    return last_seen_id, since
+
+
+def parse_message(value):
+    """Message text from a client frame, or None when there is nothing to send"""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    return value
+
+
+async def missed_messages(room, last_seen_id=None, since=None, limit=None):
+    """
+    Messages stored in the room after the client's cursors, oldest first
+    
+    Walks the primary key backwards from the newest row (a keyset query,
+    no OFFSET) and stops after limit rows. Returns (rows, truncated); when
+    truncated, older missed messages have to be fetched from the history API.
+    """
+    from .models import Message
+    
+    if room.history is None or (last_seen_id is None and since is None):
+        return [], False
+    
+    limit = limit or getattr(settings, 'CHAT_REPLAY_LIMIT', 200)
+    queryset = Message.objects.filter(room.history)
+    if last_seen_id is not None:
+        queryset = queryset.filter(id__gt=last_seen_id)
+    if since is not None:
+        queryset = queryset.filter(timestamp__gt=since)
+    
+    queryset = queryset.order_by('-id').values(
+        'id', 'content', 'timestamp', 'sender_id', 'sender__username'
+    )[:limit + 1]
+    rows = [row async for row in queryset]
+    truncated = len(rows) > limit
+    return rows[:limit][::-1], truncated
+
+
+def message_payload(row):
+    """Frame text for a stored message read with the replay columns"""
+    return json_utils.dumps({
+        'id': row['id'],
+        'message': row['content'],
+        'username': row['sender__username'],
+        'user_id': row['sender_id'],
+        'timestamp': row['timestamp'].isoformat()
+    })
+
+
+def chat_event(group_name, sender, content, timestamp, message_id=None):
+    """
+    Channel-layer event announcing a new message
+    
+    The frame is encoded here once; every socket and event stream forwards
+    the same text. Messages saved before broadcasting also carry their id.
+    """
+    frame = {
+        'message': content,
+        'username': sender.username,
+        'user_id': sender.id,
+        'timestamp': timestamp.isoformat()
+    }
+    if message_id is not None:
+        frame = {'id': message_id, **frame}
+    
+    return {
+        'type': 'chat_message',
+        'group': group_name,
+        'timestamp': frame['timestamp'],
+        'text': json_utils.dumps(frame)
+    }
+
+
+def message_group(message):
+    """Group that live subscribers of a stored Message's conversation join"""
+    if message.team_id:
+        return f'team_chat_{message.team_id}'
+    if message.task_id:
+        return f'task_chat_{message.task_id}'
+    if message.recipient_id:
+        low, high = sorted([message.sender_id, message.recipient_id])
+        return f'direct_chat_{low}_{high}'
+    return None
+
+
+def notification_payload(event):
+    return json_utils.dumps({
+        'type': event['notification_type'],
+        'message': event['message'],
+        'timestamp': event['timestamp']
+    })
+
+
+class SocketConsumer(AsyncWebsocketConsumer):
+    """
+    Connection plumbing shared by the chat sockets
+    
+    Handles rate limiting and the bounded outbound queue; subclasses decide
+    which groups the socket joins and what incoming frames mean.
+    """
+    
+    outbound = None
+    abusive = False
+    
+    def joined_groups(self):
+        """Groups to leave when the socket closes"""
+        return []
+    
+    async def open(self):
+        # Rate limits: this socket, all of the user's sockets, and how many
+        # rejected frames we tolerate before treating the client as abusive
+        self.rate_limit = connection_bucket()
+        self.user_rate_limit = user_buckets.get(self.user.id)
+        self.violations = violation_bucket()
         
         await self.accept()
+        self.outbound = OutboundQueue(self.send)
     
     async def disconnect(self, close_code):
-        # Leave room group
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        if self.outbound is not None:
+            self.outbound.close()
+        
+        for group_name in self.joined_groups():
+            await self.channel_layer.group_discard(group_name, self.channel_name)
     
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message = text_data_json['message']
-        username = text_data_json['username']
-        user_id = text_data_json['user_id']
+    def deliver(self, room, text):
+        """Queue an encoded room payload for this socket"""
+        self.outbound.put(text)
+    
+    def send_error(self, error, **extra):
+        self.outbound.put(json_utils.dumps({'type': 'error', 'error': error, **extra}))
+    
+    async def allow_frame(self):
+        """Apply the rate limits; closes the socket on sustained abuse"""
+        if self.abusive:
+            return False
         
-        # Save message to database
-        await self.save_team_message(user_id, self.team_id, message)
+        if self.rate_limit.consume() and self.user_rate_limit.consume():
+            return True
         
-        # Send message to room group
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': message,
-                'username': username,
-                'user_id': user_id,
-                'timestamp': timezone.now().isoformat()
-            }
-        )
+        if not self.violations.consume():
+            self.abusive = True
+            await self.close(code=RATE_LIMIT_CLOSE_CODE)
+        else:
+            self.send_error('rate_limited')
+        return False
     
-    async def chat_message(self, event):
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps({
-            'message': event['message'],
-            'username': event['username'],
-            'user_id': event['user_id'],
-            'timestamp': event['timestamp']
+    async def replay(self, room, last_seen_id=None, since=None):
+        """
+        Send what the client missed before any live frame for the room
+        
+        Must run after the socket joined the room's group so nothing falls
+        between the query and live delivery. Replayed frames carry their
+        message id; clients dedupe live frames on (user_id, timestamp).
+        """
+        if room.history is None or (last_seen_id is None and since is None):
+            return
+        
+        # Messages broadcast by this process may still sit in the buffer
+        await message_buffer.drain()
+        rows, truncated = await missed_messages(room, last_seen_id, since)
+        for row in rows:
+            self.deliver(room, message_payload(row))
+        
+        self.outbound.put(json_utils.dumps({
+            'type': 'replayed',
+            'stream': room.stream,
+            'count': len(rows),
+            'truncated': truncated
         }))
     
-    @database_sync_to_async
-    def save_team_message(self, user_id, team_id, message):
-        from .models import Message, User, Team
-        user = User.objects.get(id=user_id)
-        team = Team.objects.get(id=team_id)
-        Message.objects.create(sender=user, team=team, content=message)
+    async def mark_read(self, room, message_id=None):
+        """
+        Advance the user's read cursor for the room
+        
+        Without an id the cursor moves to the newest stored message, which
+        covers live frames that have no id yet.
+        """
+        if room.history is None:
+            return
+        
+        message_id = parse_message_id(message_id)
+        if message_id is None:
+            await message_buffer.drain()
+            message_id = await database_sync_to_async(latest_message_id)(room.history)
+        
+        message_id = await database_sync_to_async(advance_read_cursor)(self.user.id, room.stream, message_id)
+        self.outbound.put(json_utils.dumps({'type': 'read', 'stream': room.stream, 'last_read_id': message_id}))
+    
+    async def publish(self, room, content):
+        """Persist a message write-behind and broadcast it to the room"""
+        timestamp = timezone.now()
+        message_buffer.add(room.build_message(self.user.id, content, timestamp))
+        
+        await self.channel_layer.group_send(
+            room.group_name,
+            chat_event(room.group_name, self.user, content, timestamp)
+        )
 
 
-class TaskChatConsumer(AsyncWebsocketConsumer):
-    """WebSocket consumer for task-based discussion rooms"""
+class ChatConsumer(SocketConsumer):
+    """
+    Socket bound to a single chat room taken from the URL
+    
+    Subclasses only name their stream; access checks and storage are the
+    same ones the multiplexed socket uses. Reconnecting clients pass
+    ?last_seen_id=<id> and/or ?since=<timestamp> to have missed messages
+    replayed before live delivery resumes. A {"read": true} frame, with an
+    optional "last_read_id", advances the read cursor instead of sending.
+    """
+    
+    room = None
+    
+    def stream_name(self):
+        raise NotImplementedError
+    
+    def joined_groups(self):
+        return [self.room.group_name] if self.room else []
     
     async def connect(self):
-        self.task_id = self.scope['url_route']['kwargs']['task_id']
-        self.room_group_name = f'task_chat_{self.task_id}'
+        # Resolve identities once; receive() never queries them again
+        self.user = self.scope['user']
         
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
+        if self.user.is_authenticated:
+            self.room = await resolve_stream(self.user, self.stream_name())
+        if self.room is None or not self.room.writable:
+            self.room = None
+            await self.close()
+            return
         
-        await self.accept()
-    
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        # Join room group
+        await self.channel_layer.group_add(self.room.group_name, self.channel_name)
+        await self.open()
+        
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        await self.replay(self.room, *parse_cursor(
+            query.get('last_seen_id', [None])[0],
+            query.get('since', [None])[0]
+        ))
     
     async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message = text_data_json['message']
-        username = text_data_json['username']
-        user_id = text_data_json['user_id']
+        if not await self.allow_frame():
+            return
         
-        await self.save_task_message(user_id, self.task_id, message)
+        try:
+            data = json_utils.loads(text_data)
+            read = data.get('read')
+        except (TypeError, ValueError, AttributeError):
+            self.send_error('invalid_frame')
+            return
         
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': message,
-                'username': username,
-                'user_id': user_id,
-                'timestamp': timezone.now().isoformat()
-            }
-        )
+        if read:
+            await self.mark_read(self.room, data.get('last_read_id'))
+            return
+        
+        content = parse_message(data.get('message'))
+        if content is None:
+            self.send_error('invalid_frame')
+        else:
+            await self.publish(self.room, content)
     
     async def chat_message(self, event):
-        await self.send(text_data=json.dumps({
-            'message': event['message'],
-            'username': event['username'],
-            'user_id': event['user_id'],
-            'timestamp': event['timestamp']
-        }))
+        # Frame was serialized once by the sender - just queue it
+        self.deliver(self.room, event['text'])
+
+
+class TeamChatConsumer(ChatConsumer):
+    """WebSocket consumer for team chat rooms"""
+    
+    def stream_name(self):
+        return f"team:{self.scope['url_route']['kwargs']['team_id']}"
+
+
+class TaskChatConsumer(ChatConsumer):
+    """WebSocket consumer for task-based discussion rooms"""
     
-    @database_sync_to_async
-    def save_task_message(self, user_id, task_id, message):
-        from .models import Message, User, Task
-        user = User.objects.get(id=user_id)
-        task = Task.objects.get(id=task_id)
-        Message.objects.create(sender=user, task=task, content=message)
+    def stream_name(self):
+        return f"task:{self.scope['url_route']['kwargs']['task_id']}"
 
 
-class DirectChatConsumer(AsyncWebsocketConsumer):
+class DirectChatConsumer(ChatConsumer):
     """WebSocket consumer for direct messages between users"""
     
+    def stream_name(self):
+        return f"dm:{self.scope['url_route']['kwargs']['user_id']}"
+
+
+class MultiplexConsumer(SocketConsumer):
+    """
+    One socket per client carrying any number of chat streams
+    
+    Client frames:
+        {"action": "subscribe", "stream": "team:3", "last_seen_id": 120}
+        {"action": "unsubscribe", "stream": "team:3"}
+        {"action": "send", "stream": "team:3", "message": "..."}
+        {"action": "read", "stream": "team:3", "last_read_id": 130}
+    
+    Server frames are {"stream": ..., "payload": {...}} for room traffic,
+    where the payload is exactly what the dedicated socket would send, plus
+    {"type": "subscribed" | "replayed" | "read" | "unsubscribed" | "error", ...}
+    control frames. Subscribing with last_seen_id and/or since replays
+    missed messages, as on the dedicated sockets.
+    """
+    
+    def joined_groups(self):
+        return list(self.streams)
+    
     async def connect(self):
-        self.user_id = self.scope['url_route']['kwargs']['user_id']
-        current_user_id = self.scope['user'].id
+        # stream name -> Room, and group name -> Room for incoming events;
+        # set before the auth check so disconnect() always finds them
+        self.rooms = {}
+        self.streams = {}
         
-        # Create a unique room name for direct messages
-        room_ids = sorted([int(current_user_id), int(self.user_id)])
-        self.room_group_name = f'direct_chat_{room_ids[0]}_{room_ids[1]}'
+        self.user = self.scope['user']
+        if not self.user.is_authenticated:
+            await self.close()
+            return
         
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
-        
-        await self.accept()
-    
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        self.max_streams = getattr(settings, 'CHAT_MULTIPLEX_MAX_STREAMS', 50)
+        await self.open()
     
     async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message = text_data_json['message']
-        username = text_data_json['username']
-        user_id = text_data_json['user_id']
+        if not await self.allow_frame():
+            return
         
-        await self.save_direct_message(user_id, self.user_id, message)
+        try:
+            data = json_utils.loads(text_data)
+            action = data.get('action')
+            stream = data.get('stream')
+        except (TypeError, ValueError, AttributeError):
+            self.send_error('invalid_frame')
+            return
         
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': message,
-                'username': username,
-                'user_id': user_id,
-                'timestamp': timezone.now().isoformat()
-            }
-        )
+        # Streams key dicts; anything but a string is unhashable or meaningless
+        if not isinstance(stream, str):
+            self.send_error('invalid_frame')
+            return
+        
+        if action == 'subscribe':
+            await self.subscribe(stream, *parse_cursor(data.get('last_seen_id'), data.get('since')))
+        elif action == 'unsubscribe':
+            await self.unsubscribe(stream)
+        elif action == 'send':
+            room = self.rooms.get(stream)
+            if room is None or not room.writable:
+                self.send_error('not_subscribed', stream=stream)
+            elif parse_message(data.get('message')) is None:
+                self.send_error('invalid_frame', stream=stream)
+            else:
+                await self.publish(room, data['message'])
+        elif action == 'read':
+            room = self.rooms.get(stream)
+            if room is None:
+                self.send_error('not_subscribed', stream=stream)
+            else:
+                await self.mark_read(room, data.get('last_read_id'))
+        else:
+            self.send_error('unknown_action', action=action)
+    
+    async def subscribe(self, stream, last_seen_id=None, since=None):
+        room = self.rooms.get(stream)
+        if room is None:
+            if len(self.rooms) >= self.max_streams:
+                self.send_error('too_many_streams', stream=stream)
+                return
+            
+            room = await resolve_stream(self.user, stream)
+            if room is None:
+                self.send_error('forbidden', stream=stream)
+                return
+            
+            if room.stream not in self.rooms:
+                await self.channel_layer.group_add(room.group_name, self.channel_name)
+                self.rooms[room.stream] = room
+                self.streams[room.group_name] = room
+        
+        self.outbound.put(json_utils.dumps({'type': 'subscribed', 'stream': room.stream}))
+        await self.replay(room, last_seen_id, since)
+    
+    async def unsubscribe(self, stream):
+        room = self.rooms.pop(stream, None)
+        if room is not None:
+            del self.streams[room.group_name]
+            await self.channel_layer.group_discard(room.group_name, self.channel_name)
+        
+        self.outbound.put(json_utils.dumps({'type': 'unsubscribed', 'stream': stream}))
+    
+    def deliver(self, room, text):
+        self.outbound.put(room.frame(text))
     
     async def chat_message(self, event):
-        await self.send(text_data=json.dumps({
-            'message': event['message'],
-            'username': event['username'],
-            'user_id': event['user_id'],
-            'timestamp': event['timestamp']
-        }))
+        # Events still in flight after an unsubscribe are ignored
+        room = self.streams.get(event.get('group'))
+        if room is not None:
+            self.deliver(room, event['text'])
     
-    @database_sync_to_async
-    def save_direct_message(self, sender_id, recipient_id, message):
-        from .models import Message, User
-        sender = User.objects.get(id=sender_id)
-        recipient = User.objects.get(id=recipient_id)
-        Message.objects.create(sender=sender, recipient=recipient, content=message)
+    async def send_notification(self, event):
+        room = self.streams.get(f'notifications_{self.user.id}')
+        if room is not None:
+            self.deliver(room, notification_payload(event))
 
 
 class NotificationConsumer(AsyncWebsocketConsumer):
@@ -204,8 +567,67 @@ class NotificationConsumer(AsyncWebsocketConsumer):
     
     async def send_notification(self, event):
         # Send notification to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': event['notification_type'],
-            'message': event['message'],
-            'timestamp': event['timestamp']
-        }))
+        await self.send(text_data=notification_payload(event))
+
+
+def sse_frame(data, event_id=None):
+    head = f'id: {event_id}\n' if event_id else ''
+    return f'{head}data: {data}\n\n'
+
+
+async def event_stream(user, rooms, last_event_id=None):
+    """
+    Server-Sent Events fallback for clients that cannot hold a WebSocket
+    
+    Joins the rooms' groups on a fresh channel and yields SSE frames shaped
+    like the multiplexed socket's. Chat frames use their message timestamp
+    as the event id, so a reconnecting EventSource sends it back as
+    Last-Event-ID and missed messages are replayed first. Comment lines
+    keep idle proxies from closing the stream; after CHAT_SSE_MAX_AGE
+    seconds the stream ends and the browser reconnects.
+    """
+    layer = get_channel_layer()
+    channel_name = await layer.new_channel()
+    groups = {room.group_name: room for room in rooms}
+    heartbeat = getattr(settings, 'CHAT_SSE_HEARTBEAT', 15)
+    max_age = getattr(settings, 'CHAT_SSE_MAX_AGE', 300)
+    
+    for group_name in groups:
+        await layer.group_add(group_name, channel_name)
+    
+    try:
+        yield f'retry: {getattr(settings, "CHAT_SSE_RETRY_MS", 3000)}\n\n'
+        
+        # Joined first, so nothing falls between the replay and live frames
+        since = parse_cursor(since=last_event_id)[1]
+        if since is not None:
+            await message_buffer.drain()
+            missed = []
+            for room in rooms:
+                rows, truncated = await missed_messages(room, since=since)
+                missed.extend((row['timestamp'], row['id'], room, row) for row in rows)
+            
+            # Oldest first across rooms so event ids only move forward
+            for timestamp, _, room, row in sorted(missed, key=lambda item: item[:2]):
+                yield sse_frame(room.frame(message_payload(row)), timestamp.isoformat())
+        
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max_age
+        while (remaining := deadline - loop.time()) > 0:
+            try:
+                event = await asyncio.wait_for(layer.receive(channel_name), min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            
+            if event['type'] == 'chat_message':
+                room = groups.get(event.get('group'))
+                if room is not None:
+                    yield sse_frame(room.frame(event['text']), event.get('timestamp'))
+            elif event['type'] == 'send_notification':
+                room = groups.get(f'notifications_{user.id}')
+                if room is not None:
+                    yield sse_frame(room.frame(notification_payload(event)))
+    finally:
+        for group_name in groups:
+            await layer.group_discard(group_name, channel_name)
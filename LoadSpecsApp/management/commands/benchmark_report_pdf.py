@@ -0,0 +1,95 @@
+"""
+Memory and time benchmark for report PDFs with long task tables
+
+Creates a team with the given number of tasks, renders its report the
+way the render_report_pdf task does and fails if Python's peak memory
+during the render exceeds the budget:
+
+    python manage.py benchmark_report_pdf
+    python manage.py benchmark_report_pdf --rows 50000 --budget-mb 96
+
+Everything is created inside a transaction that is rolled back, so the
+database is left as it was.
+"""
+
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from LoadSpecsApp.models import Employee, InsightReport, Task, Team, TeamLead, User
+from LoadSpecsApp.utils.report_pdf import build_report_pdf, freeze_report_tasks, report_pdf_data
+
+
+USERNAME_PREFIX = 'benchmark_'
+
+
+class Command(BaseCommand):
+    help = 'Render a report PDF with a long task table and check its peak memory'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Tasks in the report')
+        parser.add_argument('--budget-mb', type=float, default=64, help='Peak memory allowed for the render')
+    
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            report = self.create_report(options['rows'])
+            
+            with tempfile.TemporaryFile() as output:
+                tracemalloc.start()
+                started = time.perf_counter()
+                build_report_pdf(report, output)
+                elapsed = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                
+                size = output.tell()
+                output.seek(0)
+                pages = output.read().count(b'/Type /Page\n')
+            
+            transaction.set_rollback(True)
+        
+        peak_mb = peak / (1024 * 1024)
+        self.stdout.write(
+            f'{options["rows"]} rows, {pages} pages, {size / 1024:.0f} KB in {elapsed:.2f}s, '
+            f'peak memory {peak_mb:.1f} MB (budget {options["budget_mb"]:.0f} MB)'
+        )
+        if peak_mb > options['budget_mb']:
+            raise CommandError(f'Rendering used {peak_mb:.1f} MB, over the {options["budget_mb"]:.0f} MB budget')
+    
+    def create_report(self, rows):
+        lead_user = User.objects.create(username=f'{USERNAME_PREFIX}lead', is_team_lead=True)
+        team_lead = TeamLead.objects.create(user=lead_user)
+        team = Team.objects.create(team_name='Benchmark Team', created_by=lead_user)
+        team_lead.teams.add(team)
+        
+        employees = [
+            Employee.objects.create(
+                user=User.objects.create(username=f'{USERNAME_PREFIX}employee{i}', is_employee=True), team=team
+            )
+            for i in range(20)
+        ]
+        
+        today = timezone.now().date()
+        Task.objects.bulk_create(
+            (
+                Task(
+                    team=team, assigned_to=employees[i % len(employees)], created_by=lead_user,
+                    title=f'Benchmark task number {i} with a longer title', due_date=today + timedelta(days=i % 60),
+                    status=['pending', 'in_progress', 'completed'][i % 3], priority=['low', 'medium', 'high'][i % 3]
+                )
+                for i in range(rows)
+            ),
+            batch_size=1000
+        )
+        
+        report = InsightReport.objects.create(
+            team=team, generated_by=lead_user, report_type='workload',
+            summary_text='Benchmark report', pdf_data=report_pdf_data(team)
+        )
+        freeze_report_tasks(report)
+        return report
@@ -0,0 +1,283 @@
+"""
+Load test for the chat and notification WebSockets
+
+Drives the real consumers in-process through channels.testing, so the
+numbers measure our consumer, channel layer and write-behind code rather
+than a network stack. Keep the options fixed to compare commits:
+
+    python manage.py chat_loadtest --clients 200 --rooms 20 --direct 20 --duration 10
+    python manage.py chat_loadtest --layer redis --json > after.json
+
+Benchmark users are created with a 'loadtest_' prefix and deleted (with
+their messages) when the run ends.
+"""
+
+import asyncio
+import json
+import random
+import time
+import tracemalloc
+
+from channels.layers import InMemoryChannelLayer, channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+
+from LoadSpecsApp.models import Employee, Team, User
+from LoadSpecsApp.routing import websocket_urlpatterns
+from LoadSpecsApp.utils.message_buffer import message_buffer
+
+
+USERNAME_PREFIX = 'loadtest_'
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile in milliseconds, or None without samples"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(fraction * len(ordered)))
+    return round(ordered[index] * 1000, 3)
+
+
+class SimulatedClient:
+    """One socket: sends timestamped messages and times what it receives"""
+    
+    def __init__(self, app, user, path, room_size=0):
+        self.communicator = WebsocketCommunicator(app, path)
+        self.communicator.scope['user'] = user
+        self.path = path
+        # Sockets in the room, including this one; each send fans out to all
+        self.room_size = room_size
+        self.sent = 0
+        self.rejected = 0
+        self.received = 0
+        self.latencies = []
+    
+    async def connect(self):
+        connected, _ = await self.communicator.connect()
+        if not connected:
+            raise CommandError(f'Socket {self.path} was rejected')
+    
+    async def read(self):
+        while True:
+            text = await self.communicator.receive_from(timeout=3600)
+            now = time.perf_counter()
+            frame = json.loads(text)
+            if frame.get('error') == 'rate_limited':
+                self.rejected += 1
+            elif 'message' in frame:
+                self.received += 1
+                self.latencies.append(now - float(frame['message'].rsplit(' ', 1)[-1]))
+    
+    async def write(self, rate, duration, rng):
+        interval = 1.0 / rate
+        # Spread clients across the first interval instead of sending in lockstep
+        await asyncio.sleep(rng.uniform(0, interval))
+        
+        next_send = time.perf_counter()
+        deadline = next_send + duration
+        while next_send < deadline:
+            await self.communicator.send_to(
+                text_data=json.dumps({'message': f'loadtest {time.perf_counter()}'})
+            )
+            self.sent += 1
+            next_send += interval
+            await asyncio.sleep(max(0, next_send - time.perf_counter()))
+
+
+class Command(BaseCommand):
+    help = 'Benchmark chat and notification WebSockets with simulated clients'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50,
+                            help='Team chat sockets, spread round-robin over the rooms')
+        parser.add_argument('--rooms', type=int, default=5, help='Team chat rooms')
+        parser.add_argument('--direct', type=int, default=5,
+                            help='Direct chats; each is a pair of sockets')
+        parser.add_argument('--notifications', type=int, default=10,
+                            help='Notification sockets receiving server pushes')
+        parser.add_argument('--rate', type=float, default=1.0,
+                            help='Messages per second sent by each chat socket and pushed to each notification socket')
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds of sending')
+        parser.add_argument('--layer', choices=['memory', 'redis'], default='memory')
+        parser.add_argument('--redis-url', default='redis://127.0.0.1:6379')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    
+    def handle(self, *args, **options):
+        if options['clients'] and options['rooms'] < 1:
+            raise CommandError('--rooms must be at least 1')
+        if options['rate'] <= 0 or options['duration'] <= 0:
+            raise CommandError('--rate and --duration must be positive')
+        
+        users = self.create_fixtures(options)
+        try:
+            report = asyncio.run(self.run(users, options))
+        finally:
+            User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        
+        for key, value in report.items():
+            self.stdout.write(f'{key:>28}: {value}')
+    
+    def create_fixtures(self, options):
+        """Users, teams and employee profiles for every simulated socket"""
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        
+        owner = User.objects.create(username=f'{USERNAME_PREFIX}owner', is_team_lead=True)
+        teams = [
+            Team.objects.create(team_name=f'Load test {i}', created_by=owner)
+            for i in range(options['rooms'])
+        ]
+        
+        count = options['clients'] + 2 * options['direct']
+        users = User.objects.bulk_create([
+            User(username=f'{USERNAME_PREFIX}{i}', is_employee=True) for i in range(count)
+        ])
+        if any(user.pk is None for user in users):
+            # Backends that cannot return ids from bulk inserts
+            users = list(User.objects.filter(
+                username__startswith=USERNAME_PREFIX, is_employee=True
+            ).order_by('id'))
+        
+        Employee.objects.bulk_create([
+            Employee(user=user, team=teams[i % len(teams)] if i < options['clients'] else None)
+            for i, user in enumerate(users)
+        ])
+        return users
+    
+    def make_layer(self, options):
+        if options['layer'] == 'memory':
+            return InMemoryChannelLayer()
+        
+        try:
+            from channels_redis.core import RedisChannelLayer
+        except ImportError:
+            raise CommandError('--layer redis requires the channels_redis package')
+        return RedisChannelLayer(hosts=[options['redis_url']])
+    
+    def build_clients(self, app, users, options):
+        clients, notified = [], []
+        rooms = options['rooms']
+        team_ids = list(
+            Team.objects.filter(created_by__username=f'{USERNAME_PREFIX}owner')
+            .order_by('id').values_list('id', flat=True)
+        )
+        
+        for i in range(options['clients']):
+            size = options['clients'] // rooms + (1 if i % rooms < options['clients'] % rooms else 0)
+            clients.append(SimulatedClient(
+                app, users[i], f'/ws/chat/team/{team_ids[i % rooms]}/', size
+            ))
+        
+        offset = options['clients']
+        for i in range(options['direct']):
+            first, second = users[offset + 2 * i], users[offset + 2 * i + 1]
+            clients.append(SimulatedClient(app, first, f'/ws/chat/direct/{second.id}/', 2))
+            clients.append(SimulatedClient(app, second, f'/ws/chat/direct/{first.id}/', 2))
+        
+        for user in users[:options['notifications']]:
+            notified.append(SimulatedClient(app, user, '/ws/notifications/'))
+        return clients, notified
+    
+    async def push_notifications(self, layer, client, rate, duration, rng):
+        """Server-side pushes, as send_notification_to_user does"""
+        user_id = client.communicator.scope['user'].id
+        interval = 1.0 / rate
+        await asyncio.sleep(rng.uniform(0, interval))
+        
+        next_send = time.perf_counter()
+        deadline = next_send + duration
+        while next_send < deadline:
+            await layer.group_send(f'notifications_{user_id}', {
+                'type': 'send_notification',
+                'notification_type': 'loadtest',
+                'message': f'loadtest {time.perf_counter()}',
+                'timestamp': ''
+            })
+            client.sent += 1
+            next_send += interval
+            await asyncio.sleep(max(0, next_send - time.perf_counter()))
+    
+    async def run(self, users, options):
+        from channels.db import database_sync_to_async
+        
+        layer = self.make_layer(options)
+        previous_layer = channel_layers.set('default', layer)
+        rng = random.Random(options['seed'])
+        app = URLRouter(websocket_urlpatterns)
+        
+        clients, notified = await database_sync_to_async(self.build_clients)(app, users, options)
+        sockets = clients + notified
+        
+        try:
+            # Memory held per open socket: consumer, queues and layer state
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            for client in sockets:
+                await client.connect()
+            connected = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            
+            readers = [asyncio.ensure_future(client.read()) for client in sockets]
+            written, batches = message_buffer.written, message_buffer.batches
+            
+            started = time.perf_counter()
+            await asyncio.gather(
+                *(client.write(options['rate'], options['duration'], rng) for client in clients),
+                *(self.push_notifications(layer, client, options['rate'], options['duration'], rng)
+                  for client in notified)
+            )
+            
+            # Let in-flight fan-out land, then flush what is still buffered
+            expected = sum((c.sent - c.rejected) * c.room_size for c in clients)
+            settle_until = time.perf_counter() + 5
+            while time.perf_counter() < settle_until:
+                delivered = sum(c.received for c in sockets)
+                if delivered >= expected + sum(c.sent for c in notified):
+                    break
+                await asyncio.sleep(0.01)
+            await message_buffer.drain()
+            elapsed = time.perf_counter() - started
+            
+            for reader in readers:
+                reader.cancel()
+            await asyncio.gather(*readers, return_exceptions=True)
+            for client in sockets:
+                await client.communicator.disconnect()
+        finally:
+            channel_layers.set('default', previous_layer)
+        
+        sent = sum(c.sent for c in clients)
+        rejected = sum(c.rejected for c in clients)
+        chat_latencies = [sample for c in clients for sample in c.latencies]
+        notify_latencies = [sample for c in notified for sample in c.latencies]
+        
+        return {
+            'layer': options['layer'],
+            'chat_sockets': len(clients),
+            'notification_sockets': len(notified),
+            'rooms': options['rooms'],
+            'direct_chats': options['direct'],
+            'rate_per_socket': options['rate'],
+            'duration_s': options['duration'],
+            'elapsed_s': round(elapsed, 3),
+            'messages_sent': sent,
+            'messages_rate_limited': rejected,
+            'messages_per_s': round((sent - rejected) / elapsed, 1),
+            'fanout_delivered': sum(c.received for c in clients),
+            'fanout_expected': expected,
+            'fanout_p50_ms': percentile(chat_latencies, 0.50),
+            'fanout_p99_ms': percentile(chat_latencies, 0.99),
+            'notifications_delivered': len(notify_latencies),
+            'notifications_pushed': sum(c.sent for c in notified),
+            'notification_p50_ms': percentile(notify_latencies, 0.50),
+            'notification_p99_ms': percentile(notify_latencies, 0.99),
+            'db_rows_per_s': round((message_buffer.written - written) / elapsed, 1),
+            'db_inserts_per_s': round((message_buffer.batches - batches) / elapsed, 1),
+            'memory_per_socket_kb': round((connected - baseline) / max(1, len(sockets)) / 1024, 1),
+        }
@@ -0,0 +1,40 @@
+# Generated by Django 4.2 on 2026-10-19 16:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LoadSpecsApp', '0003_employee_department_employee_experience_years_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendarsync',
+            name='delta_link',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='calendarsync',
+            name='sync_token',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='CalendarEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255)),
+                ('synced_due_date', models.DateField()),
+                ('last_synced', models.DateTimeField(default=django.utils.timezone.now)),
+                ('removed', models.BooleanField(default=False)),
+                ('calendar_sync', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='LoadSpecsApp.calendarsync')),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_events', to='LoadSpecsApp.task')),
+            ],
+            options={
+                'unique_together': {('calendar_sync', 'task'), ('calendar_sync', 'event_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.2 on 2026-10-19 16:32
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+import django.db.models.deletion
+
+
+def backfill_conversations(apps, schema_editor):
+    """Summarize the conversations that already have messages"""
+    Message = apps.get_model('LoadSpecsApp', 'Message')
+    Conversation = apps.get_model('LoadSpecsApp', 'Conversation')
+
+    rooms = [
+        Message.objects.filter(team__isnull=False).values('team_id'),
+        Message.objects.filter(team__isnull=True, task__isnull=False).values('task_id'),
+        Message.objects.filter(team__isnull=True, task__isnull=True, recipient__isnull=False)
+        .values('sender_id', 'recipient_id'),
+    ]
+    last_ids = set()
+    for grouped in rooms:
+        last_ids.update(grouped.annotate(last=Max('id')).order_by().values_list('last', flat=True))
+
+    latest = {}
+    for message in Message.objects.filter(id__in=last_ids):
+        if message.team_id:
+            key, fields = f'team:{message.team_id}', {'team_id': message.team_id, 'task_id': message.task_id}
+        elif message.task_id:
+            key, fields = f'task:{message.task_id}', {'task_id': message.task_id}
+        else:
+            low, high = sorted([message.sender_id, message.recipient_id])
+            key, fields = f'dm:{low}:{high}', {'user_low_id': low, 'user_high_id': high}
+
+        current = latest.get(key)
+        if current is None or (message.timestamp, message.id) > (current.last_timestamp, current.last_message_id):
+            latest[key] = Conversation(
+                key=key,
+                last_message_id=message.id,
+                last_sender_id=message.sender_id,
+                last_preview=message.content[:200],
+                last_timestamp=message.timestamp,
+                **fields
+            )
+
+    Conversation.objects.bulk_create(latest.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LoadSpecsApp', '0006_readcursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50, unique=True)),
+                ('last_message_id', models.BigIntegerField(default=0)),
+                ('last_preview', models.CharField(blank=True, max_length=200)),
+                ('last_timestamp', models.DateTimeField(db_index=True)),
+                ('last_sender', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('task', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to='LoadSpecsApp.task')),
+                ('team', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to='LoadSpecsApp.team')),
+                ('user_high', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_low', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-last_timestamp'],
+            },
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
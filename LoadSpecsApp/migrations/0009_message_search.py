@@ -0,0 +1,75 @@
+# Generated by Django 4.2 on 2026-10-19 21:05
+
+from django.db import migrations
+
+
+SQLITE_INSTALL = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS "LoadSpecsApp_message_fts" USING fts5(
+        content, content='LoadSpecsApp_message', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )''',
+    '''CREATE TRIGGER IF NOT EXISTS "LoadSpecsApp_message_fts_insert"
+    AFTER INSERT ON "LoadSpecsApp_message" BEGIN
+        INSERT INTO "LoadSpecsApp_message_fts" (rowid, content) VALUES (new.id, new.content);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS "LoadSpecsApp_message_fts_delete"
+    AFTER DELETE ON "LoadSpecsApp_message" BEGIN
+        INSERT INTO "LoadSpecsApp_message_fts" ("LoadSpecsApp_message_fts", rowid, content)
+        VALUES ('delete', old.id, old.content);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS "LoadSpecsApp_message_fts_update"
+    AFTER UPDATE OF content ON "LoadSpecsApp_message" BEGIN
+        INSERT INTO "LoadSpecsApp_message_fts" ("LoadSpecsApp_message_fts", rowid, content)
+        VALUES ('delete', old.id, old.content);
+        INSERT INTO "LoadSpecsApp_message_fts" (rowid, content) VALUES (new.id, new.content);
+    END''',
+    # Index the messages that already exist
+    '''INSERT INTO "LoadSpecsApp_message_fts" ("LoadSpecsApp_message_fts") VALUES ('rebuild')''',
+]
+
+SQLITE_UNINSTALL = [
+    'DROP TRIGGER IF EXISTS "LoadSpecsApp_message_fts_insert"',
+    'DROP TRIGGER IF EXISTS "LoadSpecsApp_message_fts_delete"',
+    'DROP TRIGGER IF EXISTS "LoadSpecsApp_message_fts_update"',
+    'DROP TABLE IF EXISTS "LoadSpecsApp_message_fts"',
+]
+
+POSTGRES_INSTALL = [
+    '''CREATE INDEX IF NOT EXISTS "LoadSpecsApp_message_content_fts"
+    ON "LoadSpecsApp_message" USING GIN (to_tsvector('english', content))''',
+]
+
+POSTGRES_UNINSTALL = [
+    'DROP INDEX IF EXISTS "LoadSpecsApp_message_content_fts"',
+]
+
+
+def _run(schema_editor, statements):
+    statements = statements.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def install_search_index(apps, schema_editor):
+    """
+    Full-text index for LoadSpecsApp.utils.message_search
+
+    SQLite drops triggers when a migration rebuilds a table, so a later
+    migration that alters Message on SQLite must run this again.
+    """
+    _run(schema_editor, {'sqlite': SQLITE_INSTALL, 'postgresql': POSTGRES_INSTALL})
+
+
+def uninstall_search_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_UNINSTALL, 'postgresql': POSTGRES_UNINSTALL})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LoadSpecsApp', '0008_messagearchive'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
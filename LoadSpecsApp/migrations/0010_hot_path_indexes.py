@@ -0,0 +1,49 @@
+# Generated by Django 4.2 on 2026-10-19 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LoadSpecsApp', '0009_message_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='burnoutalert',
+            index=models.Index(fields=['team_lead', 'is_acknowledged'], name='alert_lead_acknowledged_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['team', 'timestamp', 'id'], name='message_team_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['task', 'timestamp', 'id'], name='message_task_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'recipient', 'timestamp', 'id'], name='message_direct_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='moodcheckin',
+            index=models.Index(fields=['employee', 'timestamp'], name='mood_employee_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='moodcheckin',
+            index=models.Index(fields=['team', 'timestamp'], name='mood_team_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['assigned_to', 'status'], name='task_assignee_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['team', 'status'], name='task_team_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', 'due_date'], name='task_status_due_idx'),
+        ),
+    ]
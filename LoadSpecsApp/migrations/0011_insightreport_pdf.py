@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-19 16:43
+
+import LoadSpecsApp.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LoadSpecsApp', '0010_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='insightreport',
+            name='pdf_file',
+            field=models.FileField(blank=True, storage=LoadSpecsApp.models.report_pdf_storage, upload_to='%Y/%m/'),
+        ),
+        migrations.AddField(
+            model_name='insightreport',
+            name='pdf_status',
+            field=models.CharField(choices=[('none', 'Not requested'), ('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='none', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-19 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LoadSpecsApp', '0011_insightreport_pdf'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='insightreport',
+            name='pdf_data',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
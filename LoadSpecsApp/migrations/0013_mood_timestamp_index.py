@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-19 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LoadSpecsApp', '0012_insightreport_pdf_data'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='moodcheckin',
+            index=models.Index(fields=['timestamp', 'employee', 'mood'], name='mood_timestamp_employee_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-19 17:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LoadSpecsApp', '0013_mood_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='insightreport',
+            name='week_start',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='insightreport',
+            constraint=models.UniqueConstraint(fields=('team', 'report_type', 'week_start'), name='report_team_type_week_unique'),
+        ),
+    ]
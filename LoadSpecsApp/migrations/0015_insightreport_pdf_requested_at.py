@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-19 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LoadSpecsApp', '0014_insightreport_week_start'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='insightreport',
+            name='pdf_requested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-19 17:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LoadSpecsApp', '0015_insightreport_pdf_requested_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=300)),
+                ('assigned_to', models.CharField(max_length=150)),
+                ('status', models.CharField(max_length=20)),
+                ('priority', models.CharField(max_length=20)),
+                ('due_date', models.DateField()),
+                ('report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_rows', to='LoadSpecsApp.insightreport')),
+            ],
+            options={
+                'ordering': ['report', 'position'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reporttask',
+            constraint=models.UniqueConstraint(fields=('report', 'position'), name='report_task_position_unique'),
+        ),
+    ]
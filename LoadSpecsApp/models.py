@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
+import secrets
 import uuid
 
 
@@ -357,6 +358,11 @@ class Task(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['assigned_to', 'status'], name='task_assignee_status_idx'),
+            models.Index(fields=['team', 'status'], name='task_team_status_idx'),
+            models.Index(fields=['status', 'due_date'], name='task_status_due_idx'),
+        ]
 
 
 class MoodCheckin(models.Model):
@@ -383,10 +389,31 @@ class MoodCheckin(models.Model):
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['employee', 'timestamp'], name='mood_employee_timestamp_idx'),
+            models.Index(fields=['team', 'timestamp'], name='mood_team_timestamp_idx'),
+            # Covers the all-employee counts in check_burnout_alerts
+            models.Index(fields=['timestamp', 'employee', 'mood'], name='mood_timestamp_employee_idx'),
+        ]
+
+
+def report_pdf_storage():
+    """Report PDFs live outside MEDIA_ROOT; only the download view serves them"""
+    from django.conf import settings
+    from django.core.files.storage import FileSystemStorage
+    
+    return FileSystemStorage(location=settings.REPORT_PDF_ROOT)
 
 
 class InsightReport(models.Model):
     """AI-generated insight reports"""
+    PDF_STATUS_CHOICES = [
+        ('none', 'Not requested'),
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    
     team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='reports')
     generated_by = models.ForeignKey(User, on_delete=models.CASCADE)
     summary_text = models.TextField()
@@ -406,12 +433,51 @@ class InsightReport(models.Model):
     productivity_score = models.FloatField(default=0.0)
     burnout_prediction = models.TextField(blank=True, null=True)
     team_balance_data = models.JSONField(default=dict, blank=True)
+    # Rendered by the render_report_pdf task from pdf_data, the mood figures
+    # as they were when the report was generated, and its task_rows
+    pdf_data = models.JSONField(default=dict, blank=True)
+    pdf_status = models.CharField(max_length=20, choices=PDF_STATUS_CHOICES, default='none')
+    # When the PDF was last queued; a pending PDF older than
+    # REPORT_PDF_PENDING_TIMEOUT is assumed lost and queued again
+    pdf_requested_at = models.DateTimeField(null=True, blank=True)
+    pdf_file = models.FileField(upload_to='%Y/%m/', storage=report_pdf_storage, blank=True)
+    # Monday of the week for scheduled weekly reports, empty for reports
+    # a team lead generated
+    week_start = models.DateField(null=True, blank=True)
     
     def __str__(self):
         return f"{self.team.team_name} - {self.report_type} - {self.created_at.date()}"
     
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['team', 'report_type', 'week_start'], name='report_team_type_week_unique'),
+        ]
+
+
+class ReportTask(models.Model):
+    """
+    A task as it was when its report was generated
+    
+    The PDF's task table is read from these rows, so it matches the
+    report's summary however the team's tasks change afterwards.
+    """
+    report = models.ForeignKey(InsightReport, on_delete=models.CASCADE, related_name='task_rows')
+    position = models.PositiveIntegerField()
+    title = models.CharField(max_length=300)
+    assigned_to = models.CharField(max_length=150)
+    status = models.CharField(max_length=20)
+    priority = models.CharField(max_length=20)
+    due_date = models.DateField()
+    
+    def __str__(self):
+        return f"{self.report} - {self.title}"
+    
+    class Meta:
+        ordering = ['report', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['report', 'position'], name='report_task_position_unique'),
+        ]
 
 
 class Message(models.Model):
@@ -437,6 +503,106 @@ class Message(models.Model):
     
     class Meta:
         ordering = ['timestamp']
+        # id breaks timestamp ties in keyset-paginated history
+        indexes = [
+            models.Index(fields=['team', 'timestamp', 'id'], name='message_team_timestamp_idx'),
+            models.Index(fields=['task', 'timestamp', 'id'], name='message_task_timestamp_idx'),
+            models.Index(fields=['sender', 'recipient', 'timestamp', 'id'], name='message_direct_timestamp_idx'),
+            # Archiving walks whole days across all conversations
+            models.Index(fields=['timestamp'], name='message_timestamp_idx'),
+        ]
+
+
+class MessageArchive(models.Model):
+    """
+    One day of one conversation's messages, moved out of Message
+    
+    data holds the rows as zlib-compressed JSON (see
+    utils.message_archive). Conversations use the Conversation keys.
+    """
+    conversation = models.CharField(max_length=50)
+    day = models.DateField()
+    first_message_id = models.BigIntegerField()
+    last_message_id = models.BigIntegerField()
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    message_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+    archived_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.conversation} {self.day} ({self.message_count} messages)"
+    
+    class Meta:
+        unique_together = [('conversation', 'day')]
+        ordering = ['conversation', 'day']
+
+
+class Conversation(models.Model):
+    """
+    Latest activity in one chat conversation, for the inbox
+    
+    Keyed 'team:<id>', 'task:<id>' or 'dm:<lower user id>:<higher user id>'.
+    Rows are written together with the messages (see
+    utils.conversations.record_messages), so the inbox lists conversations
+    without touching the message table.
+    """
+    key = models.CharField(max_length=50, unique=True)
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='conversations', null=True, blank=True)
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='conversations', null=True, blank=True)
+    
+    # Direct messages: both participants, lower id first
+    user_low = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+', null=True, blank=True
+    )
+    user_high = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+', null=True, blank=True
+    )
+    
+    last_message_id = models.BigIntegerField(default=0)
+    last_sender = models.ForeignKey(
+        User, on_delete=models.SET_NULL, related_name='+', null=True, blank=True
+    )
+    last_preview = models.CharField(max_length=200, blank=True)
+    last_timestamp = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"{self.key} ({self.last_timestamp})"
+    
+    def stream_for(self, user):
+        """The conversation's stream / read cursor key as seen by user"""
+        if self.team_id:
+            return f'team:{self.team_id}'
+        if self.task_id:
+            return f'task:{self.task_id}'
+        other_id = self.user_high_id if self.user_low_id == user.id else self.user_low_id
+        return f'dm:{other_id}'
+    
+    def other_participant(self, user):
+        return self.user_high if self.user_low_id == user.id else self.user_low
+    
+    class Meta:
+        ordering = ['-last_timestamp']
+
+
+class ReadCursor(models.Model):
+    """
+    How far a user has read in one conversation
+    
+    Conversations use the chat stream keys: 'team:<id>', 'task:<id>' and
+    'dm:<other user id>'. Everything with a higher message id, not sent by
+    the user, counts as unread.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='read_cursors')
+    conversation = models.CharField(max_length=50)
+    last_read_message_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.user.username} read {self.conversation} up to {self.last_read_message_id}"
+    
+    class Meta:
+        unique_together = [('user', 'conversation')]
 
 
 class Announcement(models.Model):
@@ -486,6 +652,9 @@ class BurnoutAlert(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['team_lead', 'is_acknowledged'], name='alert_lead_acknowledged_idx'),
+        ]
 
 
 class CalendarSync(models.Model):
@@ -507,14 +676,71 @@ class CalendarSync(models.Model):
     last_synced = models.DateTimeField(null=True, blank=True)
     sync_enabled = models.BooleanField(default=True)
     
+    # Incremental sync state (Google syncToken / Microsoft Graph deltaLink)
+    sync_token = models.TextField(blank=True, null=True)
+    delta_link = models.TextField(blank=True, null=True)
+    
     def __str__(self):
         return f"{self.user.username} - {self.provider}"
     
+    def reset_sync_state(self):
+        """Forget the incremental sync cursor so the next pull is a full one"""
+        self.sync_token = None
+        self.delta_link = None
+    
     class Meta:
         verbose_name = 'Calendar Sync'
         verbose_name_plural = 'Calendar Syncs'
 
 
+class CalendarEvent(models.Model):
+    """Link between a task and the calendar event it was pushed to"""
+    calendar_sync = models.ForeignKey(CalendarSync, on_delete=models.CASCADE, related_name='events')
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='calendar_events')
+    event_id = models.CharField(max_length=255)
+    
+    # Due date both sides agreed on at the last sync, used to detect which side moved it
+    synced_due_date = models.DateField()
+    last_synced = models.DateTimeField(default=timezone.now)
+    
+    # Set when the event was deleted in the calendar; the task is not pushed again
+    # until it changes locally
+    removed = models.BooleanField(default=False)
+    
+    def __str__(self):
+        return f"{self.task.title} -> {self.calendar_sync.provider}:{self.event_id}"
+    
+    def needs_push(self, task):
+        """Whether the task changed locally since this event was last synced"""
+        if self.removed:
+            return task.updated_at > self.last_synced
+        return task.due_date != self.synced_due_date or task.updated_at > self.last_synced
+    
+    class Meta:
+        unique_together = [('calendar_sync', 'task'), ('calendar_sync', 'event_id')]
+
+
+class CalendarFeed(models.Model):
+    """Secret per-user iCalendar subscription feed of open tasks"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='calendar_feed')
+    token = models.CharField(max_length=64, unique=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    def save(self, *args, **kwargs):
+        if not self.token:
+            self.token = secrets.token_urlsafe(32)
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"{self.user.username} - ICS feed"
+    
+    def get_tasks(self):
+        """Tasks covered by the feed: the user's own, or their teams' for team leads"""
+        if self.user.is_team_lead:
+            return Task.objects.filter(team__team_leads__user=self.user)
+        return Task.objects.filter(assigned_to__user=self.user)
+
+
 class TaskPrioritySuggestion(models.Model):
     """AI-generated task priority suggestions"""
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='priority_suggestions')
@@ -6,6 +6,8 @@ from django.urls import re_path
 from . import consumers
 
 websocket_urlpatterns = [
+    # Single multiplexed socket; clients subscribe to streams over it
+    re_path(r'ws/stream/$', consumers.MultiplexConsumer.as_asgi()),
     re_path(r'ws/chat/team/(?P<team_id>\d+)/$', consumers.TeamChatConsumer.as_asgi()),
     re_path(r'ws/chat/task/(?P<task_id>\d+)/$', consumers.TaskChatConsumer.as_asgi()),
     re_path(r'ws/chat/direct/(?P<user_id>\d+)/$', consumers.DirectChatConsumer.as_asgi()),
@@ -0,0 +1,67 @@
+"""
+Signal handlers keeping cached chat room memberships fresh
+"""
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Employee, Task, Team, TeamLead
+from .utils.membership import invalidate_rooms
+
+
+def _team_lead_user_ids(team_id):
+    return list(TeamLead.objects.filter(teams=team_id).values_list('user_id', flat=True))
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+def employee_membership_changed(sender, instance, **kwargs):
+    """Employee joined, left or switched team"""
+    invalidate_rooms([instance.user_id])
+
+
+@receiver(pre_save, sender=Task)
+def remember_previous_assignee(sender, instance, **kwargs):
+    """Keep the old assignee and team so a reassignment or move revokes their access too"""
+    instance._previous_assignee_user_id = None
+    instance._previous_team_id = None
+    if instance.pk:
+        previous = Task.objects.filter(pk=instance.pk).values_list('assigned_to__user_id', 'team_id').first()
+        if previous:
+            instance._previous_assignee_user_id, instance._previous_team_id = previous
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def task_membership_changed(sender, instance, **kwargs):
+    """Task created, (re)assigned, moved to another team or deleted"""
+    user_ids = _team_lead_user_ids(instance.team_id)
+    previous_team_id = getattr(instance, '_previous_team_id', None)
+    if previous_team_id and previous_team_id != instance.team_id:
+        user_ids.extend(_team_lead_user_ids(previous_team_id))
+    user_ids.append(Employee.objects.filter(pk=instance.assigned_to_id).values_list('user_id', flat=True).first())
+    user_ids.append(getattr(instance, '_previous_assignee_user_id', None))
+    invalidate_rooms(user_ids)
+
+
+@receiver(m2m_changed, sender=TeamLead.teams.through)
+def team_lead_teams_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Team lead added to or removed from teams"""
+    if not action.startswith('post_'):
+        return
+    
+    if not reverse:
+        invalidate_rooms([instance.user_id])
+    elif pk_set:
+        invalidate_rooms(TeamLead.objects.filter(pk__in=pk_set).values_list('user_id', flat=True))
+    else:
+        # post_clear from the team side: pk_set is not provided
+        invalidate_rooms(TeamLead.objects.values_list('user_id', flat=True))
+
+
+@receiver(pre_delete, sender=Team)
+def team_deleted(sender, instance, **kwargs):
+    """Members of a deleted team lose access to its room and tasks"""
+    user_ids = _team_lead_user_ids(instance.pk)
+    user_ids.extend(instance.employees.values_list('user_id', flat=True))
+    invalidate_rooms(user_ids)
@@ -2,6 +2,8 @@
 Celery tasks for background processing
 """
 
+import logging
+
 from celery import shared_task
 from django.utils import timezone
 from datetime import timedelta
@@ -9,6 +11,9 @@ from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 
 
+logger = logging.getLogger(__name__)
+
+
 @shared_task
 def check_burnout_alerts():
     """
@@ -16,24 +21,18 @@ def check_burnout_alerts():
     Runs periodically (e.g., daily)
     """
     from .models import Employee, MoodCheckin, BurnoutAlert, Team, TeamLead
+    from .utils.mood_analytics import mood_distribution
     
-    # Get all employees
-    employees = Employee.objects.all()
+    # Mood check-ins for the last 7 days, counted for every employee at once
+    week_ago = timezone.now() - timedelta(days=7)
+    mood_counts = mood_distribution(start=week_ago, by='employee')
+    
+    # Only employees who checked in can cross a threshold
+    employees = Employee.objects.filter(id__in=mood_counts, team__isnull=False).select_related('user', 'team')
     
     for employee in employees:
-        if not employee.team:
-            continue
-        
-        # Check mood check-ins for the last 7 days
-        week_ago = timezone.now() - timedelta(days=7)
-        recent_moods = MoodCheckin.objects.filter(
-            employee=employee,
-            timestamp__gte=week_ago
-        )
-        
-        # Count burnout moods
-        burnout_count = recent_moods.filter(mood='burnout').count()
-        stressed_count = recent_moods.filter(mood='stressed').count()
+        burnout_count = mood_counts[employee.id]['burnout']
+        stressed_count = mood_counts[employee.id]['stressed']
         
         # Determine severity
         severity = 'low'
@@ -99,14 +98,26 @@ def send_notification_to_user(user_id, notification_type, message):
 @shared_task
 def sync_calendar_tasks():
     """
-    Sync tasks to user calendars (Google Calendar & Outlook)
+    Two-way sync of tasks with user calendars (Google Calendar & Outlook)
     Runs periodically to keep calendars updated
+    
+    Each run first pulls only the events changed since the previous run
+    (Google syncToken / Graph deltaLink) and applies moved due dates back to
+    the tasks, then pushes tasks that changed locally.
     """
     from .models import CalendarSync, Task
+    from .utils.calendar_utils import CalendarTokenManager
     
     active_syncs = CalendarSync.objects.filter(is_active=True, sync_enabled=True)
+    now = timezone.now()
     
     for sync in active_syncs:
+        # Expired tokens are left to refresh_calendar_tokens instead of
+        # failing (or refreshing) inside the sync loop
+        CalendarTokenManager.get_access_token(sync)
+        if not CalendarTokenManager.has_valid_token(sync, at=now):
+            continue
+        
         try:
             user = sync.user
             
@@ -120,9 +131,10 @@ def sync_calendar_tasks():
                 elif sync.provider == 'outlook':
                     sync_to_outlook_calendar(sync, tasks)
                 
-                # Update last synced time
+                # Update last synced time and the incremental sync cursor. Token
+                # fields are left alone so a concurrent refresh is not overwritten
                 sync.last_synced = timezone.now()
-                sync.save()
+                sync.save(update_fields=['last_synced', 'sync_token', 'delta_link'])
         
         except Exception as e:
             print(f"Error syncing calendar for {sync.user.username}: {e}")
@@ -130,17 +142,59 @@ def sync_calendar_tasks():
     return f"Synced {active_syncs.count()} calendars"
 
 
+@shared_task
+def refresh_calendar_tokens():
+    """
+    Refresh calendar OAuth tokens shortly before they expire
+    Runs every few minutes so sync_calendar_tasks always finds a valid token
+    """
+    from .utils.calendar_utils import CalendarTokenManager, token_refresh_metrics
+    
+    refreshed, failed = CalendarTokenManager().refresh_due_tokens()
+    metrics = token_refresh_metrics.snapshot()
+    
+    return (
+        f"Refreshed {refreshed} calendar tokens, {failed} failed "
+        f"(p50 {metrics['latency_p50_ms']}ms, p95 {metrics['latency_p95_ms']}ms)"
+    )
+
+
+def sync_with_calendar_service(sync, calendar_service, tasks):
+    """
+    Pull remote changes, apply them to tasks, then push local changes
+    
+    Pulling first means a due date moved in the calendar is not overwritten
+    by the stale local value on push. If the pull fails nothing is pushed
+    either: remote edits the conflict rules would keep are not known yet.
+    Returns False in that case.
+    """
+    from .utils.calendar_utils import apply_remote_changes
+    
+    changes = calendar_service.pull_changes()
+    if changes is None:
+        print(f"Skipping calendar push for {sync.user.username}: pulling changes failed")
+        return False
+    if changes:
+        apply_remote_changes(sync, changes)
+    
+    # Only tasks that are new or changed since their last sync cost an API call
+    links = {link.task_id: link for link in sync.events.all()}
+    for task in tasks:
+        link = links.get(task.id)
+        if link is None or link.needs_push(task):
+            calendar_service.create_or_update_event(task, link)
+    return True
+
+
 def sync_to_google_calendar(sync, tasks):
     """
-    Sync tasks to Google Calendar
+    Sync tasks with Google Calendar
     """
     from .utils.calendar_utils import GoogleCalendarService
     
     try:
         calendar_service = GoogleCalendarService(sync)
-        
-        for task in tasks:
-            calendar_service.create_or_update_event(task)
+        sync_with_calendar_service(sync, calendar_service, tasks)
     
     except Exception as e:
         print(f"Google Calendar sync error: {e}")
@@ -148,15 +202,13 @@ def sync_to_google_calendar(sync, tasks):
 
 def sync_to_outlook_calendar(sync, tasks):
     """
-    Sync tasks to Outlook Calendar
+    Sync tasks with Outlook Calendar
     """
     from .utils.calendar_utils import OutlookCalendarService
     
     try:
         calendar_service = OutlookCalendarService(sync)
-        
-        for task in tasks:
-            calendar_service.create_or_update_event(task)
+        sync_with_calendar_service(sync, calendar_service, tasks)
     
     except Exception as e:
         print(f"Outlook Calendar sync error: {e}")
@@ -219,3 +271,163 @@ def send_task_reminders():
             send_notification_to_user.delay(user.id, 'task_reminder', message)
     
     return f"Sent reminders for {upcoming_tasks.count()} tasks"
+
+
+@shared_task
+def archive_old_messages():
+    """
+    Move chat messages older than CHAT_ARCHIVE_AFTER_DAYS into compressed
+    per-conversation day archives
+    Runs nightly; large backlogs are worked off over several runs
+    """
+    from django.conf import settings
+    from .utils.message_archive import archive_messages
+    
+    archived = archive_messages(max_days=getattr(settings, 'CHAT_ARCHIVE_MAX_DAYS_PER_RUN', 30))
+    
+    return f"Archived {archived} messages"
+
+
+@shared_task
+def prune_old_reports():
+    """
+    Delete insight reports older than REPORT_RETENTION_DAYS with their
+    frozen task rows and stored PDFs
+    Runs nightly
+    """
+    from .utils.report_pdf import prune_old_reports as prune
+    
+    deleted = prune()
+    
+    return f"Deleted {deleted} old reports"
+
+
+@shared_task
+def render_report_pdf(report_id, notify=True):
+    """
+    Render an InsightReport to PDF and store it on the report
+    Queued by the report views; tells whoever generated the report when
+    the download is ready unless notify is False
+    """
+    import tempfile
+    from django.core.files import File
+    from .models import InsightReport
+    from .utils.report_pdf import (
+        build_report_pdf, cache_name, evict_report_pdfs, freeze_report_tasks, report_pdf_data, touch
+    )
+    
+    report = InsightReport.objects.select_related('team', 'generated_by').filter(id=report_id).first()
+    if report is None:
+        return f"Report {report_id} no longer exists"
+    
+    if not report.pdf_data:
+        # Reports from before figures were frozen at generation
+        report.pdf_data = report_pdf_data(report.team)
+        report.save(update_fields=['pdf_data'])
+    if 'tasks' not in report.pdf_data and 'task_count' not in report.pdf_data:
+        # First render: freeze the team's tasks (older reports kept ten rows in pdf_data)
+        freeze_report_tasks(report)
+    
+    # Content-addressed: an unchanged report that was rendered before
+    # (and not yet evicted) is reused as is
+    name = cache_name(report)
+    storage = report.pdf_file.storage
+    if storage.exists(name):
+        touch(storage, name)
+    else:
+        # Rendered to disk: long reports run to hundreds of pages
+        with tempfile.TemporaryFile() as output:
+            try:
+                build_report_pdf(report, output)
+            except Exception:
+                InsightReport.objects.filter(id=report_id).update(pdf_status='failed')
+                if notify:
+                    send_notification_to_user.delay(
+                        report.generated_by_id, 'report_failed',
+                        f"The PDF for the {report.team.team_name} {report.report_type} report could not be generated"
+                    )
+                raise
+            output.seek(0)
+            name = storage.save(name, File(output))
+    
+    report.pdf_file.name = name
+    report.pdf_status = 'ready'
+    report.save(update_fields=['pdf_file', 'pdf_status'])
+    evict_report_pdfs(keep={name})
+    
+    if notify:
+        send_notification_to_user.delay(
+            report.generated_by_id, 'report_ready',
+            f"The PDF for the {report.team.team_name} {report.report_type} report is ready to download"
+        )
+    
+    return f"Rendered report {report_id}"
+
+
+@shared_task
+def schedule_weekly_reports():
+    """
+    Queue this week's reports for every team, one task per team
+    Runs early on Monday; each team's task starts after a random delay of
+    up to WEEKLY_REPORT_JITTER seconds so the workers and the database see
+    a steady trickle rather than every team at once. The delay is capped
+    below the broker's visibility timeout: Redis would otherwise hand the
+    waiting task to a second worker and the team's reports would run twice
+    """
+    import random
+    from django.conf import settings
+    from .models import Team
+    
+    week_start = timezone.localdate() - timedelta(days=timezone.localdate().weekday())
+    visibility_timeout = getattr(settings, 'CELERY_BROKER_TRANSPORT_OPTIONS', {}).get('visibility_timeout', 3600)
+    jitter = min(settings.WEEKLY_REPORT_JITTER, visibility_timeout * 0.75)
+    
+    team_ids = list(Team.objects.values_list('id', flat=True))
+    for team_id in team_ids:
+        generate_weekly_reports.apply_async(
+            (team_id, week_start.isoformat()), countdown=random.uniform(0, jitter)
+        )
+    
+    return f"Queued weekly reports for {len(team_ids)} teams"
+
+
+@shared_task
+def generate_weekly_reports(team_id, week_start):
+    """
+    Generate one team's weekly reports and render their PDFs
+    Safe to run again for the same week: existing reports are reused and
+    only PDFs that are not ready are rendered. A failing report is counted
+    and the team's other reports still go ahead.
+    """
+    from datetime import date
+    from django.db import IntegrityError, transaction
+    from .models import InsightReport, Team
+    from .utils.report_summaries import WEEKLY_REPORT_TYPES, create_insight_report
+    
+    team = Team.objects.select_related('created_by').filter(id=team_id).first()
+    if team is None:
+        return f"Team {team_id} no longer exists"
+    week_start = date.fromisoformat(week_start)
+    
+    rendered = failed = 0
+    for report_type in WEEKLY_REPORT_TYPES:
+        report = InsightReport.objects.filter(team=team, report_type=report_type, week_start=week_start).first()
+        try:
+            if report is None:
+                with transaction.atomic():
+                    report = create_insight_report(team, report_type, team.created_by, week_start=week_start)
+            if report.pdf_status != 'ready':
+                # In this worker: the team's reports are its unit of work
+                render_report_pdf(report.id, notify=False)
+                rendered += 1
+        except IntegrityError:
+            # A duplicate run created this report first
+            continue
+        except Exception:
+            logger.exception(
+                "Weekly %s report for team %s (%s), week of %s, failed",
+                report_type, team_id, team.team_name, week_start
+            )
+            failed += 1
+    
+    return f"Weekly reports for team {team_id}: {rendered} rendered, {failed} failed"
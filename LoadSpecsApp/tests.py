@@ -0,0 +1,807 @@
+import re
+import tempfile
+from datetime import date, timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.core.files.storage import FileSystemStorage
+from django.db import OperationalError, connection
+from django.db.models import CharField, F, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Concat
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from kombu.exceptions import OperationalError as KombuOperationalError
+
+from .consumers import MultiplexConsumer, TeamChatConsumer, missed_messages, resolve_stream
+from .models import (
+    CalendarEvent, CalendarSync, Employee, InsightReport, Message, MoodCheckin, ReadCursor, ReportTask, Task, Team, TeamLead,
+    User
+)
+from .tasks import (
+    analyze_task_priorities, check_burnout_alerts, generate_weekly_reports, render_report_pdf, schedule_weekly_reports,
+    send_task_reminders, sync_with_calendar_service,
+)
+from .utils import message_search
+from .utils.calendar_utils import GoogleCalendarService, OutlookCalendarService, apply_remote_changes
+from .utils.conversations import conversation_filter, message_page, recent_messages, record_messages, unread_counts
+from .utils.membership import get_accessible_rooms
+from .utils.message_archive import archive_messages, archived_page
+from .utils.message_buffer import MessageWriteBuffer, message_buffer
+from .utils.mood_analytics import mood_distribution, mood_trend
+from .utils.rate_limit import UserBuckets
+from .utils.report_pdf import data_version, freeze_report_tasks, prune_old_reports, task_rows
+from .utils.report_summaries import create_insight_report
+
+
+def create_team(name='Team'):
+    """A team with one lead and one employee"""
+    lead = User.objects.create(username=f'{name.lower()}_lead', is_team_lead=True)
+    team_lead = TeamLead.objects.create(user=lead)
+    team = Team.objects.create(team_name=name, created_by=lead)
+    team_lead.teams.add(team)
+    
+    user = User.objects.create(username=f'{name.lower()}_employee', is_employee=True)
+    employee = Employee.objects.create(user=user, team=team)
+    return team, lead, employee
+
+
+def use_temporary_report_storage(test):
+    """Store report PDFs in a temporary directory until the test ends"""
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    storage = mock.patch.object(
+        InsightReport._meta.get_field('pdf_file'), 'storage', FileSystemStorage(location=directory.name)
+    )
+    storage.start()
+    test.addCleanup(storage.stop)
+
+
+class StubRequest:
+    def __init__(self, result):
+        self.result = result
+    
+    def execute(self):
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class StubGoogleEvents:
+    """events() of the Google API client, answering list() from canned pages"""
+    
+    def __init__(self, pages):
+        self.pages = list(pages)
+        self.calls = []
+    
+    def list(self, **params):
+        self.calls.append(params)
+        return StubRequest(self.pages.pop(0))
+
+
+class StubGoogleService:
+    def __init__(self, pages):
+        self.stub_events = StubGoogleEvents(pages)
+    
+    def events(self):
+        return self.stub_events
+
+
+class StubResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.data = data or {}
+        self.text = str(self.data)
+    
+    def json(self):
+        return self.data
+
+
+class CalendarSyncTestCase(TestCase):
+    def setUp(self):
+        self.team, self.lead, self.employee = create_team()
+        self.sync = CalendarSync.objects.create(user=self.employee.user, provider='google', access_token='token')
+        self.due = date(2026, 3, 10)
+        self.task = Task.objects.create(
+            team=self.team, assigned_to=self.employee, created_by=self.lead, title='Write report', due_date=self.due
+        )
+        self.link = CalendarEvent.objects.create(
+            calendar_sync=self.sync, task=self.task, event_id='evt-1', synced_due_date=self.due
+        )
+    
+    def change(self, **values):
+        change = {'event_id': 'evt-1', 'due_date': self.due, 'deleted': False, 'updated': timezone.now()}
+        change.update(values)
+        return change
+
+
+class ApplyRemoteChangesTests(CalendarSyncTestCase):
+    def test_moved_event_moves_the_task(self):
+        moved = self.due + timedelta(days=2)
+        
+        self.assertEqual(apply_remote_changes(self.sync, [self.change(due_date=moved)]), 1)
+        
+        self.task.refresh_from_db()
+        self.link.refresh_from_db()
+        self.assertEqual(self.task.due_date, moved)
+        self.assertEqual(self.link.synced_due_date, moved)
+    
+    def test_unchanged_and_unknown_events_are_ignored(self):
+        changes = [self.change(), self.change(event_id='not-ours', due_date=self.due + timedelta(days=5))]
+        
+        self.assertEqual(apply_remote_changes(self.sync, changes), 0)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.due_date, self.due)
+    
+    def test_deleted_event_unlinks_without_touching_the_task(self):
+        self.assertEqual(apply_remote_changes(self.sync, [self.change(deleted=True, due_date=None)]), 0)
+        
+        self.link.refresh_from_db()
+        self.task.refresh_from_db()
+        self.assertTrue(self.link.removed)
+        self.assertEqual(self.task.due_date, self.due)
+        
+        # Later changes to a removed event are not applied either
+        apply_remote_changes(self.sync, [self.change(due_date=self.due + timedelta(days=1))])
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.due_date, self.due)
+    
+    def test_completed_tasks_are_never_moved(self):
+        Task.objects.filter(pk=self.task.pk).update(status='completed')
+        
+        self.assertEqual(apply_remote_changes(self.sync, [self.change(due_date=self.due + timedelta(days=3))]), 0)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.due_date, self.due)
+    
+    def test_conflict_newer_local_edit_wins(self):
+        local_due = self.due + timedelta(days=1)
+        Task.objects.filter(pk=self.task.pk).update(due_date=local_due, updated_at=timezone.now())
+        remote = self.change(due_date=self.due + timedelta(days=4), updated=timezone.now() - timedelta(hours=1))
+        
+        self.assertEqual(apply_remote_changes(self.sync, [remote]), 0)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.due_date, local_due)
+    
+    def test_conflict_newer_remote_edit_wins(self):
+        Task.objects.filter(pk=self.task.pk).update(
+            due_date=self.due + timedelta(days=1), updated_at=timezone.now() - timedelta(hours=1)
+        )
+        remote_due = self.due + timedelta(days=4)
+        
+        self.assertEqual(apply_remote_changes(self.sync, [self.change(due_date=remote_due)]), 1)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.due_date, remote_due)
+
+
+class GooglePullChangesTests(CalendarSyncTestCase):
+    def service(self, pages):
+        with mock.patch.object(GoogleCalendarService, '_initialize_service'):
+            service = GoogleCalendarService(self.sync)
+        service.service = StubGoogleService(pages)
+        return service
+    
+    def test_full_pull_follows_pages_and_stores_the_sync_token(self):
+        service = self.service([
+            {'items': [{'id': 'evt-1', 'start': {'date': '2026-03-12'}, 'updated': '2026-03-01T10:00:00Z'}],
+             'nextPageToken': 'page-2'},
+            {'items': [{'id': 'evt-2', 'status': 'cancelled'}], 'nextSyncToken': 'sync-1'},
+        ])
+        
+        changes = service.pull_changes()
+        
+        self.assertEqual([change['event_id'] for change in changes], ['evt-1', 'evt-2'])
+        self.assertEqual(changes[0]['due_date'], date(2026, 3, 12))
+        self.assertFalse(changes[0]['deleted'])
+        self.assertTrue(changes[1]['deleted'])
+        self.assertEqual(self.sync.sync_token, 'sync-1')
+        self.assertNotIn('syncToken', service.service.stub_events.calls[0])
+        self.assertEqual(service.service.stub_events.calls[1]['pageToken'], 'page-2')
+    
+    def test_incremental_pull_sends_the_sync_token(self):
+        self.sync.sync_token = 'sync-1'
+        service = self.service([{'items': [], 'nextSyncToken': 'sync-2'}])
+        
+        self.assertEqual(service.pull_changes(), [])
+        self.assertEqual(service.service.stub_events.calls[0]['syncToken'], 'sync-1')
+        self.assertEqual(self.sync.sync_token, 'sync-2')
+    
+    def test_expired_sync_token_falls_back_to_a_full_pull(self):
+        import httplib2
+        from googleapiclient.errors import HttpError
+        
+        self.sync.sync_token = 'expired'
+        service = self.service([
+            HttpError(httplib2.Response({'status': 410}), b'Gone'),
+            {'items': [{'id': 'evt-1', 'start': {'date': '2026-03-11'}}], 'nextSyncToken': 'sync-new'},
+        ])
+        
+        changes = service.pull_changes()
+        
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(self.sync.sync_token, 'sync-new')
+        self.assertNotIn('syncToken', service.service.stub_events.calls[1])
+    
+    def test_pulled_changes_apply_to_tasks(self):
+        service = self.service([
+            {'items': [{'id': 'evt-1', 'start': {'date': '2026-03-15'}, 'updated': timezone.now().isoformat()}],
+             'nextSyncToken': 'sync-1'},
+        ])
+        
+        apply_remote_changes(self.sync, service.pull_changes())
+        
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.due_date, date(2026, 3, 15))
+
+
+class OutlookPullChangesTests(CalendarSyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sync.provider = 'outlook'
+        self.sync.save()
+        self.service = OutlookCalendarService(self.sync)
+    
+    def test_delta_round_stores_the_delta_link(self):
+        responses = [
+            StubResponse(200, {'value': [{'id': 'evt-1', 'start': {'dateTime': '2026-03-13T00:00:00.0000000'}}],
+                               '@odata.nextLink': 'https://graph.test/next'}),
+            StubResponse(200, {'value': [{'id': 'evt-2', '@removed': {'reason': 'deleted'}}],
+                               '@odata.deltaLink': 'https://graph.test/delta'}),
+        ]
+        with mock.patch('requests.get', side_effect=responses) as get:
+            changes = self.service.pull_changes()
+        
+        self.assertEqual([change['event_id'] for change in changes], ['evt-1', 'evt-2'])
+        self.assertEqual(changes[0]['due_date'], date(2026, 3, 13))
+        self.assertTrue(changes[1]['deleted'])
+        self.assertEqual(self.sync.delta_link, 'https://graph.test/delta')
+        self.assertIn('calendarView/delta', get.call_args_list[0].args[0])
+    
+    def test_expired_delta_link_starts_a_new_round(self):
+        self.sync.delta_link = 'https://graph.test/expired'
+        responses = [StubResponse(410), StubResponse(200, {'value': [], '@odata.deltaLink': 'https://graph.test/new'})]
+        with mock.patch('requests.get', side_effect=responses) as get:
+            self.assertEqual(self.service.pull_changes(), [])
+        
+        self.assertEqual(get.call_args_list[0].args[0], 'https://graph.test/expired')
+        self.assertIn('calendarView/delta', get.call_args_list[1].args[0])
+        self.assertEqual(self.sync.delta_link, 'https://graph.test/new')
+    
+    def test_failed_pull_returns_none(self):
+        with mock.patch('requests.get', return_value=StubResponse(500)):
+            self.assertIsNone(self.service.pull_changes())
+    
+    def test_failed_pull_skips_the_push(self):
+        self.task.due_date = self.due + timedelta(days=1)
+        self.task.save()
+        service = mock.Mock()
+        service.pull_changes.return_value = None
+        
+        self.assertFalse(sync_with_calendar_service(self.sync, service, [self.task]))
+        service.create_or_update_event.assert_not_called()
+
+
+class MembershipInvalidationTests(TestCase):
+    def test_task_moved_to_another_team_leaves_the_old_leads_rooms(self):
+        team, lead, employee = create_team()
+        other_team, other_lead, _ = create_team('Other')
+        task = Task.objects.create(
+            team=team, assigned_to=employee, created_by=lead, title='Move me', due_date=date(2026, 3, 10)
+        )
+        self.assertIn(task.id, get_accessible_rooms(lead)['tasks'])
+        self.assertNotIn(task.id, get_accessible_rooms(other_lead)['tasks'])
+        
+        task.team = other_team
+        task.save()
+        
+        self.assertNotIn(task.id, get_accessible_rooms(lead)['tasks'])
+        self.assertIn(task.id, get_accessible_rooms(other_lead)['tasks'])
+
+
+class MessageWriteBufferTests(TestCase):
+    def setUp(self):
+        self.team, self.lead, self.employee = create_team()
+    
+    def message(self, content):
+        return Message(sender=self.lead, team=self.team, content=content)
+    
+    def test_bad_row_is_dropped_and_the_rest_written(self):
+        buffer = MessageWriteBuffer(batch_size=10, flush_interval=60)
+        
+        async def run():
+            for content in ['first', None, 'third']:
+                buffer.add(self.message(content))
+            return await buffer.flush()
+        
+        self.assertEqual(async_to_sync(run)(), 2)
+        self.assertEqual(list(Message.objects.values_list('content', flat=True)), ['first', 'third'])
+        self.assertEqual(buffer.dropped, 1)
+        self.assertFalse(buffer._pending)
+    
+    def test_failed_batch_is_retried_on_a_timer(self):
+        buffer = MessageWriteBuffer(batch_size=10, flush_interval=60)
+        buffer.retry_interval = 0.01
+        
+        async def run():
+            buffer.add(self.message('hello'))
+            with mock.patch('LoadSpecsApp.utils.message_buffer.write_messages', side_effect=OperationalError('locked')):
+                self.assertEqual(await buffer.flush(), 0)
+            self.assertEqual(len(buffer._pending), 1)
+            self.assertIsNotNone(buffer._timer)
+            await buffer.drain()
+        
+        async_to_sync(run)()
+        self.assertEqual(list(Message.objects.values_list('content', flat=True)), ['hello'])
+        self.assertEqual(buffer.dropped, 0)
+
+
+class UserBucketsTests(TestCase):
+    def test_full_bucket_held_by_a_socket_survives_pruning(self):
+        buckets = UserBuckets(rate=1, burst=2)
+        held = buckets.get(1)
+        for user_id in range(2, buckets.PRUNE_EVERY + 2):
+            buckets.get(user_id)
+        
+        self.assertIs(buckets.get(1), held)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ChatConsumerTests(TestCase):
+    def setUp(self):
+        self.team, self.lead, self.employee = create_team()
+    
+    def communicator(self, user):
+        communicator = WebsocketCommunicator(TeamChatConsumer.as_asgi(), f'/ws/chat/team/{self.team.id}/')
+        communicator.scope['user'] = user
+        communicator.scope['url_route'] = {'kwargs': {'team_id': self.team.id}}
+        return communicator
+    
+    def test_bad_frames_get_an_error_and_are_not_sent(self):
+        async def run():
+            communicator = self.communicator(self.lead)
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            
+            for frame in ['not json', '[1, 2]', '{}', '{"message": "   "}', '{"message": 5}']:
+                await communicator.send_to(text_data=frame)
+                self.assertEqual(await communicator.receive_json_from(), {'type': 'error', 'error': 'invalid_frame'})
+            
+            await communicator.send_to(text_data='{"message": "hello"}')
+            self.assertEqual((await communicator.receive_json_from())['message'], 'hello')
+            await communicator.disconnect()
+            await message_buffer.drain()
+        
+        async_to_sync(run)()
+        self.assertEqual(list(Message.objects.values_list('content', flat=True)), ['hello'])
+    
+    def test_malformed_multiplex_frames_get_an_error(self):
+        async def run():
+            communicator = WebsocketCommunicator(MultiplexConsumer.as_asgi(), '/ws/chat/')
+            communicator.scope['user'] = self.lead
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            
+            for frame in ['{"action": "subscribe", "stream": ["team:1"]}', '{"action": "send", "stream": {}}']:
+                await communicator.send_to(text_data=frame)
+                self.assertEqual(await communicator.receive_json_from(), {'type': 'error', 'error': 'invalid_frame'})
+            
+            stream = f'team:{self.team.id}'
+            await communicator.send_json_to({'action': 'subscribe', 'stream': stream})
+            self.assertEqual((await communicator.receive_json_from())['type'], 'subscribed')
+            await communicator.send_json_to({'action': 'read', 'stream': stream, 'last_read_id': '9' * 30})
+            # An id past any 64-bit key falls back to the newest stored message
+            self.assertEqual(await communicator.receive_json_from(), {'type': 'read', 'stream': stream, 'last_read_id': 0})
+            await communicator.disconnect()
+        
+        async_to_sync(run)()
+    
+    def test_unauthenticated_multiplex_socket_closes_cleanly(self):
+        async def run():
+            communicator = WebsocketCommunicator(MultiplexConsumer.as_asgi(), '/ws/chat/')
+            communicator.scope['user'] = AnonymousUser()
+            connected, _ = await communicator.connect()
+            self.assertFalse(connected)
+            await communicator.disconnect()
+        
+        async_to_sync(run)()
+
+
+class UnreadCountsTests(TestCase):
+    def setUp(self):
+        self.team, self.lead, self.employee = create_team()
+        self.user = self.employee.user
+        self.task = Task.objects.create(team=self.team, assigned_to=self.employee, created_by=self.lead, title='Task',
+                                        due_date=date(2026, 3, 10))
+    
+    def send(self, sender, count=1, **room):
+        messages = [Message.objects.create(sender=sender, content='hi', **room) for _ in range(count)]
+        record_messages(messages)
+        return messages
+    
+    def test_counts_messages_after_each_read_cursor(self):
+        team_messages = self.send(self.lead, 3, team=self.team)
+        self.send(self.lead, 2, task=self.task)
+        self.send(self.lead, 2, recipient=self.user)
+        self.send(self.user, 4, team=self.team)
+        ReadCursor.objects.create(user=self.user, conversation=f'team:{self.team.id}',
+                                  last_read_message_id=team_messages[0].id)
+        
+        counts = unread_counts(self.user, {'teams': [self.team.id], 'tasks': [self.task.id]})
+        
+        self.assertEqual(counts, {
+            f'team:{self.team.id}': 2, f'task:{self.task.id}': 2, f'dm:{self.lead.id}': 2,
+        })
+    
+    def test_fully_read_conversations_are_left_out(self):
+        last = self.send(self.lead, 2, recipient=self.user)[-1]
+        ReadCursor.objects.create(user=self.user, conversation=f'dm:{self.lead.id}', last_read_message_id=last.id)
+        
+        self.assertEqual(unread_counts(self.user, {'teams': [self.team.id], 'tasks': []}), {})
+    
+    def test_many_rooms_are_counted_in_batches(self):
+        tasks = Task.objects.bulk_create(
+            Task(team=self.team, assigned_to=self.employee, created_by=self.lead, title=f'Task {i}', due_date=date(2026, 3, 10))
+            for i in range(1500)
+        )
+        self.send(self.lead, task=tasks[-1])
+        rooms = {'teams': [self.team.id], 'tasks': [task.id for task in tasks]}
+        
+        self.assertEqual(unread_counts(self.user, rooms), {f'task:{tasks[-1].id}': 1})
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class SendMessageApiTests(TestCase):
+    def setUp(self):
+        self.team, self.lead, self.employee = create_team()
+        self.task = Task.objects.create(team=self.team, assigned_to=self.employee, created_by=self.lead, title='Task',
+                                        due_date=date(2026, 3, 10))
+        _, self.outsider, _ = create_team('Other')
+    
+    def send(self, user, message_type, target_id, content='hello'):
+        self.client.force_login(user)
+        return self.client.post(
+            reverse('send_message_api'), {'type': message_type, 'target_id': target_id, 'content': content},
+            content_type='application/json'
+        )
+    
+    def test_members_can_send(self):
+        response = self.send(self.employee.user, 'team', self.team.id)
+        
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(Message.objects.get().team_id, self.team.id)
+    
+    def test_broadcast_waits_for_the_commit(self):
+        with mock.patch('LoadSpecsApp.views.broadcast_chat_message') as broadcast:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.send(self.employee.user, 'team', self.team.id)
+                broadcast.assert_not_called()
+            self.assertEqual(len(callbacks), 1)
+        
+        broadcast.assert_called_once_with(Message.objects.get())
+    
+    def test_outsiders_are_refused(self):
+        self.assertEqual(self.send(self.outsider, 'team', self.team.id).status_code, 403)
+        self.assertEqual(self.send(self.outsider, 'task', self.task.id).status_code, 403)
+        self.assertFalse(Message.objects.exists())
+    
+    def test_blank_messages_are_refused(self):
+        self.assertFalse(self.send(self.employee.user, 'team', self.team.id, '   ').json()['success'])
+        self.assertFalse(Message.objects.exists())
+
+
+class MessageArchiveTests(TestCase):
+    def setUp(self):
+        self.team, self.lead, _ = create_team()
+        now = timezone.now()
+        Message.objects.bulk_create(
+            Message(team=self.team, sender=self.lead, content=f'day {days}', timestamp=now - timedelta(days=days))
+            for days in range(100, 103)
+        )
+    
+    def test_old_days_are_paged_from_the_archive(self):
+        self.assertEqual(archive_messages(after_days=90), 3)
+        self.assertFalse(Message.objects.exists())
+        
+        # One query for the day chunks, one for the usernames
+        with self.assertNumQueries(2):
+            rows = archived_page(f'team:{self.team.id}', limit=3)
+        self.assertEqual([row['content'] for row in rows], ['day 100', 'day 101', 'day 102'])
+
+
+class MessageSearchTests(TestCase):
+    def setUp(self):
+        self.team, self.lead, self.employee = create_team()
+        self.rooms = {'teams': [self.team.id], 'tasks': []}
+        for content in ['deploy today', 'deploy now', 'deploy the release candidate after lunch']:
+            Message.objects.create(sender=self.lead, team=self.team, content=content)
+    
+    def search(self, cursor=None):
+        return message_search.search_messages(self.employee.user, 'deploy', cursor, limit=2, rooms=self.rooms)
+    
+    def test_later_pages_ignore_messages_sent_after_the_first(self):
+        first, cursor = self.search()
+        # Longer, so it ranks below the first page
+        late = Message.objects.create(sender=self.lead, team=self.team, content='deploy ' + 'words ' * 30)
+        second, _ = self.search(cursor)
+        
+        self.assertEqual(len(first), 2)
+        self.assertNotIn(late.id, [hit['id'] for hit in second])
+        # A new search includes it
+        hits, _ = message_search.search_messages(self.employee.user, 'deploy', rooms=self.rooms)
+        self.assertIn(late.id, [hit['id'] for hit in hits])
+    
+    def test_bad_cursor_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            self.search('1.0:abc')
+
+
+class QueryPlanTests(TestCase):
+    """
+    Hot views and helpers must search an index, never read a whole table
+    
+    Each test runs the real code under CaptureQueriesContext and asks the
+    database for the plan of every SELECT it issued. SQLite plans without
+    table statistics, so the plans match a large database even though the
+    test tables are tiny. On PostgreSQL plans are made with enable_seqscan
+    off, so a Seq Scan means no usable index exists.
+    """
+    
+    # SQLite: 'SCAN <table or alias>' reads every row, with or without
+    # 'USING INDEX'; scans of subquery results and of the FTS index are fine
+    SQLITE_SCAN = re.compile(r'\bSCAN (?!CONSTANT ROW)(\S+)')
+    SQLITE_SUBQUERY = re.compile(r'\b(?:MATERIALIZE|CO-ROUTINE) (\S+)')
+    POSTGRES_SCAN = re.compile(r'\bSeq Scan on\b')
+    # A correlated subquery runs once per outer row, so even an indexed one
+    # costs as much as the rows the outer query walks
+    SQLITE_CORRELATED = re.compile(r'\bCORRELATED (?:SCALAR|LIST) SUBQUERY\b')
+    POSTGRES_CORRELATED = re.compile(r'\bSubPlan\b')
+    
+    def setUp(self):
+        self.team, self.lead, self.employee = create_team()
+        self.user = self.employee.user
+        self.task = Task.objects.create(team=self.team, assigned_to=self.employee, created_by=self.lead, title='Task',
+                                        due_date=timezone.now().date())
+        record_messages([
+            Message.objects.create(sender=self.lead, content='deploy notes', **room)
+            for room in [{'team': self.team}, {'task': self.task}, {'recipient': self.user}]
+        ])
+        for mood in ['burnout', 'burnout', 'stressed', 'happy']:
+            MoodCheckin.objects.create(employee=self.employee, team=self.team, mood=mood)
+    
+    def is_full_scan(self, line, plan):
+        if connection.vendor == 'postgresql':
+            return bool(self.POSTGRES_SCAN.search(line) or self.POSTGRES_CORRELATED.search(line))
+        if self.SQLITE_CORRELATED.search(line):
+            return True
+        match = self.SQLITE_SCAN.search(line)
+        if not match or 'VIRTUAL TABLE' in line:
+            return False
+        return match.group(1) not in self.SQLITE_SUBQUERY.findall(plan)
+    
+    def full_scans(self, queries):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest(f'Query plans cannot be checked on {connection.vendor}')
+        explain = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        
+        scans = []
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            for query in queries:
+                if not query['sql'].lstrip().upper().startswith('SELECT'):
+                    continue
+                cursor.execute(explain + query['sql'])
+                plan = '\n'.join(str(row[-1]) for row in cursor.fetchall())
+                scans.extend(
+                    f'{line.strip()}\n    in {query["sql"]}' for line in plan.splitlines() if self.is_full_scan(line, plan)
+                )
+        return scans
+    
+    def assertIndexed(self, run):
+        with CaptureQueriesContext(connection) as captured:
+            run()
+        scans = self.full_scans(captured.captured_queries)
+        self.assertFalse(scans, 'Full table scans or per-row subqueries:\n' + '\n'.join(scans))
+    
+    def get(self, user, name, *args, **params):
+        self.client.force_login(user)
+        
+        def run():
+            response = self.client.get(reverse(name, args=args), params)
+            self.assertEqual(response.status_code, 200)
+        return run
+    
+    def test_chat_pages(self):
+        newest = Message.objects.filter(team=self.team).latest('id').id
+        self.assertIndexed(self.get(self.user, 'chat'))
+        self.assertIndexed(self.get(self.user, 'team_chat', self.team.id))
+        self.assertIndexed(self.get(self.user, 'task_chat', self.task.id))
+        self.assertIndexed(self.get(self.user, 'direct_chat', self.lead.id))
+        self.assertIndexed(self.get(self.user, 'get_messages_api', self.team.id, type='team', before_id=newest))
+        self.assertIndexed(self.get(self.user, 'get_messages_api', self.lead.id, type='direct', before_id=newest))
+        self.assertIndexed(self.get(self.user, 'search_messages_api', q='deploy'))
+    
+    def test_direct_history_is_read_in_index_order(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Sort steps are only checked on SQLite')
+        history = conversation_filter(self.user.id, f'dm:{self.lead.id}')
+        newest = Message.objects.filter(history).latest('id').id
+        
+        with CaptureQueriesContext(connection) as captured:
+            message_page(history, before_id=newest)
+            message_page(history, after_id=newest)
+            recent_messages(history)
+        with connection.cursor() as cursor:
+            for query in captured.captured_queries:
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                self.assertNotIn('TEMP B-TREE', ' '.join(str(row[-1]) for row in cursor.fetchall()), query['sql'])
+    
+    def test_unread_counts_and_replay(self):
+        rooms = {'teams': [self.team.id], 'tasks': [self.task.id]}
+        self.assertIndexed(lambda: unread_counts(self.user, rooms))
+        
+        room = async_to_sync(resolve_stream)(self.user, f'team:{self.team.id}')
+        self.assertIndexed(lambda: async_to_sync(missed_messages)(room, last_seen_id=1, limit=200))
+    
+    def test_correlated_subqueries_are_reported(self):
+        last_read = ReadCursor.objects.filter(
+            user=self.user, conversation=Concat(Value('team:'), Cast(OuterRef('team_id'), CharField()))
+        ).values('last_read_message_id')[:1]
+        unread = Message.objects.filter(team=self.team).annotate(last_read=Subquery(last_read))
+        
+        with CaptureQueriesContext(connection) as captured:
+            list(unread.filter(id__gt=F('last_read')))
+        self.assertTrue(self.full_scans(captured.captured_queries))
+    
+    def test_archiving_finds_the_oldest_day(self):
+        self.assertIndexed(lambda: archive_messages(after_days=1, max_days=1))
+    
+    def test_dashboards(self):
+        self.assertIndexed(self.get(self.user, 'home'))
+        self.assertIndexed(self.get(self.lead, 'home'))
+        self.assertIndexed(self.get(self.user, 'tasks'))
+        self.assertIndexed(self.get(self.lead, 'tasks'))
+        self.assertIndexed(self.get(self.lead, 'performance_dashboard'))
+        self.assertIndexed(self.get(self.lead, 'get_mood_trends_data'))
+        self.assertIndexed(self.get(self.lead, 'burnout_alerts'))
+    
+    def test_mood_analytics(self):
+        week_ago = timezone.now() - timedelta(days=7)
+        self.assertIndexed(lambda: mood_distribution(start=week_ago, by='employee'))
+        self.assertIndexed(lambda: mood_distribution(teams=[self.team.id], start=week_ago))
+        self.assertIndexed(lambda: mood_trend(week_ago, teams=Team.objects.filter(created_by=self.lead)))
+    
+    def test_periodic_tasks(self):
+        with mock.patch('LoadSpecsApp.tasks.send_notification_to_user.delay'):
+            self.assertIndexed(check_burnout_alerts)
+            self.assertIndexed(send_task_reminders)
+        with mock.patch('LoadSpecsApp.utils.ai_utils.TaskPrioritizer') as prioritizer:
+            prioritizer.return_value.analyze_task.return_value = None
+            self.assertIndexed(analyze_task_priorities)
+
+
+class ReportPdfQueueTests(TestCase):
+    def setUp(self):
+        self.team, self.lead, self.employee = create_team()
+        self.report = create_insight_report(self.team, 'workload', self.lead)
+        use_temporary_report_storage(self)
+        self.client.force_login(self.lead)
+    
+    def test_unreachable_broker_renders_the_pdf_in_the_request(self):
+        with mock.patch('LoadSpecsApp.tasks.render_report_pdf.apply_async', side_effect=KombuOperationalError('refused')):
+            response = self.client.get(reverse('download_report_pdf', args=[self.report.id]))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.report.refresh_from_db()
+        self.assertEqual(self.report.pdf_status, 'ready')
+    
+    def test_stale_pending_pdf_is_queued_again(self):
+        InsightReport.objects.filter(id=self.report.id).update(
+            pdf_status='pending', pdf_requested_at=timezone.now() - timedelta(hours=1)
+        )
+        with mock.patch('LoadSpecsApp.tasks.render_report_pdf.apply_async') as apply_async:
+            self.client.get(reverse('download_report_pdf', args=[self.report.id]))
+            self.client.get(reverse('download_report_pdf', args=[self.report.id]))
+        
+        # Queued once; the second download finds it freshly pending
+        apply_async.assert_called_once()
+        self.report.refresh_from_db()
+        self.assertGreater(self.report.pdf_requested_at, timezone.now() - timedelta(minutes=1))
+
+
+class ExportViewTests(TestCase):
+    def setUp(self):
+        self.team, self.lead, self.employee = create_team()
+        Task.objects.create(team=self.team, assigned_to=self.employee, created_by=self.lead, title='=SUM(A1)',
+                            due_date=date(2026, 3, 10))
+        self.client.force_login(self.lead)
+    
+    def export(self, **params):
+        return self.client.get(reverse('export', args=['tasks', 'csv']), params)
+    
+    def test_csv_export_of_one_team(self):
+        response = self.export(team=self.team.id)
+        
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        self.assertIn("'=SUM(A1)", content)
+    
+    def test_non_numeric_team_is_a_bad_request(self):
+        self.assertEqual(self.export(team='abc').status_code, 400)
+
+
+class ReportTaskFreezeTests(TestCase):
+    def setUp(self):
+        self.team, self.lead, self.employee = create_team()
+        for i in range(3):
+            Task.objects.create(team=self.team, assigned_to=self.employee, created_by=self.lead, title=f'Task {i}',
+                                due_date=date(2026, 3, 10))
+        self.report = create_insight_report(self.team, 'workload', self.lead)
+        use_temporary_report_storage(self)
+    
+    def test_tasks_are_frozen_by_the_first_render(self):
+        self.assertFalse(self.report.task_rows.exists())
+        render_report_pdf(self.report.id, notify=False)
+        self.report.refresh_from_db()
+        rows = list(task_rows(self.report))
+        version = data_version(self.report)
+        
+        Task.objects.filter(title='Task 0').update(status='completed', updated_at=timezone.now())
+        Task.objects.create(team=self.team, assigned_to=self.employee, created_by=self.lead, title='Late task',
+                            due_date=date(2026, 3, 11))
+        render_report_pdf(self.report.id, notify=False)
+        self.report.refresh_from_db()
+        
+        self.assertEqual([row[0] for row in rows], ['Task 2', 'Task 1', 'Task 0'])
+        self.assertEqual(list(task_rows(self.report)), rows)
+        self.assertEqual(data_version(self.report), version)
+        self.assertEqual(self.report.pdf_data['task_count'], 3)
+        self.assertEqual(self.report.pdf_status, 'ready')
+    
+    def test_freezing_again_keeps_the_rows(self):
+        freeze_report_tasks(self.report)
+        Task.objects.create(team=self.team, assigned_to=self.employee, created_by=self.lead, title='Late task',
+                            due_date=date(2026, 3, 11))
+        
+        self.assertEqual(freeze_report_tasks(self.report), 4)
+        self.assertEqual(self.report.task_rows.filter(title='Late task').count(), 0)
+    
+    def test_old_reports_are_pruned_with_their_tasks_and_pdfs(self):
+        render_report_pdf(self.report.id, notify=False)
+        self.report.refresh_from_db()
+        storage = self.report.pdf_file.storage
+        name = self.report.pdf_file.name
+        recent = create_insight_report(self.team, 'burnout', self.lead)
+        InsightReport.objects.filter(id=self.report.id).update(created_at=timezone.now() - timedelta(days=400))
+        
+        self.assertEqual(prune_old_reports(days=365), 1)
+        self.assertEqual(list(InsightReport.objects.values_list('id', flat=True)), [recent.id])
+        self.assertFalse(ReportTask.objects.exists())
+        self.assertFalse(storage.exists(name))
+
+
+class WeeklyReportTests(TestCase):
+    def setUp(self):
+        self.team, self.lead, self.employee = create_team()
+    
+    def test_failed_report_is_logged_and_the_rest_rendered(self):
+        failures = [None, RuntimeError('renderer crashed'), None]
+        with mock.patch('LoadSpecsApp.tasks.render_report_pdf', side_effect=failures) as render, \
+                self.assertLogs('LoadSpecsApp.tasks', 'ERROR') as logs:
+            result = generate_weekly_reports(self.team.id, '2026-03-09')
+        
+        self.assertEqual(render.call_count, 3)
+        self.assertIn('2 rendered, 1 failed', result)
+        self.assertIn(f'Weekly burnout report for team {self.team.id}', logs.output[0])
+        self.assertIn('RuntimeError: renderer crashed', logs.output[0])
+    
+    @override_settings(WEEKLY_REPORT_JITTER=6 * 60 * 60, CELERY_BROKER_TRANSPORT_OPTIONS={'visibility_timeout': 3600})
+    def test_jitter_stays_below_the_visibility_timeout(self):
+        with mock.patch('LoadSpecsApp.tasks.generate_weekly_reports.apply_async') as apply_async, \
+                mock.patch('random.uniform', side_effect=lambda low, high: high):
+            schedule_weekly_reports()
+        
+        self.assertLess(apply_async.call_args.kwargs['countdown'], 3600)
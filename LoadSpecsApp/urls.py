@@ -29,12 +29,17 @@ urlpatterns = [
     path('tasks/update/<int:task_id>/', views.update_task_view, name='update_task'),
     path('tasks/delete/<int:task_id>/', views.delete_task_view, name='delete_task'),
     
+    # Spreadsheet exports
+    path('export/<str:dataset>.<str:file_format>', views.export_view, name='export'),
+    
     # Mood check-in
     path('mood-checkin/', views.mood_checkin_view, name='mood_checkin'),
     
     # Reports
     path('reports/generate/', views.generate_report_view, name='generate_report'),
     path('reports/download/<int:report_id>/', views.download_report_pdf, name='download_report_pdf'),
+    path('reports/<int:report_id>/status/', views.report_status_api, name='report_status'),
+    path('reports/charts/mood.png', views.mood_chart_view, name='mood_chart'),
     
     # AJAX Endpoints
     path('api/check-username/', views.check_username, name='check_username'),
@@ -45,6 +50,7 @@ urlpatterns = [
     path('calendar/sync/', views.calendar_sync_setup, name='calendar_sync_setup'),
     path('calendar/oauth2callback/', views.google_calendar_callback, name='google_calendar_callback'),
     path('calendar/outlook/callback/', views.outlook_calendar_callback, name='outlook_calendar_callback'),
+    path('calendar/<str:token>.ics', views.calendar_feed, name='calendar_feed'),
     
     # NEW FEATURES - Chat & Messaging
     path('chat/', views.chat_view, name='chat'),
@@ -52,7 +58,9 @@ urlpatterns = [
     path('chat/task/<int:task_id>/', views.task_chat_view, name='task_chat'),
     path('chat/direct/<int:user_id>/', views.direct_chat_view, name='direct_chat'),
     path('api/messages/send/', views.send_message_api, name='send_message_api'),
+    path('api/messages/search/', views.search_messages_api, name='search_messages_api'),
     path('api/messages/<int:chat_id>/', views.get_messages_api, name='get_messages_api'),
+    path('api/stream/', views.event_stream_view, name='event_stream'),
     
     # NEW FEATURES - Announcements
     path('announcements/', views.announcements_view, name='announcements'),
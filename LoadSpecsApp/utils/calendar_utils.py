@@ -2,9 +2,296 @@
 Calendar integration utilities for Google Calendar and Outlook
 """
 
+import threading
+import time
+from collections import deque
 from datetime import datetime, timedelta
 from django.conf import settings
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+GRAPH_API_URL = 'https://graph.microsoft.com/v1.0'
+
+# Window of the Outlook calendar tracked by delta queries (Graph only supports
+# delta over a calendarView with a fixed start/end)
+OUTLOOK_DELTA_PAST_DAYS = 30
+OUTLOOK_DELTA_FUTURE_DAYS = 365
+
+GOOGLE_TOKEN_URI = 'https://oauth2.googleapis.com/token'
+
+
+def get_event_link(calendar_sync, task):
+    """Return the CalendarEvent linking a task to this calendar, if any"""
+    from LoadSpecsApp.models import CalendarEvent
+    
+    return CalendarEvent.objects.filter(calendar_sync=calendar_sync, task=task).first()
+
+
+def record_event_link(calendar_sync, task, event_id, link=None):
+    """Remember which event a task was pushed to and the due date we sent"""
+    from LoadSpecsApp.models import CalendarEvent
+    
+    if link is None:
+        link = CalendarEvent(calendar_sync=calendar_sync, task=task)
+    link.event_id = event_id
+    link.synced_due_date = task.due_date
+    link.last_synced = timezone.now()
+    link.removed = False
+    link.save()
+    return link
+
+
+def apply_remote_changes(calendar_sync, changes):
+    """
+    Apply event changes pulled from a calendar back onto the linked tasks
+    
+    Each change is a dict with event_id, due_date, deleted and updated keys.
+    Conflict rules:
+    - events we never pushed are ignored
+    - an event deleted in the calendar unlinks the task without touching it
+    - completed tasks are never moved
+    - if the due date changed on both sides, the most recent edit wins
+    
+    Returns the number of tasks whose due date was updated.
+    """
+    from LoadSpecsApp.models import Task
+    
+    event_ids = [change['event_id'] for change in changes]
+    if not event_ids:
+        return 0
+    
+    links = {
+        link.event_id: link
+        for link in calendar_sync.events.filter(event_id__in=event_ids).select_related('task')
+    }
+    
+    applied = 0
+    for change in changes:
+        link = links.get(change['event_id'])
+        if link is None or link.removed:
+            continue
+        
+        if change['deleted']:
+            link.removed = True
+            link.last_synced = timezone.now()
+            link.save(update_fields=['removed', 'last_synced'])
+            continue
+        
+        remote_due = change['due_date']
+        if remote_due is None or remote_due == link.synced_due_date:
+            continue
+        
+        task = link.task
+        if task.status == 'completed':
+            continue
+        
+        local_moved = task.due_date != link.synced_due_date
+        remote_updated = change.get('updated')
+        if local_moved and (remote_updated is None or remote_updated < task.updated_at):
+            # Local edit is newer - the next push overwrites the calendar
+            continue
+        
+        now = timezone.now()
+        Task.objects.filter(pk=task.pk).update(due_date=remote_due, updated_at=now)
+        link.synced_due_date = remote_due
+        link.last_synced = now
+        link.save(update_fields=['synced_due_date', 'last_synced'])
+        applied += 1
+    
+    return applied
+
+
+class TokenRefreshMetrics:
+    """
+    Per-worker counters for OAuth token refreshes
+    
+    Keeps the latest latencies in a bounded window so percentiles stay cheap.
+    """
+    
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.refreshed = 0
+        self.failed = 0
+        self.failures_by_provider = {}
+    
+    def record(self, provider, seconds, success):
+        with self._lock:
+            self._latencies.append(seconds)
+            if success:
+                self.refreshed += 1
+            else:
+                self.failed += 1
+                self.failures_by_provider[provider] = self.failures_by_provider.get(provider, 0) + 1
+    
+    def snapshot(self):
+        """Return current counters and latency percentiles (milliseconds)"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            refreshed, failed = self.refreshed, self.failed
+            failures_by_provider = dict(self.failures_by_provider)
+        
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1)
+        
+        return {
+            'refreshed': refreshed,
+            'failed': failed,
+            'failures_by_provider': failures_by_provider,
+            'latency_p50_ms': percentile(0.50),
+            'latency_p95_ms': percentile(0.95),
+            'latency_max_ms': percentile(1.0),
+        }
+
+
+token_refresh_metrics = TokenRefreshMetrics()
+
+
+class TokenRefreshError(Exception):
+    """Raised when a provider rejects a refresh token request"""
+    
+    def __init__(self, message, revoked=False):
+        super().__init__(message)
+        self.revoked = revoked
+
+
+class CalendarTokenManager:
+    """
+    Refreshes calendar OAuth tokens ahead of token_expiry, off the sync path
+    
+    Refreshed credentials are written back to CalendarSync and kept in a
+    per-worker cache, so calendar services pick up the newest token without
+    a database round-trip or a refresh of their own.
+    """
+    
+    _cache = {}
+    _cache_lock = threading.Lock()
+    
+    def __init__(self, session=None):
+        self.margin = timedelta(seconds=getattr(settings, 'CALENDAR_TOKEN_REFRESH_MARGIN', 600))
+        self._session = session
+    
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+    
+    @classmethod
+    def cache_credentials(cls, calendar_sync):
+        with cls._cache_lock:
+            cls._cache[calendar_sync.pk] = (calendar_sync.access_token, calendar_sync.token_expiry)
+    
+    @classmethod
+    def get_access_token(cls, calendar_sync):
+        """Return the freshest access token known to this worker"""
+        with cls._cache_lock:
+            cached = cls._cache.get(calendar_sync.pk)
+        
+        if cached and cached[1] and (not calendar_sync.token_expiry or cached[1] > calendar_sync.token_expiry):
+            calendar_sync.access_token, calendar_sync.token_expiry = cached
+        return calendar_sync.access_token
+    
+    @staticmethod
+    def has_valid_token(calendar_sync, at=None):
+        """Whether the stored access token can be used without refreshing"""
+        if not calendar_sync.access_token:
+            return False
+        if calendar_sync.token_expiry is None:
+            return True
+        return calendar_sync.token_expiry > (at or timezone.now())
+    
+    def due_for_refresh(self):
+        """Active syncs whose token expires within the refresh margin"""
+        from LoadSpecsApp.models import CalendarSync
+        
+        return CalendarSync.objects.filter(
+            is_active=True,
+            refresh_token__isnull=False,
+            token_expiry__isnull=False,
+            token_expiry__lte=timezone.now() + self.margin
+        ).exclude(refresh_token='')
+    
+    def refresh_due_tokens(self):
+        """
+        Refresh every token close to expiry in one batch
+        
+        All successful refreshes are written back with a single bulk update.
+        Syncs whose refresh token was revoked are deactivated so the sync
+        loop stops trying them until the user reconnects.
+        
+        Returns (refreshed, failed) counts.
+        """
+        from LoadSpecsApp.models import CalendarSync
+        
+        refreshed = []
+        revoked = []
+        failed = 0
+        
+        for calendar_sync in self.due_for_refresh():
+            started = time.monotonic()
+            try:
+                self.refresh(calendar_sync)
+                refreshed.append(calendar_sync)
+                token_refresh_metrics.record(calendar_sync.provider, time.monotonic() - started, True)
+            except Exception as e:
+                failed += 1
+                token_refresh_metrics.record(calendar_sync.provider, time.monotonic() - started, False)
+                print(f"Token refresh failed for {calendar_sync.user_id} ({calendar_sync.provider}): {e}")
+                if isinstance(e, TokenRefreshError) and e.revoked:
+                    calendar_sync.is_active = False
+                    revoked.append(calendar_sync)
+        
+        if refreshed:
+            CalendarSync.objects.bulk_update(refreshed, ['access_token', 'refresh_token', 'token_expiry'])
+            for calendar_sync in refreshed:
+                self.cache_credentials(calendar_sync)
+        if revoked:
+            CalendarSync.objects.bulk_update(revoked, ['is_active'])
+        
+        return len(refreshed), failed
+    
+    def refresh(self, calendar_sync):
+        """Exchange the refresh token for a new access token (not saved)"""
+        if calendar_sync.provider == 'google':
+            url = GOOGLE_TOKEN_URI
+            data = {
+                'client_id': settings.GOOGLE_CALENDAR_CLIENT_ID,
+                'client_secret': settings.GOOGLE_CALENDAR_CLIENT_SECRET,
+            }
+        elif calendar_sync.provider == 'outlook':
+            url = f'{settings.MICROSOFT_AUTHORITY}/oauth2/v2.0/token'
+            data = {
+                'client_id': settings.MICROSOFT_CLIENT_ID,
+                'client_secret': settings.MICROSOFT_CLIENT_SECRET,
+                'scope': ' '.join(settings.MICROSOFT_SCOPES + ['offline_access']),
+            }
+        else:
+            raise TokenRefreshError(f"Unknown provider {calendar_sync.provider}")
+        
+        data.update({
+            'grant_type': 'refresh_token',
+            'refresh_token': calendar_sync.refresh_token,
+        })
+        
+        response = self.session.post(url, data=data, timeout=10)
+        payload = response.json() if response.content else {}
+        
+        if response.status_code != 200 or 'access_token' not in payload:
+            raise TokenRefreshError(
+                payload.get('error_description') or payload.get('error') or response.text,
+                revoked=payload.get('error') == 'invalid_grant'
+            )
+        
+        calendar_sync.access_token = payload['access_token']
+        # Providers may rotate the refresh token
+        calendar_sync.refresh_token = payload.get('refresh_token') or calendar_sync.refresh_token
+        calendar_sync.token_expiry = timezone.now() + timedelta(seconds=int(payload.get('expires_in', 3600)))
+        return calendar_sync
 
 
 class GoogleCalendarService:
@@ -23,11 +310,12 @@ class GoogleCalendarService:
             from google.oauth2.credentials import Credentials
             from googleapiclient.discovery import build
             
-            # Create credentials from stored tokens
+            # Create credentials from the freshest stored token. No refresh
+            # token is handed over: refreshing is CalendarTokenManager's job,
+            # never the sync's
             creds = Credentials(
-                token=self.calendar_sync.access_token,
-                refresh_token=self.calendar_sync.refresh_token,
-                token_uri='https://oauth2.googleapis.com/token',
+                token=CalendarTokenManager.get_access_token(self.calendar_sync),
+                token_uri=GOOGLE_TOKEN_URI,
                 client_id=settings.GOOGLE_CALENDAR_CLIENT_ID,
                 client_secret=settings.GOOGLE_CALENDAR_CLIENT_SECRET
             )
@@ -39,13 +327,17 @@ class GoogleCalendarService:
             print(f"Failed to initialize Google Calendar service: {e}")
             self.service = None
     
-    def create_or_update_event(self, task):
+    def create_or_update_event(self, task, link=None):
         """Create or update a calendar event for a task"""
         if not self.service:
             return None
         
+        link = link or get_event_link(self.calendar_sync, task)
+        if link and not link.needs_push(task):
+            return link.event_id
+        
         try:
-            # Create event data
+            # Create event data (all-day events end on the following day)
             event = {
                 'summary': f'Task: {task.title}',
                 'description': task.description or '',
@@ -54,7 +346,7 @@ class GoogleCalendarService:
                     'timeZone': 'UTC',
                 },
                 'end': {
-                    'date': task.due_date.isoformat(),
+                    'date': (task.due_date + timedelta(days=1)).isoformat(),
                     'timeZone': 'UTC',
                 },
                 'reminders': {
@@ -66,19 +358,84 @@ class GoogleCalendarService:
                 },
             }
             
-            # Check if event already exists (using task ID in description or metadata)
-            # For simplicity, we'll create a new event
-            event_result = self.service.events().insert(
-                calendarId='primary',
-                body=event
-            ).execute()
+            if link and not link.removed:
+                event_result = self.service.events().update(
+                    calendarId='primary',
+                    eventId=link.event_id,
+                    body=event
+                ).execute()
+            else:
+                event_result = self.service.events().insert(
+                    calendarId='primary',
+                    body=event
+                ).execute()
             
+            record_event_link(self.calendar_sync, task, event_result.get('id'), link)
             return event_result.get('id')
         
         except Exception as e:
             print(f"Error creating Google Calendar event: {e}")
             return None
     
+    def pull_changes(self):
+        """
+        Fetch events changed since the last pull using the stored syncToken
+        
+        The first pull (or one after the token expired) lists the whole
+        calendar once to obtain a token; later pulls only return changes.
+        Returns a list of change dicts, or None if the pull failed.
+        """
+        if not self.service:
+            return None
+        
+        from googleapiclient.errors import HttpError
+        
+        changes = []
+        page_token = None
+        params = {'calendarId': 'primary', 'showDeleted': True, 'singleEvents': True}
+        if self.calendar_sync.sync_token:
+            params['syncToken'] = self.calendar_sync.sync_token
+        
+        try:
+            while True:
+                response = self.service.events().list(pageToken=page_token, **params).execute()
+                changes.extend(self._parse_event(event) for event in response.get('items', []))
+                
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    self.calendar_sync.sync_token = response.get('nextSyncToken')
+                    return changes
+        
+        except HttpError as e:
+            if e.resp.status == 410 and 'syncToken' in params:
+                # Token invalidated by Google - start over with a full sync
+                self.calendar_sync.reset_sync_state()
+                return self.pull_changes()
+            print(f"Error pulling Google Calendar changes: {e}")
+            return None
+        
+        except Exception as e:
+            print(f"Error pulling Google Calendar changes: {e}")
+            return None
+    
+    @staticmethod
+    def _parse_event(event):
+        """Normalize a Google event resource into a change dict"""
+        start = event.get('start', {})
+        if 'date' in start:
+            due_date = parse_date(start['date'])
+        elif 'dateTime' in start:
+            due_date = parse_datetime(start['dateTime']).date()
+        else:
+            due_date = None
+        
+        return {
+            'event_id': event['id'],
+            'due_date': due_date,
+            'deleted': event.get('status') == 'cancelled',
+            'updated': parse_datetime(event['updated']) if event.get('updated') else None,
+        }
+    
     def delete_event(self, event_id):
         """Delete a calendar event"""
         if not self.service:
@@ -103,7 +460,7 @@ class OutlookCalendarService:
     
     def __init__(self, calendar_sync):
         self.calendar_sync = calendar_sync
-        self.access_token = calendar_sync.access_token
+        self.access_token = CalendarTokenManager.get_access_token(calendar_sync)
     
     def _get_headers(self):
         """Get authorization headers"""
@@ -112,8 +469,12 @@ class OutlookCalendarService:
             'Content-Type': 'application/json'
         }
     
-    def create_or_update_event(self, task):
+    def create_or_update_event(self, task, link=None):
         """Create or update an Outlook calendar event for a task"""
+        link = link or get_event_link(self.calendar_sync, task)
+        if link and not link.needs_push(task):
+            return link.event_id
+        
         try:
             import requests
             
@@ -135,15 +496,26 @@ class OutlookCalendarService:
                 'reminderMinutesBeforeStart': 1440  # 24 hours
             }
             
-            # Create event via Microsoft Graph API
-            response = requests.post(
-                'https://graph.microsoft.com/v1.0/me/events',
-                headers=self._get_headers(),
-                json=event
-            )
+            # Create or update event via Microsoft Graph API
+            if link and not link.removed:
+                response = requests.patch(
+                    f'{GRAPH_API_URL}/me/events/{link.event_id}',
+                    headers=self._get_headers(),
+                    json=event
+                )
+                expected_status = 200
+            else:
+                response = requests.post(
+                    f'{GRAPH_API_URL}/me/events',
+                    headers=self._get_headers(),
+                    json=event
+                )
+                expected_status = 201
             
-            if response.status_code == 201:
-                return response.json().get('id')
+            if response.status_code == expected_status:
+                event_id = response.json().get('id')
+                record_event_link(self.calendar_sync, task, event_id, link)
+                return event_id
             else:
                 print(f"Outlook API error: {response.text}")
                 return None
@@ -152,13 +524,71 @@ class OutlookCalendarService:
             print(f"Error creating Outlook event: {e}")
             return None
     
+    def pull_changes(self):
+        """
+        Fetch events changed since the last pull by following the stored deltaLink
+        
+        Without a deltaLink a new delta round is started over the tracked
+        calendarView window. Returns a list of change dicts, or None if the
+        pull failed.
+        """
+        try:
+            import requests
+            
+            url = self.calendar_sync.delta_link
+            if not url:
+                now = timezone.now()
+                start = (now - timedelta(days=OUTLOOK_DELTA_PAST_DAYS)).strftime('%Y-%m-%dT%H:%M:%SZ')
+                end = (now + timedelta(days=OUTLOOK_DELTA_FUTURE_DAYS)).strftime('%Y-%m-%dT%H:%M:%SZ')
+                url = f'{GRAPH_API_URL}/me/calendarView/delta?startDateTime={start}&endDateTime={end}'
+            
+            changes = []
+            while url:
+                response = requests.get(url, headers=self._get_headers())
+                
+                if response.status_code == 410 and self.calendar_sync.delta_link:
+                    # Delta token expired - start a new round
+                    self.calendar_sync.reset_sync_state()
+                    return self.pull_changes()
+                
+                if response.status_code != 200:
+                    print(f"Outlook API error: {response.text}")
+                    return None
+                
+                data = response.json()
+                changes.extend(self._parse_event(event) for event in data.get('value', []))
+                
+                url = data.get('@odata.nextLink')
+                if not url:
+                    self.calendar_sync.delta_link = data.get('@odata.deltaLink')
+            
+            return changes
+        
+        except Exception as e:
+            print(f"Error pulling Outlook changes: {e}")
+            return None
+    
+    @staticmethod
+    def _parse_event(event):
+        """Normalize a Graph event resource into a change dict"""
+        start = event.get('start') or {}
+        modified = event.get('lastModifiedDateTime')
+        
+        return {
+            'event_id': event['id'],
+            # Graph dateTimes carry 7 fractional digits; only the date matters here
+            'due_date': parse_date(start['dateTime'][:10]) if start.get('dateTime') else None,
+            'deleted': '@removed' in event,
+            'updated': parse_datetime(modified) if modified else None,
+        }
+    
     def delete_event(self, event_id):
         """Delete an Outlook calendar event"""
         try:
             import requests
             
             response = requests.delete(
-                f'https://graph.microsoft.com/v1.0/me/events/{event_id}',
+                f'{GRAPH_API_URL}/me/events/{event_id}',
                 headers=self._get_headers()
             )
             
@@ -182,7 +612,7 @@ def get_oauth_url(provider='google'):
                     "client_id": settings.GOOGLE_CALENDAR_CLIENT_ID,
                     "client_secret": settings.GOOGLE_CALENDAR_CLIENT_SECRET,
                     "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                    "token_uri": "https://oauth2.googleapis.com/token",
+                    "token_uri": GOOGLE_TOKEN_URI,
                     "redirect_uris": [settings.GOOGLE_CALENDAR_REDIRECT_URI]
                 }
             },
@@ -0,0 +1,58 @@
+"""
+Chart rendering without pyplot's global state
+
+Every chart is drawn on its own matplotlib Figure with the Agg canvas, so
+concurrent requests in a threaded server never share pyplot's current
+figure. Rendered PNGs are cached by a hash of the series they plot; views
+put that hash in the image URL and the ETag, so browsers only fetch again
+when the numbers change and each distinct series is rendered once.
+"""
+
+import hashlib
+import io
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from matplotlib.figure import Figure
+
+
+MOOD_LABELS = ['Happy', 'Neutral', 'Stressed', 'Burnout']
+MOOD_COLORS = ['#4CAF50', '#FFC107', '#FF9800', '#F44336']
+
+
+def mood_series(mood_counts):
+    """Chart series for {'happy': n, 'neutral': n, 'stressed': n, 'burnout': n}"""
+    return {
+        'title': 'Mood Distribution (Last 30 Days)',
+        'labels': MOOD_LABELS,
+        'counts': [mood_counts.get(label.lower(), 0) for label in MOOD_LABELS],
+        'colors': MOOD_COLORS,
+    }
+
+
+def series_key(series):
+    """Short hash identifying a series and so its rendered image"""
+    return hashlib.sha256(json.dumps(series, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def render_pie_chart(series):
+    """PNG bytes of a pie chart of series"""
+    figure = Figure(figsize=(8, 6))
+    axes = figure.subplots()
+    axes.pie(series['counts'], labels=series['labels'], colors=series['colors'], autopct='%1.1f%%', startangle=90)
+    axes.set_title(series['title'])
+    axes.axis('equal')
+    
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png', bbox_inches='tight')
+    return buffer.getvalue()
+
+
+def pie_chart_png(series):
+    """Cached render_pie_chart(); returns (key, png)"""
+    key = series_key(series)
+    png = cache.get_or_set(
+        f'chart:pie:{key}', lambda: render_pie_chart(series), getattr(settings, 'CHART_CACHE_TTL', 86400)
+    )
+    return key, png
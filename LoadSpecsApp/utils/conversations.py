@@ -0,0 +1,334 @@
+"""
+Conversation keys, read cursors and unread counts
+
+A conversation is named by its chat stream key: 'team:<id>', 'task:<id>'
+or 'dm:<other user id>'. Read state is one ReadCursor row per user and
+conversation holding the last message id they have seen, so marking a
+conversation read is a single UPDATE (or INSERT the first time) instead
+of flipping is_read on every message.
+"""
+
+import heapq
+from itertools import islice
+from operator import attrgetter, itemgetter
+
+from django.db.models import CharField, Count, Max, Q, Subquery, Value
+
+
+# Messages per history page, and the most a client may ask for
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Per-conversation unread counts combined into one UNION query
+UNREAD_BATCH_SIZE = 100
+
+
+def conversation_key(message):
+    """Summary key for a message's conversation; DMs list both participants"""
+    if message.team_id:
+        return f'team:{message.team_id}'
+    if message.task_id:
+        return f'task:{message.task_id}'
+    if message.recipient_id:
+        low, high = sorted([message.sender_id, message.recipient_id])
+        return f'dm:{low}:{high}'
+    return None
+
+
+def _participants(message):
+    if message.team_id or message.task_id:
+        return {'team_id': message.team_id, 'task_id': message.task_id}
+    low, high = sorted([message.sender_id, message.recipient_id])
+    return {'user_low_id': low, 'user_high_id': high}
+
+
+def record_messages(messages):
+    """
+    Fold newly saved messages into their Conversation summaries
+    
+    Call in the same transaction that saved them. One INSERT covers new
+    conversations; existing ones get one conditional UPDATE each, which
+    only moves a summary forward in time, so out-of-order batches from
+    several workers cannot roll it back.
+    """
+    from LoadSpecsApp.models import Conversation
+    
+    latest = {}
+    for message in messages:
+        key = conversation_key(message)
+        if key is None:
+            continue
+        current = latest.get(key)
+        if current is None or (message.timestamp, message.id or 0) >= (current.timestamp, current.id or 0):
+            latest[key] = message
+    
+    if not latest:
+        return 0
+    
+    summaries = {
+        key: {
+            'last_message_id': message.id or 0,
+            'last_sender_id': message.sender_id,
+            'last_preview': message.content[:200],
+            'last_timestamp': message.timestamp,
+        }
+        for key, message in latest.items()
+    }
+    
+    Conversation.objects.bulk_create([
+        Conversation(key=key, **_participants(latest[key]), **summary)
+        for key, summary in summaries.items()
+    ], ignore_conflicts=True)
+    
+    for key, summary in summaries.items():
+        Conversation.objects.filter(key=key, last_timestamp__lt=summary['last_timestamp']).update(**summary)
+    return len(summaries)
+
+
+def conversation_filter(user_id, key):
+    """Q selecting the messages of a conversation, or None for a bad key"""
+    kind, _, object_id = str(key).partition(':')
+    if not object_id.isdigit():
+        return None
+    
+    object_id = int(object_id)
+    if kind == 'team':
+        return Q(team_id=object_id)
+    if kind == 'task':
+        return Q(task_id=object_id)
+    if kind == 'dm':
+        return (Q(sender_id=user_id, recipient_id=object_id) |
+                Q(sender_id=object_id, recipient_id=user_id))
+    return None
+
+
+def storage_key(user_id, key):
+    """Conversation / MessageArchive key for a stream key"""
+    kind, _, object_id = str(key).partition(':')
+    if kind == 'dm' and object_id.isdigit():
+        low, high = sorted([user_id, int(object_id)])
+        return f'dm:{low}:{high}'
+    return key
+
+
+def _branches(history):
+    """
+    A history's OR branches, each one index range
+    
+    Direct messages are an OR of both directions; read together they are
+    sorted in a temporary B-tree, so callers read each branch in index
+    order with its own limit and merge them.
+    """
+    if history.connector == Q.OR and not history.negated:
+        return [child if isinstance(child, Q) else Q(child) for child in history.children]
+    return [history]
+
+
+def _merge_branches(branches, key, ascending, limit):
+    if len(branches) == 1:
+        return branches[0][:limit]
+    return list(islice(heapq.merge(*branches, key=key, reverse=not ascending), limit))
+
+
+def _hot_rows(history, ascending=False, cursor_id=None, limit=PAGE_SIZE):
+    from LoadSpecsApp.models import Message
+    
+    bounds = Q()
+    if cursor_id is not None:
+        cursor = Subquery(Message.objects.filter(id=cursor_id).order_by().values('timestamp')[:1])
+        # The plain range lets the index seek to the cursor; the OR only
+        # settles ties on its timestamp
+        if ascending:
+            bounds = Q(timestamp__gte=cursor) & (Q(timestamp__gt=cursor) | Q(timestamp=cursor, id__gt=cursor_id))
+        else:
+            bounds = Q(timestamp__lte=cursor) & (Q(timestamp__lt=cursor) | Q(timestamp=cursor, id__lt=cursor_id))
+    
+    ordering = ('timestamp', 'id') if ascending else ('-timestamp', '-id')
+    branches = [
+        list(
+            Message.objects.filter(branch, bounds).order_by(*ordering)
+            .values('id', 'content', 'timestamp', 'sender_id', 'sender__username')[:limit]
+        )
+        for branch in _branches(history)
+    ]
+    return _merge_branches(branches, itemgetter('timestamp', 'id'), ascending, limit)
+
+
+def message_page(history, before_id=None, after_id=None, limit=PAGE_SIZE, archive_key=None):
+    """
+    One page of a conversation as dicts, oldest first
+    
+    Keyset pagination on (timestamp, id): before_id pages back into older
+    history, after_id forward from a message, neither gives the newest
+    page. Each page is one query joined to the sender for the username.
+    With archive_key, pages that run past the hot table continue into
+    the archived day-chunks. Returns (rows, has_more); has_more is True
+    when the page was cut off.
+    """
+    from LoadSpecsApp.utils.message_archive import archived_page, archived_position
+    
+    ascending = after_id is not None and before_id is None
+    cursor_id = after_id if ascending else before_id
+    rows = _hot_rows(history, ascending, cursor_id, limit + 1)
+    
+    if archive_key and len(rows) <= limit:
+        # Archived messages are all older than the hot ones, so only an
+        # archived cursor needs locating
+        position = archived_position(archive_key, cursor_id) if cursor_id is not None and not rows else None
+        if not ascending:
+            rows += archived_page(archive_key, before=position, limit=limit + 1 - len(rows))
+        elif position is not None:
+            rows = archived_page(archive_key, after=position, limit=limit + 1)
+            if len(rows) <= limit:
+                rows += _hot_rows(history, ascending=True, limit=limit + 1 - len(rows))
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not ascending:
+        rows.reverse()
+    return rows, has_more
+
+
+def recent_messages(history, limit=PAGE_SIZE, archive_key=None):
+    """
+    The newest page of a conversation as Message objects, oldest first
+    
+    Senders are loaded in the same query for templates; quiet rooms whose
+    history is mostly archived are topped up from the archive. Returns
+    (messages, has_more); older pages come from message_page().
+    """
+    from LoadSpecsApp.models import Message, User
+    from LoadSpecsApp.utils.message_archive import archived_page
+    
+    branches = [
+        list(Message.objects.filter(branch).select_related('sender').order_by('-timestamp', '-id')[:limit + 1])
+        for branch in _branches(history)
+    ]
+    messages = _merge_branches(branches, attrgetter('timestamp', 'id'), False, limit + 1)
+    
+    if archive_key and len(messages) <= limit:
+        rows = archived_page(archive_key, limit=limit + 1 - len(messages))
+        senders = User.objects.in_bulk({row['sender_id'] for row in rows})
+        for row in rows:
+            message = Message(id=row['id'], sender_id=row['sender_id'], content=row['content'], timestamp=row['timestamp'])
+            if row['sender_id'] in senders:
+                message.sender = senders[row['sender_id']]
+            messages.append(message)
+    
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    messages.reverse()
+    return messages, has_more
+
+
+def latest_message_id(history):
+    from LoadSpecsApp.models import Message
+    
+    return Message.objects.filter(history).aggregate(latest=Max('id'))['latest'] or 0
+
+
+def advance_read_cursor(user_id, key, message_id):
+    """Move the user's cursor forward to message_id; never moves it back"""
+    from django.utils import timezone
+    from LoadSpecsApp.models import ReadCursor
+    
+    updated = ReadCursor.objects.filter(
+        user_id=user_id, conversation=key, last_read_message_id__lt=message_id
+    ).update(last_read_message_id=message_id, updated_at=timezone.now())
+    
+    if not updated:
+        # First read of this conversation; a conflict means the existing
+        # cursor is already at or past message_id
+        ReadCursor.objects.bulk_create(
+            [ReadCursor(user_id=user_id, conversation=key, last_read_message_id=message_id)],
+            ignore_conflicts=True
+        )
+    return message_id
+
+
+def mark_conversation_read(user, key, message_id=None):
+    """Advance the cursor to message_id, by default the conversation's newest"""
+    if message_id is None:
+        history = conversation_filter(user.id, key)
+        if history is None:
+            return 0
+        message_id = latest_message_id(history)
+    return advance_read_cursor(user.id, key, message_id)
+
+
+def inbox(user, rooms=None, unread=None, limit=PAGE_SIZE):
+    """
+    The user's most recently active conversations, newest first
+    
+    One query over Conversation summaries joined to their room or
+    participants. Each row gets .stream, .unread and .title set for
+    templates, plus .other_user for direct messages. Unread counts come
+    from the read cursors unless the caller already has them from
+    unread_counts().
+    """
+    from LoadSpecsApp.models import Conversation
+    from LoadSpecsApp.utils.membership import get_accessible_rooms
+    
+    rooms = rooms or get_accessible_rooms(user)
+    conversations = list(
+        Conversation.objects.filter(
+            Q(team_id__in=rooms['teams']) | Q(task_id__in=rooms['tasks']) |
+            Q(user_low=user) | Q(user_high=user)
+        ).select_related('team', 'task', 'user_low', 'user_high', 'last_sender')
+        .order_by('-last_timestamp')[:limit]
+    )
+    
+    if unread is None:
+        unread = unread_counts(user, rooms)
+    for conversation in conversations:
+        conversation.stream = conversation.stream_for(user)
+        conversation.unread = unread.get(conversation.stream, 0)
+        if conversation.team_id:
+            conversation.title = conversation.team.team_name
+        elif conversation.task_id:
+            conversation.title = conversation.task.title
+        else:
+            conversation.other_user = conversation.other_participant(user)
+            conversation.title = conversation.other_user.username
+    return conversations
+
+
+def unread_counts(user, rooms=None):
+    """
+    Unread messages per conversation key
+    
+    Covers the user's team and task rooms (pass get_accessible_rooms() to
+    avoid re-reading it) and every direct conversation they take part in.
+    Conversations with nothing unread are left out. Each conversation is
+    counted on its own as an index range above the user's ReadCursor for
+    it, so only unread rows are read however long the history is; the
+    counts are UNIONed UNREAD_BATCH_SIZE at a time.
+    """
+    from LoadSpecsApp.models import Conversation, Message, ReadCursor
+    from LoadSpecsApp.utils.membership import get_accessible_rooms
+    
+    rooms = rooms or get_accessible_rooms(user)
+    cursors = dict(ReadCursor.objects.filter(user=user).values_list('conversation', 'last_read_message_id'))
+    
+    histories = [(f'team:{team_id}', Q(team_id=team_id)) for team_id in sorted(rooms['teams'])]
+    histories += [(f'task:{task_id}', Q(task_id=task_id)) for task_id in sorted(rooms['tasks'])]
+    for low, high in Conversation.objects.filter(Q(user_low=user) | Q(user_high=user)).values_list(
+        'user_low_id', 'user_high_id'
+    ).order_by():
+        other_id = high if low == user.id else low
+        histories.append((f'dm:{other_id}', Q(sender_id=other_id, recipient_id=user.id)))
+    
+    counts = [
+        Message.objects.filter(history, id__gt=cursors.get(key, 0)).exclude(sender_id=user.id)
+        .annotate(conversation=Value(key, output_field=CharField()))
+        .values('conversation').annotate(unread=Count('id')).order_by()
+        for key, history in histories
+    ]
+    
+    unread = {}
+    for start in range(0, len(counts), UNREAD_BATCH_SIZE):
+        batch = counts[start:start + UNREAD_BATCH_SIZE]
+        for row in batch[0].union(*batch[1:], all=True):
+            if row['unread']:
+                unread[row['conversation']] = row['unread']
+    return unread
@@ -0,0 +1,138 @@
+"""
+Spreadsheet exports of a team lead's tasks, mood check-ins and alerts
+
+Rows come straight from values_list().iterator(), so neither format ever
+holds more than one chunk of rows in memory:
+
+- CSV is written in batches of about CSV_BATCH_BYTES and streamed as it
+  is produced.
+- XLSX uses openpyxl's write-only workbook, which spools rows to a
+  temporary file; the finished file is then streamed from disk. XLSX
+  needs openpyxl, CSV does not.
+"""
+
+import csv
+import io
+import tempfile
+from datetime import datetime
+
+from django.utils import timezone
+
+try:
+    from openpyxl import Workbook
+except ImportError:
+    Workbook = None
+
+
+CHUNK_SIZE = 2000
+
+CSV_BATCH_BYTES = 64 * 1024
+
+FILE_CHUNK_BYTES = 64 * 1024
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Spreadsheet apps run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _task_rows(team_lead, teams):
+    from LoadSpecsApp.models import Task
+    
+    return Task.objects.filter(team__in=teams).order_by('id').values_list(
+        'id', 'team__team_name', 'title', 'assigned_to__user__username',
+        'status', 'priority', 'due_date', 'created_at', 'updated_at'
+    )
+
+
+def _mood_rows(team_lead, teams):
+    from LoadSpecsApp.models import MoodCheckin
+    
+    return MoodCheckin.objects.filter(team__in=teams).order_by('id').values_list(
+        'id', 'team__team_name', 'employee__user__username', 'mood', 'notes', 'timestamp'
+    )
+
+
+def _alert_rows(team_lead, teams):
+    from LoadSpecsApp.models import BurnoutAlert
+    
+    return BurnoutAlert.objects.filter(team_lead=team_lead, team__in=teams).order_by('id').values_list(
+        'id', 'team__team_name', 'employee__user__username', 'severity',
+        'alert_message', 'is_acknowledged', 'created_at', 'acknowledged_at'
+    )
+
+
+# dataset -> (sheet title, column headers, rows(team_lead, teams))
+DATASETS = {
+    'tasks': ('Tasks', ['ID', 'Team', 'Title', 'Assigned To', 'Status', 'Priority', 'Due Date', 'Created', 'Updated'],
+              _task_rows),
+    'moods': ('Mood Check-ins', ['ID', 'Team', 'Employee', 'Mood', 'Notes', 'Timestamp'],
+              _mood_rows),
+    'alerts': ('Burnout Alerts', ['ID', 'Team', 'Employee', 'Severity', 'Message', 'Acknowledged', 'Created',
+                                  'Acknowledged At'],
+               _alert_rows),
+}
+
+
+def cell(value):
+    """A database value as a spreadsheet cell"""
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        # Excel has no time zones; show local time
+        return timezone.localtime(value).replace(tzinfo=None, microsecond=0)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(header, rows):
+    """Yield a CSV document in batches of about CSV_BATCH_BYTES"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # The BOM makes Excel read the file as UTF-8
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    
+    for row in rows:
+        writer.writerow([cell(value) for value in row])
+        if buffer.tell() >= CSV_BATCH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    yield buffer.getvalue()
+
+
+def stream_xlsx(title, header, rows):
+    """Yield an XLSX workbook with one sheet, FILE_CHUNK_BYTES at a time"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(header)
+    for row in rows:
+        sheet.append([cell(value) for value in row])
+    
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while chunk := output.read(FILE_CHUNK_BYTES):
+            yield chunk
+
+
+def format_available(file_format):
+    return file_format == 'csv' or (file_format == 'xlsx' and Workbook is not None)
+
+
+def stream_export(dataset, file_format, team_lead, teams):
+    """Chunks of the export of dataset for team_lead's teams in file_format"""
+    title, header, build_rows = DATASETS[dataset]
+    rows = build_rows(team_lead, teams).iterator(chunk_size=CHUNK_SIZE)
+    
+    if file_format == 'xlsx':
+        return stream_xlsx(title, header, rows)
+    return stream_csv(header, rows)
+
+
+def export_filename(dataset, file_format):
+    return f'LoadSpecs_{dataset}_{timezone.localdate().strftime("%Y%m%d")}.{file_format}'
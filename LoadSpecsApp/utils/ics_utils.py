@@ -0,0 +1,82 @@
+"""
+iCalendar (RFC 5545) helpers for the task subscription feed
+"""
+
+from datetime import timedelta, timezone as dt_timezone
+
+
+def escape_text(value):
+    """Escape a TEXT property value"""
+    return (
+        (value or '')
+        .replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+
+def fold_line(line):
+    """Fold a content line to 75 octets, continuation lines start with a space"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # Never split inside a multi-byte UTF-8 sequence
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        limit = 74  # leave room for the leading space
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def format_utc(value):
+    """Format an aware datetime as a UTC DATE-TIME"""
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def task_event(task_id, title, description, due_date, priority, status, updated_at, domain):
+    """Return the VEVENT for one task as a string"""
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:task-{task_id}@{domain}',
+        f'DTSTAMP:{format_utc(updated_at)}',
+        f'LAST-MODIFIED:{format_utc(updated_at)}',
+        f'DTSTART;VALUE=DATE:{due_date.strftime("%Y%m%d")}',
+        f'DTEND;VALUE=DATE:{(due_date + timedelta(days=1)).strftime("%Y%m%d")}',
+        f'SUMMARY:{escape_text("Task: " + title)}',
+        f'DESCRIPTION:{escape_text(description)}',
+        f'CATEGORIES:{escape_text(priority.upper())} PRIORITY',
+        f'STATUS:{"IN-PROCESS" if status == "in_progress" else "NEEDS-ACTION"}',
+        'END:VEVENT',
+    ]
+    return ''.join(fold_line(line) for line in lines)
+
+
+def stream_calendar(rows, name, domain):
+    """
+    Yield an iCalendar document chunk by chunk
+    
+    rows is an iterable of (id, title, description, due_date, priority,
+    status, updated_at) tuples, so a queryset iterator can be passed straight
+    through without loading every task in memory.
+    """
+    yield ''.join(fold_line(line) for line in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//LoadSpecs//Task Feed//EN',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape_text(name)}',
+    ])
+    
+    for row in rows:
+        yield task_event(*row, domain=domain)
+    
+    yield 'END:VCALENDAR\r\n'
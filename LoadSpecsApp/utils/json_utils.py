@@ -0,0 +1,27 @@
+"""
+JSON encoding helpers for hot paths (chat frames, notifications)
+
+Uses orjson when it is installed and falls back to the standard library.
+"""
+
+try:
+    import orjson
+    
+    def dumps(value):
+        """Serialize to a JSON string"""
+        return orjson.dumps(value).decode('utf-8')
+    
+    def loads(value):
+        """Parse a JSON string or bytes"""
+        return orjson.loads(value)
+
+except ImportError:
+    import json
+    
+    def dumps(value):
+        """Serialize to a JSON string"""
+        return json.dumps(value, separators=(',', ':'))
+    
+    def loads(value):
+        """Parse a JSON string or bytes"""
+        return json.loads(value)
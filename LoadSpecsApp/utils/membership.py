@@ -0,0 +1,65 @@
+"""
+Cached chat room membership
+
+Each user's accessible team and task ids are kept as sets in the cache so
+WebSocket connects and chat views can authorize with one cache read and a
+set lookup. Entries are invalidated by the signals in LoadSpecsApp.signals
+whenever someone joins a team or a task is (re)assigned. Invalidation only
+reaches other processes through a shared cache backend; otherwise their
+entries live until CHAT_MEMBERSHIP_CACHE_TTL runs out.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _cache_key(user_id):
+    return f'chat_rooms:{user_id}'
+
+
+def _load_rooms(user):
+    from LoadSpecsApp.models import Task, Team
+    
+    teams = set()
+    tasks = set()
+    
+    if user.is_employee:
+        teams = set(Team.objects.filter(employees__user=user).values_list('id', flat=True))
+        tasks = set(Task.objects.filter(assigned_to__user=user).values_list('id', flat=True))
+    elif user.is_team_lead:
+        teams = set(Team.objects.filter(team_leads__user=user).values_list('id', flat=True))
+        tasks = set(Task.objects.filter(team_id__in=teams).values_list('id', flat=True))
+    
+    return {'teams': frozenset(teams), 'tasks': frozenset(tasks)}
+
+
+def get_accessible_rooms(user):
+    """Return {'teams': ids, 'tasks': ids} the user may chat in"""
+    key = _cache_key(user.id)
+    rooms = cache.get(key)
+    if rooms is None:
+        rooms = _load_rooms(user)
+        cache.set(key, rooms, getattr(settings, 'CHAT_MEMBERSHIP_CACHE_TTL', 5))
+    return rooms
+
+
+async def aget_accessible_rooms(user):
+    """Async variant for consumers"""
+    from channels.db import database_sync_to_async
+    
+    return await database_sync_to_async(get_accessible_rooms)(user)
+
+
+def can_access_team(user, team_id):
+    return int(team_id) in get_accessible_rooms(user)['teams']
+
+
+def can_access_task(user, task_id):
+    return int(task_id) in get_accessible_rooms(user)['tasks']
+
+
+def invalidate_rooms(user_ids):
+    """Drop cached memberships so they are rebuilt on next access"""
+    keys = [_cache_key(user_id) for user_id in set(user_ids) if user_id]
+    if keys:
+        cache.delete_many(keys)
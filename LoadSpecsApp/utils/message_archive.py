@@ -0,0 +1,180 @@
+"""
+Cold storage for old chat messages
+
+Messages older than CHAT_ARCHIVE_AFTER_DAYS are moved out of the Message
+table into MessageArchive rows: one zlib-compressed JSON chunk per
+conversation per UTC day. Whole days are archived oldest first, so every
+archived message is older than every message still in the hot table and
+history pages can simply continue into the archive once the hot rows run
+out. Reads decompress one day-chunk at a time and stop as soon as a page
+is full.
+"""
+
+import zlib
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from LoadSpecsApp.utils import json_utils
+
+
+ARCHIVED_FIELDS = ('id', 'sender_id', 'recipient_id', 'team_id', 'task_id', 'content', 'timestamp', 'is_read')
+
+# Ids per DELETE statement when clearing archived rows
+DELETE_BATCH = 500
+
+
+def pack(rows):
+    return zlib.compress(json_utils.dumps(rows).encode('utf-8'))
+
+
+def unpack(data):
+    rows = json_utils.loads(zlib.decompress(bytes(data)))
+    for row in rows:
+        row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+    return rows
+
+
+def _archive_row(message):
+    row = {field: getattr(message, field) for field in ARCHIVED_FIELDS}
+    row['timestamp'] = message.timestamp.isoformat()
+    return row
+
+
+def archive_day(start):
+    """Archive every message sent in the UTC day beginning at start"""
+    from LoadSpecsApp.models import Message, MessageArchive
+    from LoadSpecsApp.utils.conversations import conversation_key
+    
+    end = start + timedelta(days=1)
+    by_conversation = defaultdict(list)
+    for message in Message.objects.filter(timestamp__gte=start, timestamp__lt=end).order_by('timestamp', 'id'):
+        key = conversation_key(message)
+        if key is not None:
+            by_conversation[key].append(_archive_row(message))
+    
+    archived = 0
+    with transaction.atomic():
+        for key, rows in by_conversation.items():
+            chunk = MessageArchive.objects.select_for_update().filter(conversation=key, day=start.date()).first()
+            if chunk is not None:
+                # Re-run after a partial failure: merge instead of duplicating
+                known = {row['id'] for row in rows}
+                rows = sorted(
+                    [dict(row, timestamp=row['timestamp'].isoformat()) for row in unpack(chunk.data)
+                     if row['id'] not in known] + rows,
+                    key=lambda row: (row['timestamp'], row['id'])
+                )
+            else:
+                chunk = MessageArchive(conversation=key, day=start.date())
+            
+            chunk.first_message_id = min(row['id'] for row in rows)
+            chunk.last_message_id = max(row['id'] for row in rows)
+            chunk.first_timestamp = datetime.fromisoformat(rows[0]['timestamp'])
+            chunk.last_timestamp = datetime.fromisoformat(rows[-1]['timestamp'])
+            chunk.message_count = len(rows)
+            chunk.data = pack(rows)
+            chunk.save()
+            
+            ids = [row['id'] for row in rows]
+            for i in range(0, len(ids), DELETE_BATCH):
+                Message.objects.filter(id__in=ids[i:i + DELETE_BATCH]).delete()
+            archived += len(by_conversation[key])
+    return archived
+
+
+def archive_messages(after_days=None, max_days=None):
+    """
+    Move whole days older than after_days into the archive, oldest first
+    
+    Processes at most max_days days per call so a first run on a large
+    table can be spread over several scheduled runs. Returns the number of
+    messages archived.
+    """
+    from LoadSpecsApp.models import Message
+    
+    after_days = after_days or getattr(settings, 'CHAT_ARCHIVE_AFTER_DAYS', 90)
+    cutoff = timezone.now().astimezone(dt_timezone.utc) - timedelta(days=after_days)
+    cutoff = datetime.combine(cutoff.date(), time.min, tzinfo=dt_timezone.utc)
+    
+    archived = 0
+    days = 0
+    start = None
+    while max_days is None or days < max_days:
+        pending = Message.objects.filter(timestamp__lt=cutoff)
+        if start is not None:
+            # Messages outside any conversation stay behind; move past them
+            pending = pending.filter(timestamp__gte=start + timedelta(days=1))
+        oldest = pending.order_by('timestamp').values_list('timestamp', flat=True).first()
+        if oldest is None:
+            break
+        
+        start = datetime.combine(oldest.astimezone(dt_timezone.utc).date(), time.min, tzinfo=dt_timezone.utc)
+        archived += archive_day(start)
+        days += 1
+    return archived
+
+
+def _with_usernames(rows):
+    """Shape archived rows like message_page() rows"""
+    from LoadSpecsApp.models import User
+    
+    usernames = dict(
+        User.objects.filter(id__in={row['sender_id'] for row in rows}).values_list('id', 'username')
+    )
+    return [{
+        'id': row['id'],
+        'content': row['content'],
+        'timestamp': row['timestamp'],
+        'sender_id': row['sender_id'],
+        'sender__username': usernames.get(row['sender_id'], ''),
+    } for row in rows]
+
+
+def archived_position(key, message_id):
+    """(timestamp, id) of an archived message in the conversation, or None"""
+    from LoadSpecsApp.models import MessageArchive
+    
+    chunks = MessageArchive.objects.filter(
+        conversation=key, first_message_id__lte=message_id, last_message_id__gte=message_id
+    )
+    for chunk in chunks:
+        for row in unpack(chunk.data):
+            if row['id'] == message_id:
+                return row['timestamp'], row['id']
+    return None
+
+
+def archived_page(key, before=None, after=None, limit=50):
+    """
+    Up to limit archived messages of a conversation
+    
+    before / after are (timestamp, id) positions. Going backwards (the
+    default) returns rows newest first; with after, oldest first. Day
+    chunks are decompressed one at a time until the page is full.
+    """
+    from LoadSpecsApp.models import MessageArchive
+    
+    chunks = MessageArchive.objects.filter(conversation=key)
+    if after is not None:
+        chunks = chunks.filter(day__gte=after[0].astimezone(dt_timezone.utc).date()).order_by('day')
+    else:
+        if before is not None:
+            chunks = chunks.filter(day__lte=before[0].astimezone(dt_timezone.utc).date())
+        chunks = chunks.order_by('-day')
+    
+    # Each fetched chunk is decoded, so read them a couple at a time
+    rows = []
+    for chunk in chunks.iterator(chunk_size=2):
+        day_rows = unpack(chunk.data)
+        if after is not None:
+            rows.extend(row for row in day_rows if (row['timestamp'], row['id']) > after)
+        else:
+            day_rows.reverse()
+            rows.extend(row for row in day_rows if before is None or (row['timestamp'], row['id']) < before)
+        if len(rows) >= limit:
+            break
+    return _with_usernames(rows[:limit])
@@ -0,0 +1,183 @@
+"""
+Write-behind buffer for chat messages
+
+Consumers hand unsaved Message instances to the buffer and broadcast right
+away; the buffer persists them with one bulk_create every few milliseconds
+or as soon as a batch fills up, updating the conversation summaries in the
+same transaction.
+
+When a bulk insert fails the batch is written again row by row: rows the
+database rejects (a message whose task was deleted mid-chat, say) are
+logged and dropped, so one bad row cannot block the rest, and rows that
+failed for any other reason are queued again and retried on a timer.
+"""
+
+import asyncio
+import atexit
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DataError, IntegrityError, transaction
+
+
+logger = logging.getLogger(__name__)
+
+
+def write_messages(batch):
+    """Insert a batch and fold it into the conversation summaries atomically"""
+    from LoadSpecsApp.models import Message
+    from LoadSpecsApp.utils.conversations import record_messages
+    
+    with transaction.atomic():
+        Message.objects.bulk_create(batch)
+        record_messages(batch)
+
+
+def write_messages_each(batch):
+    """
+    Write a batch one message at a time after the bulk insert failed
+    
+    Returns (written, rejected, failed): rejected are (message, error)
+    pairs the database refused, failed are messages to try again later.
+    """
+    written, rejected, failed = 0, [], []
+    for message in batch:
+        try:
+            write_messages([message])
+            written += 1
+        except (IntegrityError, DataError) as e:
+            rejected.append((message, e))
+        except Exception:
+            failed.append(message)
+    return written, rejected, failed
+
+
+class MessageWriteBuffer:
+    """
+    Per-process buffer that batches chat message inserts
+    
+    All coroutine methods must run on the event loop that serves the
+    consumers. Anything still pending when the process exits is written
+    synchronously by an atexit hook.
+    """
+    
+    def __init__(self, batch_size=None, flush_interval=None, max_pending=None):
+        self.batch_size = batch_size or getattr(settings, 'CHAT_WRITE_BUFFER_SIZE', 100)
+        self.flush_interval = flush_interval or getattr(settings, 'CHAT_WRITE_BUFFER_INTERVAL', 0.05)
+        # Delay before messages that failed to write are tried again
+        self.retry_interval = getattr(settings, 'CHAT_WRITE_BUFFER_RETRY', 1.0)
+        # Upper bound on messages kept around while the database is failing
+        self.max_pending = max_pending or self.batch_size * 50
+        
+        self._pending = []
+        self._lock = threading.Lock()
+        self._timer = None
+        self._flushes = set()
+        self.written = 0
+        self.dropped = 0
+        # Bulk inserts issued; written / batches is the effective batch size
+        self.batches = 0
+    
+    def __len__(self):
+        return len(self._pending)
+    
+    def add(self, message):
+        """Queue an unsaved Message; never waits on the database"""
+        with self._lock:
+            self._pending.append(message)
+            size = len(self._pending)
+        
+        if size >= self.batch_size:
+            self._start_flush()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.flush_interval, self._start_flush)
+    
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        task = asyncio.ensure_future(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+    
+    def _take_batch(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        return batch
+    
+    def _requeue(self, batch, error):
+        with self._lock:
+            room = max(0, self.max_pending - len(self._pending))
+            kept = batch[:room]
+            self._pending = kept + self._pending
+        
+        lost = len(batch) - len(kept)
+        self.dropped += lost
+        logger.error("Failed to write %d chat messages (%d dropped): %s", len(batch), lost, error)
+        
+        if kept and self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.retry_interval, self._start_flush)
+    
+    def _reject(self, rejected):
+        self.dropped += len(rejected)
+        for message, error in rejected:
+            logger.error(
+                "Dropped chat message from user %s (team %s, task %s, recipient %s): %s",
+                message.sender_id, message.team_id, message.task_id, message.recipient_id, error
+            )
+    
+    async def flush(self):
+        """Write everything queued so far with a single bulk insert"""
+        batch = self._take_batch()
+        if not batch:
+            return 0
+        
+        try:
+            await sync_to_async(write_messages)(batch)
+        except Exception as e:
+            written, rejected, failed = await sync_to_async(write_messages_each)(batch)
+            self.written += written
+            self._reject(rejected)
+            if failed:
+                self._requeue(failed, e)
+            return written
+        
+        self.written += len(batch)
+        self.batches += 1
+        return len(batch)
+    
+    async def drain(self):
+        """Wait for in-flight flushes, then write whatever is left"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        return await self.flush()
+    
+    def flush_sync(self):
+        """Blocking flush for use outside the event loop (process shutdown)"""
+        batch = self._take_batch()
+        if batch:
+            try:
+                write_messages(batch)
+                self.written += len(batch)
+                self.batches += 1
+            except Exception as e:
+                written, rejected, failed = write_messages_each(batch)
+                self.written += written
+                self._reject(rejected)
+                self.dropped += len(failed)
+                if failed:
+                    logger.error("Failed to write %d chat messages on shutdown: %s", len(failed), e)
+        return len(batch)
+
+
+message_buffer = MessageWriteBuffer()
+
+atexit.register(message_buffer.flush_sync)
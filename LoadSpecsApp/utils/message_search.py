@@ -0,0 +1,278 @@
+"""
+Full-text search over chat messages
+
+On SQLite the Message table is indexed by an external-content FTS5 table
+(LoadSpecsApp_message_fts) that triggers keep in sync; on PostgreSQL by a
+GIN index over to_tsvector('english', content). Both are created by
+migration 0009. search_messages() hides the difference: it takes the
+user's query, matches it against the index, keeps only messages from the
+user's team and task rooms and their direct conversations, and returns a
+page of hits ranked best first with highlighted snippets.
+
+Pages are keyset-paginated on (score, id). The first page also records
+the highest message id, and every later page of that search is limited
+to messages up to it, so messages sent while the user pages through the
+results do not show up partway through. On PostgreSQL ts_rank only looks
+at the message itself, so pages are stable. On SQLite bm25 also weighs
+words by how rare they are across all messages, so every new message
+shifts scores a little and a hit near a page boundary can still be
+repeated or skipped. Archived messages are no longer in the Message table and are not
+searched.
+"""
+
+import re
+from datetime import timezone as dt_timezone
+
+from django.db import connection
+from django.utils.dateparse import parse_datetime
+from django.utils.html import escape
+
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+
+# Words of a query that are used; the rest are ignored
+MAX_TERMS = 8
+
+FTS_TABLE = 'LoadSpecsApp_message_fts'
+
+# Private-use characters marking matches in snippets until they are
+# escaped and turned into <mark> tags
+_MARK_START = '\ue000'
+_MARK_END = '\ue001'
+
+
+def search_terms(query):
+    """Plain words of a query; operators and punctuation are dropped"""
+    return re.findall(r'\w+', query or '')[:MAX_TERMS]
+
+
+def parse_cursor(cursor):
+    """(score, id, max_id) from a next_cursor value, or None; raises ValueError"""
+    if not cursor:
+        return None
+    score, message_id, max_id = str(cursor).split(':')
+    return float(score), int(message_id), int(max_id)
+
+
+def _cursor(row, max_id):
+    return f"{row['score']!r}:{row['id']}:{max_id}"
+
+
+def _max_message_id():
+    from django.db.models import Max
+    from LoadSpecsApp.models import Message
+    
+    return Message.objects.aggregate(latest=Max('id'))['latest'] or 0
+
+
+def highlight(snippet):
+    """Escape a snippet and wrap the matched words in <mark>"""
+    return escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def _scope(user, rooms, max_id):
+    """SQL condition limiting m.* to the user's rooms and direct messages up to max_id"""
+    clauses = ['((m.sender_id = %s OR m.recipient_id = %s) AND m.team_id IS NULL AND m.task_id IS NULL)']
+    params = [user.id, user.id]
+    for column, ids in (('team_id', rooms['teams']), ('task_id', rooms['tasks'])):
+        if ids:
+            clauses.append(f"m.{column} IN ({', '.join(['%s'] * len(ids))})")
+            params.extend(sorted(ids))
+    return '(' + ' OR '.join(clauses) + ') AND m.id <= %s', [*params, max_id]
+
+
+def _sqlite_hits(terms, scope, scope_params, after, limit):
+    # Every term must match; the last one also matches as a prefix so
+    # results appear while the user is still typing
+    match = ' '.join(f'"{term}"' for term in terms) + '*'
+    keyset, keyset_params = '', []
+    if after is not None:
+        keyset = 'WHERE score < %s OR (score = %s AND id < %s)'
+        keyset_params = [after[0], after[0], after[1]]
+    
+    sql = f'''
+        SELECT * FROM (
+            SELECT m.id, m.team_id, m.task_id, m.sender_id, m.recipient_id, m.timestamp,
+                   u.username, -bm25("{FTS_TABLE}") AS score
+            FROM "{FTS_TABLE}"
+            JOIN "LoadSpecsApp_message" m ON m.id = "{FTS_TABLE}".rowid
+            JOIN "LoadSpecsApp_user" u ON u.id = m.sender_id
+            WHERE "{FTS_TABLE}" MATCH %s AND {scope}
+        ) hits
+        {keyset}
+        ORDER BY score DESC, id DESC
+        LIMIT %s
+    '''
+    rows = _fetch(sql, [match, *scope_params, *keyset_params, limit])
+    if not rows:
+        return rows
+    
+    # Snippets only for the page, not for every match
+    ids = [row['id'] for row in rows]
+    snippets = dict(_fetch_values(f'''
+        SELECT rowid, snippet("{FTS_TABLE}", 0, %s, %s, '…', 16)
+        FROM "{FTS_TABLE}"
+        WHERE "{FTS_TABLE}" MATCH %s AND rowid IN ({', '.join(['%s'] * len(ids))})
+    ''', [_MARK_START, _MARK_END, match, *ids]))
+    for row in rows:
+        row['snippet'] = snippets.get(row['id'], '')
+    return rows
+
+
+def _postgres_hits(terms, scope, scope_params, after, limit):
+    query = ' & '.join(terms) + ':*'
+    keyset, keyset_params = '', []
+    if after is not None:
+        keyset = 'WHERE score < %s OR (score = %s AND id < %s)'
+        keyset_params = [after[0], after[0], after[1]]
+    
+    # The to_tsvector expression must match the GIN index for it to be used
+    sql = f'''
+        SELECT page.*, ts_headline(
+            'english', page.content, to_tsquery('english', %s),
+            'StartSel={_MARK_START}, StopSel={_MARK_END}, MaxWords=30, MinWords=10'
+        ) AS snippet
+        FROM (
+            SELECT * FROM (
+                SELECT m.id, m.team_id, m.task_id, m.sender_id, m.recipient_id, m.timestamp,
+                       m.content, u.username,
+                       ts_rank(to_tsvector('english', m.content), q)::float8 AS score
+                FROM "LoadSpecsApp_message" m
+                JOIN "LoadSpecsApp_user" u ON u.id = m.sender_id,
+                     to_tsquery('english', %s) q
+                WHERE to_tsvector('english', m.content) @@ q AND {scope}
+            ) hits
+            {keyset}
+            ORDER BY score DESC, id DESC
+            LIMIT %s
+        ) page
+        ORDER BY page.score DESC, page.id DESC
+    '''
+    return _fetch(sql, [query, query, *scope_params, *keyset_params, limit])
+
+
+def _fallback_hits(terms, user, rooms, max_id, after, limit):
+    """Other databases: unindexed substring match, newest first"""
+    from django.db.models import F, Q
+    from LoadSpecsApp.models import Message
+    
+    scoped = (
+        Q(team_id__in=rooms['teams']) | Q(task_id__in=rooms['tasks']) |
+        (Q(team__isnull=True, task__isnull=True) & (Q(sender=user) | Q(recipient=user)))
+    )
+    queryset = Message.objects.filter(scoped, id__lte=max_id)
+    for term in terms:
+        queryset = queryset.filter(content__icontains=term)
+    if after is not None:
+        queryset = queryset.filter(id__lt=after[1])
+    
+    rows = list(
+        queryset.order_by('-id').values(
+            'id', 'team_id', 'task_id', 'sender_id', 'recipient_id', 'timestamp', 'content',
+            username=F('sender__username')
+        )[:limit]
+    )
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    for row in rows:
+        row['score'] = 0.0
+        row['snippet'] = pattern.sub(lambda match: _MARK_START + match.group(0) + _MARK_END, row.pop('content'))
+    return rows
+
+
+def _fetch(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _fetch_values(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _stream(row, user_id):
+    if row['team_id'] is not None:
+        return f"team:{row['team_id']}"
+    if row['task_id'] is not None:
+        return f"task:{row['task_id']}"
+    other = row['recipient_id'] if row['sender_id'] == user_id else row['sender_id']
+    return f'dm:{other}'
+
+
+def search_messages(user, query, cursor=None, limit=PAGE_SIZE, rooms=None):
+    """
+    One page of the user's messages matching query, best match first
+    
+    cursor is the next_cursor of the previous page. Returns (hits,
+    next_cursor); next_cursor is None on the last page. Each hit has id,
+    stream, sender, sender_id, timestamp and an HTML-safe snippet with
+    the matched words in <mark>. Raises ValueError for a bad cursor.
+    """
+    from LoadSpecsApp.utils.membership import get_accessible_rooms
+    
+    after = parse_cursor(cursor)
+    terms = search_terms(query)
+    if not terms:
+        return [], None
+    
+    # Later pages search the same messages as the first one
+    max_id = after[2] if after else _max_message_id()
+    rooms = rooms or get_accessible_rooms(user)
+    if connection.vendor == 'sqlite':
+        scope, scope_params = _scope(user, rooms, max_id)
+        rows = _sqlite_hits(terms, scope, scope_params, after, limit + 1)
+    elif connection.vendor == 'postgresql':
+        scope, scope_params = _scope(user, rooms, max_id)
+        rows = _postgres_hits(terms, scope, scope_params, after, limit + 1)
+    else:
+        rows = _fallback_hits(terms, user, rooms, max_id, after, limit + 1)
+    
+    next_cursor = _cursor(rows[limit - 1], max_id) if len(rows) > limit else None
+    hits = []
+    for row in rows[:limit]:
+        timestamp = row['timestamp']
+        if isinstance(timestamp, str):
+            timestamp = parse_datetime(timestamp)
+        if timestamp.tzinfo is None:
+            # Raw SQLite rows skip the DateTimeField conversion; stored as UTC
+            timestamp = timestamp.replace(tzinfo=dt_timezone.utc)
+        hits.append({
+            'id': row['id'],
+            'stream': _stream(row, user.id),
+            'sender': row['username'],
+            'sender_id': row['sender_id'],
+            'timestamp': timestamp,
+            'snippet': highlight(row['snippet']),
+        })
+    return hits, next_cursor
+
+
+def matching_ids(query, limit=1000):
+    """Ids of any messages matching query, best first; unscoped, for the admin"""
+    terms = search_terms(query)
+    if not terms:
+        return []
+    
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{term}"' for term in terms) + '*'
+        return [row[0] for row in _fetch_values(
+            f'SELECT rowid FROM "{FTS_TABLE}" WHERE "{FTS_TABLE}" MATCH %s ORDER BY rank LIMIT %s',
+            [match, limit]
+        )]
+    if connection.vendor == 'postgresql':
+        return [row[0] for row in _fetch_values(
+            '''SELECT id FROM "LoadSpecsApp_message"
+               WHERE to_tsvector('english', content) @@ to_tsquery('english', %s)
+               ORDER BY id DESC LIMIT %s''',
+            [' & '.join(terms) + ':*', limit]
+        )]
+    
+    from LoadSpecsApp.models import Message
+    
+    queryset = Message.objects.all()
+    for term in terms:
+        queryset = queryset.filter(content__icontains=term)
+    return list(queryset.order_by('-id').values_list('id', flat=True)[:limit])
@@ -0,0 +1,126 @@
+"""
+Mood distributions over any scope
+
+Every mood count in the app goes through here: one
+values('mood').annotate(Count) query per call, whatever the scope (a set
+of teams, one employee, a date range) or bucketing (day, week, month).
+Moods with no check-ins are filled in as zero, and so are buckets with
+no check-ins, so callers never see missing keys or gaps in a trend.
+"""
+
+from datetime import date, datetime, time, timedelta
+
+from django.db.models import Count, DateField
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+
+MOODS = ('happy', 'neutral', 'stressed', 'burnout')
+
+BUCKETS = ('day', 'week', 'month')
+
+
+def empty_counts():
+    return {mood: 0 for mood in MOODS}
+
+
+def _aware(value):
+    """Dates mean midnight in the current timezone"""
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime.combine(value, time.min)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def checkins(teams=None, employee=None, start=None, end=None):
+    """
+    Check-ins in scope: teams (a queryset, ids or Team objects), one
+    employee, from start (inclusive) to end (exclusive)
+    """
+    from LoadSpecsApp.models import MoodCheckin
+    
+    queryset = MoodCheckin.objects.all()
+    if teams is not None:
+        queryset = queryset.filter(team__in=teams)
+    if employee is not None:
+        queryset = queryset.filter(employee=employee)
+    if start is not None:
+        queryset = queryset.filter(timestamp__gte=_aware(start))
+    if end is not None:
+        queryset = queryset.filter(timestamp__lt=_aware(end))
+    return queryset
+
+
+def mood_distribution(teams=None, employee=None, start=None, end=None, by=None):
+    """
+    Check-ins per mood, e.g. {'happy': 4, 'neutral': 0, 'stressed': 2, 'burnout': 1}
+    
+    With by='team' or by='employee' returns {id: counts} for every team or
+    employee that has check-ins in scope, still in one query.
+    """
+    group = [f'{by}_id'] if by else []
+    # Mood first: grouping by employee first makes SQLite walk the whole
+    # (employee, timestamp) index rather than search a timestamp range
+    rows = (
+        checkins(teams, employee, start, end)
+        .values('mood', *group).annotate(count=Count('id')).order_by()
+    )
+    
+    if not by:
+        counts = empty_counts()
+        for row in rows:
+            counts[row['mood']] = row['count']
+        return counts
+    
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row[f'{by}_id'], empty_counts())[row['mood']] = row['count']
+    return grouped
+
+
+def bucket_start(value, bucket):
+    """First day of the day / ISO week / month containing value"""
+    value = timezone.localtime(_aware(value)).date()
+    if bucket == 'week':
+        return value - timedelta(days=value.weekday())
+    if bucket == 'month':
+        return value.replace(day=1)
+    return value
+
+
+def next_bucket(value, bucket):
+    if bucket == 'week':
+        return value + timedelta(weeks=1)
+    if bucket == 'month':
+        return (value.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return value + timedelta(days=1)
+
+
+def mood_trend(start, end=None, bucket='week', teams=None, employee=None):
+    """
+    Mood counts per bucket from start up to end (default now), oldest first
+    
+    Returns [{'period': date, 'happy': n, ...}, ...] with one entry for
+    every day, ISO week or month in the range, including empty ones.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f'bucket must be one of {", ".join(BUCKETS)}')
+    
+    end = end or timezone.now()
+    rows = (
+        checkins(teams, employee, bucket_start(start, bucket), end)
+        .annotate(period=Trunc('timestamp', bucket, output_field=DateField()))
+        .values('period', 'mood').annotate(count=Count('id')).order_by()
+    )
+    found = {}
+    for row in rows:
+        found.setdefault(row['period'], empty_counts())[row['mood']] = row['count']
+    
+    trend = []
+    period = bucket_start(start, bucket)
+    last = timezone.localtime(_aware(end)).date()
+    while period <= last:
+        trend.append({'period': period, **found.get(period, empty_counts())})
+        period = next_bucket(period, bucket)
+    return trend
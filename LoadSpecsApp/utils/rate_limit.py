@@ -0,0 +1,87 @@
+"""
+Token-bucket rate limiting for chat sockets
+"""
+
+import threading
+import time
+import weakref
+
+from django.conf import settings
+
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to `burst` tokens, refilled at `rate` per second
+    """
+    
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def consume(self, tokens=1):
+        """Take tokens if available; returns False when the bucket is empty"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+    
+    def is_full(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return self.tokens >= self.burst
+
+
+class UserBuckets:
+    """
+    Per-process registry of per-user buckets, shared by all of a user's sockets
+    
+    Buckets are looked up weakly, so one stays shared for as long as any open
+    socket holds it. Buckets nobody holds are kept until they have refilled
+    completely, at which point they carry no state and are pruned.
+    """
+    
+    PRUNE_EVERY = 1000
+    
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = weakref.WeakValueDictionary()
+        self._draining = {}
+        self._lock = threading.Lock()
+        self._lookups = 0
+    
+    def get(self, user_id):
+        with self._lock:
+            self._lookups += 1
+            if self._lookups % self.PRUNE_EVERY == 0:
+                self._draining = {key: bucket for key, bucket in self._draining.items() if not bucket.is_full()}
+            
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+            self._draining[user_id] = bucket
+            return bucket
+
+
+def connection_bucket():
+    rate, burst = getattr(settings, 'CHAT_RATE_LIMIT_PER_CONNECTION', (5, 10))
+    return TokenBucket(rate, burst)
+
+
+def violation_bucket():
+    """Allowance of rejected frames before a socket is closed as abusive"""
+    max_violations = getattr(settings, 'CHAT_RATE_LIMIT_MAX_VIOLATIONS', 20)
+    return TokenBucket(max_violations / 10.0, max_violations)
+
+
+_user_rate, _user_burst = getattr(settings, 'CHAT_RATE_LIMIT_PER_USER', (10, 20))
+user_buckets = UserBuckets(_user_rate, _user_burst)
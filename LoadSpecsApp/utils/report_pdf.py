@@ -0,0 +1,417 @@
+"""
+InsightReport PDF rendering, caching and delivery
+
+PDFs are built by the render_report_pdf Celery task: the views call
+queue_report_pdf() and the task stores the result on
+InsightReport.pdf_file (under REPORT_PDF_ROOT, outside the public media
+directory) and flips pdf_status to 'ready'. Only when the broker cannot
+be reached is the PDF rendered inside the request, and a PDF left
+pending longer than REPORT_PDF_PENDING_TIMEOUT is queued again. Downloads go
+through serve_report_pdf(), which hands the file to the web server with
+X-Sendfile / X-Accel-Redirect when REPORT_PDF_SENDFILE is configured.
+
+Everything in a PDF is frozen, so it renders the same every time: the
+mood figures into InsightReport.pdf_data when the report is generated,
+and every task of the team into ReportTask rows by the first render,
+which is queued right then. Tasks are copied with one INSERT ... SELECT
+and rendered TASK_CHUNK_SIZE rows and one page at a time (see TaskTable),
+so a team with thousands of tasks renders in bounded memory. Reports
+older than REPORT_RETENTION_DAYS are deleted with their frozen tasks and
+PDFs by prune_old_reports().
+
+Rendered files are content-addressed: cache/<report id>-<data version>.pdf,
+where the version hashes everything that goes into the document. Reading
+a file refreshes its mtime and the least recently used files are evicted
+once the cache exceeds REPORT_PDF_CACHE_BYTES; an evicted report is simply
+rendered again, byte for byte the same, on its next download.
+"""
+
+import hashlib
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import FileResponse, HttpResponse
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import Flowable, SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+from LoadSpecsApp.utils.mood_analytics import mood_distribution
+
+
+CACHE_DIR = 'cache'
+
+# Bump when the layout changes so cached PDFs are rendered again
+LAYOUT_VERSION = 2
+
+MOOD_LABELS = [('happy', 'Happy'), ('neutral', 'Neutral'), ('stressed', 'Stressed'), ('burnout', 'Burnout')]
+
+# Task rows are fetched from the database this many at a time
+TASK_CHUNK_SIZE = 500
+
+TASK_HEADER = ['Task Title', 'Assigned To', 'Status', 'Priority', 'Due Date']
+TASK_COL_WIDTHS = [2*inch, 1.5*inch, 1*inch, 1*inch, 1*inch]
+# Fixed heights let TaskTable know how many rows fit without measuring
+TASK_HEADER_HEIGHT = 26
+TASK_ROW_HEIGHT = 18
+
+# Styles are shared by every render in the process; nothing mutates them
+STYLES = getSampleStyleSheet()
+
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=STYLES['Heading1'],
+    fontSize=24,
+    textColor=colors.HexColor('#003135'),
+    spaceAfter=30,
+    alignment=TA_CENTER
+)
+
+HEADING_STYLE = ParagraphStyle(
+    'CustomHeading',
+    parent=STYLES['Heading2'],
+    fontSize=16,
+    textColor=colors.HexColor('#00bcd4'),
+    spaceAfter=12,
+    spaceBefore=12
+)
+
+TASK_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#003135')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+])
+
+MOOD_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#00bcd4')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+])
+
+
+def report_pdf_data(team):
+    """Mood figures for a team's PDF, frozen on the report"""
+    counts = mood_distribution(teams=[team], start=timezone.now() - timedelta(days=30))
+    # Pairs rather than a dict: jsonb does not keep key order
+    moods = [[label, counts[mood]] for mood, label in MOOD_LABELS] if any(counts.values()) else None
+    
+    return {'moods': moods}
+
+
+def freeze_report_tasks(report):
+    """
+    Copy every task of the report's team into its ReportTask rows
+    
+    One INSERT ... SELECT, so no task passes through Python. Positions
+    follow the task list (newest first) and rows that already exist are
+    kept, so a second render of the same report changes nothing.
+    """
+    from LoadSpecsApp.models import ReportTask
+    
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                '''INSERT INTO "LoadSpecsApp_reporttask"
+                       ("report_id", "position", "title", "assigned_to", "status", "priority", "due_date")
+                   SELECT %s, ROW_NUMBER() OVER (ORDER BY t.created_at DESC, t.id DESC) - 1,
+                          t.title, u.username, t.status, t.priority, t.due_date
+                   FROM "LoadSpecsApp_task" t
+                   JOIN "LoadSpecsApp_employee" e ON e.id = t.assigned_to_id
+                   JOIN "LoadSpecsApp_user" u ON u.id = e.user_id
+                   WHERE t.team_id = %s
+                   ON CONFLICT ("report_id", "position") DO NOTHING''',
+                [report.id, report.team_id]
+            )
+        count = ReportTask.objects.filter(report=report).count()
+        
+        report.pdf_data = {**report.pdf_data, 'task_count': count}
+        report.save(update_fields=['pdf_data'])
+    return count
+
+
+def prune_old_reports(days=None, batch_size=100):
+    """
+    Delete reports older than days with their frozen tasks and stored PDFs
+    
+    Weekly reports alone freeze every task of every team three times a
+    week. Works through the old reports batch_size at a time; returns the
+    number deleted.
+    """
+    from LoadSpecsApp.models import InsightReport
+    
+    days = days or getattr(settings, 'REPORT_RETENTION_DAYS', 365)
+    cutoff = timezone.now() - timedelta(days=days)
+    storage = InsightReport._meta.get_field('pdf_file').storage
+    
+    deleted = 0
+    while True:
+        batch = list(
+            InsightReport.objects.filter(created_at__lt=cutoff).order_by('id')
+            .values_list('id', 'pdf_file')[:batch_size]
+        )
+        if not batch:
+            return deleted
+        
+        # ReportTask rows go with their reports in one DELETE per batch
+        InsightReport.objects.filter(id__in=[report_id for report_id, _ in batch]).delete()
+        for _, name in batch:
+            if name:
+                storage.delete(name)
+        deleted += len(batch)
+
+
+def task_rows(report):
+    """Task table rows for report, streamed from its frozen tasks in chunks"""
+    from LoadSpecsApp.models import ReportTask
+    
+    if 'tasks' in report.pdf_data:
+        # Reports from before every task was frozen kept their first ten rows
+        yield from report.pdf_data['tasks']
+        return
+    
+    tasks = ReportTask.objects.filter(report=report).order_by('position').values_list(
+        'title', 'assigned_to', 'status', 'priority', 'due_date'
+    )
+    for title, username, status, priority, due_date in tasks.iterator(chunk_size=TASK_CHUNK_SIZE):
+        yield [title[:30], username, status.title(), priority.title(), due_date.strftime('%Y-%m-%d')]
+
+
+class TaskTable(Flowable):
+    """
+    A table of rows pulled from an iterator one page at a time
+    
+    Platypus splits a flowable that is taller than the space left on the
+    page. TaskTable claims to always be too tall, and each split takes
+    only the rows that fit into a plain Table with the header repeated,
+    leaving a new TaskTable for the rest. Only one page of rows is ever in
+    memory.
+    """
+    
+    def __init__(self, rows, next_row=None):
+        super().__init__()
+        self.rows = iter(rows)
+        self.next_row = next_row if next_row is not None else next(self.rows, None)
+    
+    def wrap(self, availWidth, availHeight):
+        # Too tall to fit, so platypus calls split()
+        return sum(TASK_COL_WIDTHS), availHeight + 1
+    
+    def split(self, availWidth, availHeight):
+        fits = int((availHeight - TASK_HEADER_HEIGHT) // TASK_ROW_HEIGHT)
+        if fits < 1:
+            # Not even one row: start again on the next page
+            return []
+        
+        page = []
+        while self.next_row is not None and len(page) < fits:
+            page.append(self.next_row)
+            self.next_row = next(self.rows, None)
+        
+        table = Table(
+            [TASK_HEADER] + page,
+            colWidths=TASK_COL_WIDTHS,
+            rowHeights=[TASK_HEADER_HEIGHT] + [TASK_ROW_HEIGHT] * len(page)
+        )
+        table.setStyle(TASK_TABLE_STYLE)
+        if self.next_row is None:
+            return [table]
+        # A new flowable: platypus marks one it could not place on a page
+        return [table, TaskTable(self.rows, self.next_row)]
+    
+    def draw(self):
+        pass
+
+
+def data_version(report):
+    """Hash of everything rendered into the report's PDF"""
+    content = json.dumps({
+        'layout': LAYOUT_VERSION,
+        'team': report.team.team_name,
+        'report_type': report.report_type,
+        'generated_by': report.generated_by.full_name,
+        'created_at': report.created_at.isoformat(),
+        'summary': report.summary_text,
+        'data': report.pdf_data,
+    }, sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:24]
+
+
+def cache_name(report):
+    return f'{CACHE_DIR}/{report.id}-{data_version(report)}.pdf'
+
+
+def touch(storage, name):
+    """Mark a cached PDF as recently used"""
+    try:
+        os.utime(storage.path(name))
+    except (NotImplementedError, OSError):
+        pass
+
+
+def evict_report_pdfs(budget=None, keep=()):
+    """
+    Delete least recently used cached PDFs until the cache fits budget
+    
+    Reports whose file was evicted go back to pdf_status 'none'. Returns
+    the number of files deleted.
+    """
+    from LoadSpecsApp.models import InsightReport, report_pdf_storage
+    
+    budget = getattr(settings, 'REPORT_PDF_CACHE_BYTES', 512 * 1024 * 1024) if budget is None else budget
+    storage = report_pdf_storage()
+    try:
+        entries = [entry for entry in os.scandir(storage.path(CACHE_DIR)) if entry.is_file()]
+    except FileNotFoundError:
+        return 0
+    
+    files = sorted((entry.stat().st_mtime, entry.stat().st_size, f'{CACHE_DIR}/{entry.name}') for entry in entries)
+    total = sum(size for _, size, _ in files)
+    evicted = []
+    for _, size, name in files:
+        if total <= budget:
+            break
+        if name in keep:
+            continue
+        storage.delete(name)
+        evicted.append(name)
+        total -= size
+    
+    if evicted:
+        InsightReport.objects.filter(pdf_file__in=evicted).update(pdf_file='', pdf_status='none')
+    return len(evicted)
+
+
+def report_filename(report):
+    """Download name for a report's PDF"""
+    return f'LoadSpecs_Report_{report.team.team_name}_{report.created_at.strftime("%Y%m%d")}.pdf'
+
+
+def build_report_pdf(report, output):
+    """Write the PDF for report into the file-like output"""
+    team = report.team
+    data = report.pdf_data or report_pdf_data(team)
+    # invariant: the same report always renders to the same bytes
+    doc = SimpleDocTemplate(output, pagesize=letter, invariant=1)
+    elements = []
+    
+    # Title
+    elements.append(Paragraph(f"LoadSpecs Report - {team.team_name}", TITLE_STYLE))
+    elements.append(Spacer(1, 0.3*inch))
+    
+    # Report Info
+    elements.append(Paragraph(f"<b>Report Type:</b> {report.report_type.title()}", STYLES['Normal']))
+    elements.append(Paragraph(f"<b>Generated By:</b> {report.generated_by.full_name}", STYLES['Normal']))
+    elements.append(Paragraph(f"<b>Generated On:</b> {report.created_at.strftime('%B %d, %Y at %I:%M %p')}", STYLES['Normal']))
+    elements.append(Spacer(1, 0.3*inch))
+    
+    # Summary
+    elements.append(Paragraph("Summary", HEADING_STYLE))
+    for line in report.summary_text.split('\n'):
+        if line.strip():
+            elements.append(Paragraph(line.strip(), STYLES['Normal']))
+    elements.append(Spacer(1, 0.3*inch))
+    
+    # Team Statistics
+    elements.append(Paragraph("Team Statistics", HEADING_STYLE))
+    
+    # Tasks Table, every task of the team across as many pages as it takes
+    tasks = TaskTable(task_rows(report))
+    if tasks.next_row is not None:
+        elements.append(Paragraph("<b>Tasks Overview:</b>", STYLES['Normal']))
+        elements.append(Spacer(1, 0.1*inch))
+        elements.append(tasks)
+        elements.append(Spacer(1, 0.3*inch))
+    
+    # Mood Statistics
+    if data['moods']:
+        elements.append(Paragraph("<b>Recent Mood Check-ins (Last 30 Days):</b>", STYLES['Normal']))
+        elements.append(Spacer(1, 0.1*inch))
+        
+        mood_data = [['Mood', 'Count']]
+        for mood, count in data['moods']:
+            mood_data.append([mood, str(count)])
+        
+        mood_table = Table(mood_data, colWidths=[3*inch, 2*inch])
+        mood_table.setStyle(MOOD_TABLE_STYLE)
+        elements.append(mood_table)
+    
+    # Footer
+    elements.append(Spacer(1, 0.5*inch))
+    elements.append(Paragraph("___", STYLES['Normal']))
+    elements.append(Paragraph("Generated by LoadSpecs - Workload Management System", STYLES['Normal']))
+    
+    # Build PDF
+    doc.build(elements)
+
+
+def queue_report_pdf(report):
+    """
+    Mark the report's PDF pending and render it in the background
+    
+    When the Celery broker cannot be reached the PDF is rendered in the
+    request instead, so it is never left pending with no task to finish it.
+    """
+    from kombu.exceptions import OperationalError
+    from LoadSpecsApp.models import InsightReport
+    from LoadSpecsApp.tasks import render_report_pdf
+    
+    requested_at = timezone.now()
+    InsightReport.objects.filter(id=report.id).update(pdf_status='pending', pdf_requested_at=requested_at)
+    report.pdf_status = 'pending'
+    report.pdf_requested_at = requested_at
+    
+    try:
+        # Fail at once rather than hold the request while kombu retries the
+        # broker; the outcome is read from pdf_status, not a task result
+        with render_report_pdf.app.connection_for_write(transport_options={'max_retries': 0}) as connection:
+            render_report_pdf.apply_async((report.id,), connection=connection, retry=False, ignore_result=True)
+    except OperationalError as e:
+        print(f"Could not queue PDF for report {report.id}, rendering it now: {e}")
+        # Notifications need the broker too; the user is waiting on the page
+        render_report_pdf.apply(args=(report.id,), kwargs={'notify': False})
+        report.refresh_from_db(fields=['pdf_status', 'pdf_file'])
+
+
+def pdf_pending_too_long(report):
+    """True if a pending PDF was queued so long ago that its task was lost"""
+    timeout = getattr(settings, 'REPORT_PDF_PENDING_TIMEOUT', 15 * 60)
+    return report.pdf_status == 'pending' and (
+        report.pdf_requested_at is None or report.pdf_requested_at < timezone.now() - timedelta(seconds=timeout)
+    )
+
+
+def serve_report_pdf(report):
+    """Response sending a report's stored PDF as an attachment"""
+    touch(report.pdf_file.storage, report.pdf_file.name)
+    filename = report_filename(report)
+    mode = getattr(settings, 'REPORT_PDF_SENDFILE', None)
+    
+    if mode in ('x-accel', 'x-sendfile'):
+        # The web server reads the file; Django only sends headers
+        response = HttpResponse(content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        if mode == 'x-accel':
+            response['X-Accel-Redirect'] = settings.REPORT_PDF_ACCEL_PREFIX + report.pdf_file.name
+        else:
+            response['X-Sendfile'] = report.pdf_file.path
+        return response
+    
+    return FileResponse(
+        report.pdf_file.open('rb'), as_attachment=True, filename=filename, content_type='application/pdf'
+    )
@@ -0,0 +1,113 @@
+"""
+Insight report summaries and report creation
+
+Shared by the generate view, where a team lead asks for a report, and by
+the weekly scheduled reports, which are generated for every team off-peak.
+"""
+
+from datetime import timedelta
+
+from django.utils import timezone
+
+from LoadSpecsApp.utils.mood_analytics import mood_distribution
+from LoadSpecsApp.utils.report_pdf import report_pdf_data
+
+
+# Generated for every team each week by the generate_weekly_reports task
+WEEKLY_REPORT_TYPES = ['workload', 'burnout', 'performance']
+
+
+def generate_workload_summary(team):
+    """Generate workload summary for a team"""
+    total_tasks = team.tasks.count()
+    completed = team.completed_tasks
+    pending = team.pending_tasks
+    in_progress = team.in_progress_tasks
+    
+    summary = f"""
+    Workload Summary for {team.team_name}:
+    
+    Total Tasks: {total_tasks}
+    Completed: {completed} ({(completed/total_tasks*100) if total_tasks > 0 else 0:.1f}%)
+    In Progress: {in_progress}
+    Pending: {pending}
+    
+    Team Members: {team.member_count}
+    Average Tasks per Member: {total_tasks/team.member_count if team.member_count > 0 else 0:.1f}
+    
+    Status: {'No Tasks' if total_tasks == 0 else 'On Track' if completed/total_tasks > 0.7 else 'Needs Attention'}
+    """
+    
+    return summary
+
+
+def generate_burnout_analysis(team):
+    """Generate burnout analysis for a team"""
+    mood_counts = mood_distribution(teams=[team], start=timezone.now() - timedelta(days=30))
+    
+    total_checkins = sum(mood_counts.values())
+    burnout_count = mood_counts['burnout']
+    stressed_count = mood_counts['stressed']
+    
+    risk_level = "Low"
+    if burnout_count / total_checkins > 0.3 if total_checkins > 0 else False:
+        risk_level = "High"
+    elif stressed_count / total_checkins > 0.5 if total_checkins > 0 else False:
+        risk_level = "Medium"
+    
+    summary = f"""
+    Burnout Analysis for {team.team_name}:
+    
+    Total Mood Check-ins (30 days): {total_checkins}
+    Burnout Reports: {burnout_count}
+    Stressed Reports: {stressed_count}
+    
+    Risk Level: {risk_level}
+    
+    Recommendation: {'Immediate attention needed. Consider workload redistribution.' if risk_level == 'High' else 'Monitor team well-being regularly.' if risk_level == 'Medium' else 'Team morale is healthy.'}
+    """
+    
+    return summary
+
+
+def generate_performance_report(team):
+    """Generate performance report for a team"""
+    employees = team.employees.all()
+    
+    summary = f"Performance Report for {team.team_name}:\n\n"
+    
+    for emp in employees:
+        total = emp.assigned_tasks
+        completed = emp.completed_tasks
+        completion_rate = (completed / total * 100) if total > 0 else 0
+        
+        summary += f"{emp.user.username}: {completed}/{total} tasks completed ({completion_rate:.1f}%)\n"
+    
+    return summary
+
+
+SUMMARIES = {
+    'workload': generate_workload_summary,
+    'burnout': generate_burnout_analysis,
+    'performance': generate_performance_report,
+}
+
+
+def create_insight_report(team, report_type, generated_by, week_start=None):
+    """
+    Save a report of report_type for team with its summary and PDF figures
+    
+    The team's tasks are frozen by the render_report_pdf task, which the
+    callers queue or run straight after.
+    """
+    from LoadSpecsApp.models import InsightReport
+    
+    summary = SUMMARIES[report_type](team) if report_type in SUMMARIES else "Report generated successfully."
+    return InsightReport.objects.create(
+        team=team,
+        generated_by=generated_by,
+        summary_text=summary,
+        report_type=report_type,
+        pdf_data=report_pdf_data(team),
+        week_start=week_start
+    )
@@ -2,7 +2,8 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Count
+from django.db import transaction
+from django.db.models import Q, Count, Max
 from django.utils import timezone
 from django.core.mail import send_mail
 from django.contrib.auth.tokens import default_token_generator
@@ -10,25 +11,29 @@ from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.template.loader import render_to_string
 from django.contrib.sites.shortcuts import get_current_site
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, Http404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.views.decorators.http import require_http_methods
 from datetime import timedelta, datetime
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import io
-import base64
 import json
 from .models import (
     User, Team, TeamLead, Employee, Task, MoodCheckin, InsightReport,
-    Message, Announcement, BurnoutAlert, CalendarSync, TaskPrioritySuggestion, UserPreference
+    Message, Announcement, BurnoutAlert, CalendarSync, CalendarFeed, TaskPrioritySuggestion,
+    UserPreference
 )
+from .utils.ics_utils import stream_calendar
+from .utils.conversations import (
+    MAX_PAGE_SIZE, PAGE_SIZE, conversation_filter, inbox, mark_conversation_read, message_page,
+    recent_messages, record_messages, storage_key, unread_counts
+)
+from .utils.membership import can_access_team, can_access_task, get_accessible_rooms
+from .utils import exports, message_search
+from .utils.report_pdf import pdf_pending_too_long, queue_report_pdf, serve_report_pdf
+from .utils.report_summaries import create_insight_report
+from .utils.charts import mood_series, pie_chart_png, series_key
+from .utils.mood_analytics import mood_distribution, mood_trend
 from .forms import (
     SignUpForm, LoginForm, ProfileUpdateForm, TeamCreateForm,
     JoinTeamForm, TaskCreateForm, TaskUpdateForm, MoodCheckinForm
@@ -326,6 +331,7 @@ def tasks_view(request):
                         })
             
             context['employees_with_tasks'] = employees_with_tasks
+            context['export_datasets'] = [('tasks', 'Tasks'), ('moods', 'Moods'), ('alerts', 'Alerts')]
             
         except TeamLead.DoesNotExist:
             TeamLead.objects.create(user=user)
@@ -496,17 +502,14 @@ def reports_view(request):
                 context['pending_tasks'] = pending_tasks
                 
                 # Mood statistics
-                recent_moods = MoodCheckin.objects.filter(team__in=teams, timestamp__gte=timezone.now() - timedelta(days=30))
-                mood_counts = {
-                    'happy': recent_moods.filter(mood='happy').count(),
-                    'neutral': recent_moods.filter(mood='neutral').count(),
-                    'stressed': recent_moods.filter(mood='stressed').count(),
-                    'burnout': recent_moods.filter(mood='burnout').count(),
-                }
+                mood_counts = recent_mood_counts(teams)
                 context['mood_counts'] = mood_counts
                 
-                # Generate chart
-                context['chart'] = generate_mood_chart(mood_counts)
+                # Chart image URL; the hash changes with the counts, so the
+                # browser re-fetches only when there is something new to draw
+                series = mood_series(mood_counts)
+                if sum(series['counts']):
+                    context['chart_url'] = f"{reverse('mood_chart')}?v={series_key(series)}"
                 
                 # Get recent reports
                 recent_reports = InsightReport.objects.filter(team__in=teams)[:5]
@@ -533,31 +536,74 @@ def reports_view(request):
     return render(request, 'LoadSpecsHTML/reports.html', context)
 
 
-def generate_mood_chart(mood_counts):
-    """Generate a simple mood distribution chart"""
-    labels = list(mood_counts.keys())
-    sizes = list(mood_counts.values())
+def recent_mood_counts(teams):
+    """Mood check-ins per mood across teams over the last 30 days"""
+    return mood_distribution(teams=teams, start=timezone.now() - timedelta(days=30))
+
+
+@login_required
+def mood_chart_view(request):
+    """
+    Mood distribution chart for the team lead's teams
     
-    if sum(sizes) == 0:
-        return None
+    Serves a PNG rendered once per distinct set of counts; ?format=json
+    returns just the series for drawing the chart client-side.
+    """
+    if not request.user.is_team_lead:
+        return JsonResponse({'success': False, 'error': 'Unauthorized'}, status=403)
+    
+    series = mood_series(recent_mood_counts(request.user.teamlead_profile.teams.all()))
+    key = series_key(series)
     
-    colors = ['#4CAF50', '#FFC107', '#FF9800', '#F44336']
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'success': True, 'key': key, **series})
     
-    plt.figure(figsize=(8, 6))
-    plt.pie(sizes, labels=labels, colors=colors, autopct='%1.1f%%', startangle=90)
-    plt.title('Mood Distribution (Last 30 Days)')
-    plt.axis('equal')
+    if not sum(series['counts']):
+        raise Http404('No mood check-ins to chart')
     
-    # Convert plot to base64 string
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png', bbox_inches='tight')
-    buffer.seek(0)
-    image_png = buffer.getvalue()
-    buffer.close()
-    plt.close()
+    etag = f'"{key}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(pie_chart_png(series)[1], content_type='image/png')
     
-    graphic = base64.b64encode(image_png).decode('utf-8')
-    return graphic
+    response['ETag'] = etag
+    # A URL carrying the current hash never changes content
+    if request.GET.get('v') == key:
+        response['Cache-Control'] = 'private, max-age=86400'
+    else:
+        response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@login_required
+def export_view(request, dataset, file_format):
+    """
+    Stream the team lead's tasks, mood check-ins or alerts as CSV or XLSX
+    
+    ?team=<id> narrows the export to one of the lead's teams.
+    """
+    if not request.user.is_team_lead:
+        return JsonResponse({'success': False, 'error': 'Unauthorized'}, status=403)
+    if dataset not in exports.DATASETS or file_format not in exports.FORMATS:
+        raise Http404
+    if not exports.format_available(file_format):
+        return JsonResponse({'success': False, 'error': f'{file_format.upper()} export is unavailable'}, status=503)
+    
+    team_lead = request.user.teamlead_profile
+    teams = team_lead.teams.all()
+    if request.GET.get('team'):
+        try:
+            teams = teams.filter(id=int(request.GET['team']))
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid team'}, status=400)
+    
+    response = StreamingHttpResponse(
+        exports.stream_export(dataset, file_format, team_lead, teams),
+        content_type=exports.FORMATS[file_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{exports.export_filename(dataset, file_format)}"'
+    response['Cache-Control'] = 'private, no-store'
+    return response
 
 
 @login_required
@@ -574,27 +620,16 @@ def generate_report_view(request):
         
         team = get_object_or_404(Team, id=team_id)
         
-        # Generate summary based on type
-        if report_type == 'workload':
-            summary = generate_workload_summary(team)
-        elif report_type == 'burnout':
-            summary = generate_burnout_analysis(team)
-        elif report_type == 'performance':
-            summary = generate_performance_report(team)
-        else:
-            summary = "Report generated successfully."
+        # Create report with the summary for its type
+        report = create_insight_report(team, report_type, request.user)
         
-        # Create report
-        report = InsightReport.objects.create(
-            team=team,
-            generated_by=request.user,
-            summary_text=summary,
-            report_type=report_type
-        )
+        # PDFs are rendered in the background; the reports page polls
+        # report_status_api and downloads once it is ready
+        queue_report_pdf(report)
         
-        # If PDF download requested, generate and return PDF
         if download_pdf:
-            return generate_report_pdf(report, team)
+            messages.success(request, 'Report generated! The PDF will download when it is ready.')
+            return redirect(f"{reverse('reports')}?download={report.id}")
         
         messages.success(request, 'Report generated successfully!')
         return redirect('reports')
@@ -602,214 +637,49 @@ def generate_report_view(request):
     return redirect('reports')
 
 
+def _report_for_lead(user, report_id):
+    """The report if user leads its team, else None"""
+    if not user.is_team_lead:
+        return None
+    report = get_object_or_404(InsightReport.objects.select_related('team'), id=report_id)
+    if not user.teamlead_profile.teams.filter(id=report.team_id).exists():
+        return None
+    return report
+
+
 @login_required
 def download_report_pdf(request, report_id):
     """Download existing report as PDF"""
-    report = get_object_or_404(InsightReport, id=report_id)
-    
-    # Check permissions
-    if request.user.is_team_lead:
-        team_lead = request.user.teamlead_profile
-        if report.team not in team_lead.teams.all():
-            messages.error(request, 'You do not have permission to download this report.')
-            return redirect('reports')
-    else:
-        messages.error(request, 'Only team leads can download reports.')
+    report = _report_for_lead(request.user, report_id)
+    if report is None:
+        messages.error(request, 'You do not have permission to download this report.')
         return redirect('reports')
     
-    return generate_report_pdf(report, report.team)
-
-
-def generate_report_pdf(report, team):
-    """Generate PDF for a report"""
-    # Create the HttpResponse object with PDF headers
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="LoadSpecs_Report_{team.team_name}_{datetime.now().strftime("%Y%m%d")}.pdf"'
-    
-    # Create the PDF object
-    doc = SimpleDocTemplate(response, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#003135'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=16,
-        textColor=colors.HexColor('#00bcd4'),
-        spaceAfter=12,
-        spaceBefore=12
-    )
-    
-    # Title
-    elements.append(Paragraph(f"LoadSpecs Report - {team.team_name}", title_style))
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Report Info
-    elements.append(Paragraph(f"<b>Report Type:</b> {report.report_type.title()}", styles['Normal']))
-    elements.append(Paragraph(f"<b>Generated By:</b> {report.generated_by.full_name}", styles['Normal']))
-    elements.append(Paragraph(f"<b>Generated On:</b> {report.created_at.strftime('%B %d, %Y at %I:%M %p')}", styles['Normal']))
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Summary
-    elements.append(Paragraph("Summary", heading_style))
-    for line in report.summary_text.split('\n'):
-        if line.strip():
-            elements.append(Paragraph(line.strip(), styles['Normal']))
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Team Statistics
-    elements.append(Paragraph("Team Statistics", heading_style))
-    
-    # Tasks Table
-    tasks = Task.objects.filter(team=team)
-    if tasks.exists():
-        elements.append(Paragraph("<b>Tasks Overview:</b>", styles['Normal']))
-        elements.append(Spacer(1, 0.1*inch))
-        
-        task_data = [['Task Title', 'Assigned To', 'Status', 'Priority', 'Due Date']]
-        for task in tasks[:10]:  # Limit to 10 tasks
-            task_data.append([
-                task.title[:30],
-                task.assigned_to.user.username,
-                task.status.title(),
-                task.priority.title(),
-                task.due_date.strftime('%Y-%m-%d')
-            ])
-        
-        task_table = Table(task_data, colWidths=[2*inch, 1.5*inch, 1*inch, 1*inch, 1*inch])
-        task_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#003135')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        elements.append(task_table)
-        elements.append(Spacer(1, 0.3*inch))
-    
-    # Mood Statistics
-    moods = MoodCheckin.objects.filter(team=team, timestamp__gte=timezone.now() - timedelta(days=30))
-    if moods.exists():
-        elements.append(Paragraph("<b>Recent Mood Check-ins (Last 30 Days):</b>", styles['Normal']))
-        elements.append(Spacer(1, 0.1*inch))
-        
-        mood_counts = {
-            'Happy': moods.filter(mood='happy').count(),
-            'Neutral': moods.filter(mood='neutral').count(),
-            'Stressed': moods.filter(mood='stressed').count(),
-            'Burnout': moods.filter(mood='burnout').count(),
-        }
-        
-        mood_data = [['Mood', 'Count']]
-        for mood, count in mood_counts.items():
-            mood_data.append([mood, str(count)])
-        
-        mood_table = Table(mood_data, colWidths=[3*inch, 2*inch])
-        mood_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#00bcd4')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        elements.append(mood_table)
-    
-    # Footer
-    elements.append(Spacer(1, 0.5*inch))
-    elements.append(Paragraph("___", styles['Normal']))
-    elements.append(Paragraph("Generated by LoadSpecs - Workload Management System", styles['Normal']))
-    
-    # Build PDF
-    doc.build(elements)
-    return response
-
-
-def generate_workload_summary(team):
-    """Generate workload summary for a team"""
-    total_tasks = team.tasks.count()
-    completed = team.completed_tasks
-    pending = team.pending_tasks
-    in_progress = team.in_progress_tasks
-    
-    summary = f"""
-    Workload Summary for {team.team_name}:
-    
-    Total Tasks: {total_tasks}
-    Completed: {completed} ({(completed/total_tasks*100) if total_tasks > 0 else 0:.1f}%)
-    In Progress: {in_progress}
-    Pending: {pending}
-    
-    Team Members: {team.member_count}
-    Average Tasks per Member: {total_tasks/team.member_count if team.member_count > 0 else 0:.1f}
-    
-    Status: {'On Track' if completed/total_tasks > 0.7 else 'Needs Attention' if total_tasks > 0 else 'No Tasks'}
-    """
-    
-    return summary
-
-
-def generate_burnout_analysis(team):
-    """Generate burnout analysis for a team"""
-    recent_moods = MoodCheckin.objects.filter(
-        team=team,
-        timestamp__gte=timezone.now() - timedelta(days=30)
-    )
-    
-    total_checkins = recent_moods.count()
-    burnout_count = recent_moods.filter(mood='burnout').count()
-    stressed_count = recent_moods.filter(mood='stressed').count()
-    
-    risk_level = "Low"
-    if burnout_count / total_checkins > 0.3 if total_checkins > 0 else False:
-        risk_level = "High"
-    elif stressed_count / total_checkins > 0.5 if total_checkins > 0 else False:
-        risk_level = "Medium"
-    
-    summary = f"""
-    Burnout Analysis for {team.team_name}:
-    
-    Total Mood Check-ins (30 days): {total_checkins}
-    Burnout Reports: {burnout_count}
-    Stressed Reports: {stressed_count}
+    if report.pdf_status == 'ready' and report.pdf_file and report.pdf_file.storage.exists(report.pdf_file.name):
+        return serve_report_pdf(report)
     
-    Risk Level: {risk_level}
-    
-    Recommendation: {'Immediate attention needed. Consider workload redistribution.' if risk_level == 'High' else 'Monitor team well-being regularly.' if risk_level == 'Medium' else 'Team morale is healthy.'}
-    """
-    
-    return summary
+    if report.pdf_status != 'pending' or pdf_pending_too_long(report):
+        queue_report_pdf(report)
+        if report.pdf_status == 'ready':
+            return serve_report_pdf(report)
+    messages.info(request, 'The PDF is being generated and will download when it is ready.')
+    return redirect(f"{reverse('reports')}?download={report.id}")
 
 
-def generate_performance_report(team):
-    """Generate performance report for a team"""
-    employees = team.employees.all()
+@login_required
+def report_status_api(request, report_id):
+    """PDF status of a report, polled by the reports page"""
+    report = _report_for_lead(request.user, report_id)
+    if report is None:
+        return JsonResponse({'success': False, 'error': 'Access denied'}, status=403)
     
-    summary = f"Performance Report for {team.team_name}:\n\n"
+    if pdf_pending_too_long(report):
+        queue_report_pdf(report)
     
-    for emp in employees:
-        total = emp.assigned_tasks
-        completed = emp.completed_tasks
-        completion_rate = (completed / total * 100) if total > 0 else 0
-        
-        summary += f"{emp.user.username}: {completed}/{total} tasks completed ({completion_rate:.1f}%)\n"
-    
-    return summary
+    data = {'success': True, 'status': report.pdf_status}
+    if report.pdf_status == 'ready':
+        data['download_url'] = reverse('download_report_pdf', args=[report.id])
+    return JsonResponse(data)
 
 
 @login_required
@@ -1014,9 +884,53 @@ def calendar_view(request):
     except CalendarSync.DoesNotExist:
         context['calendar_sync'] = None
     
+    # Subscription feed URL for calendars that should not get OAuth access
+    feed, _ = CalendarFeed.objects.get_or_create(user=user)
+    context['feed_url'] = request.build_absolute_uri(reverse('calendar_feed', args=[feed.token]))
+    
     return render(request, 'LoadSpecsHTML/calendar.html', context)
 
 
+def calendar_feed(request, token):
+    """
+    iCalendar subscription feed of a user's open tasks
+    
+    The token in the URL is the only credential, so calendar apps can poll it
+    without a session. Validators come from one aggregate query, letting
+    unchanged feeds answer 304 without touching the task rows; full responses
+    are streamed so large team feeds never sit in memory.
+    """
+    feed = CalendarFeed.objects.select_related('user').filter(token=token).first()
+    if feed is None or not feed.user.is_active:
+        raise Http404
+    
+    scope = feed.get_tasks()
+    version = scope.aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    last_modified = version['last_modified'] or feed.created_at
+    # The count catches deleted tasks, which do not move the max updated_at
+    etag = f'"{int(last_modified.timestamp() * 1000000):x}-{version["count"]}"'
+    
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp())
+    )
+    if response is None:
+        rows = scope.filter(status__in=['pending', 'in_progress']).order_by('due_date', 'id').values_list(
+            'id', 'title', 'description', 'due_date', 'priority', 'status', 'updated_at'
+        ).iterator(chunk_size=500)
+        response = StreamingHttpResponse(
+            stream_calendar(rows, f'LoadSpecs - {feed.user.username}', request.get_host().split(':')[0]),
+            content_type='text/calendar; charset=utf-8'
+        )
+        response['Content-Disposition'] = 'inline; filename="loadspecs.ics"'
+    
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    response['Cache-Control'] = 'private, max-age=300'
+    return response
+
+
 @login_required
 def calendar_sync_setup(request):
     """Set up calendar synchronization"""
@@ -1068,13 +982,19 @@ def chat_view(request):
             context['teams'] = [employee.team]
     elif user.is_team_lead:
         team_lead = user.teamlead_profile
-        context['teams'] = team_lead.teams.all()
-    
-    recent_messages = Message.objects.filter(
-        Q(sender=user) | Q(recipient=user)
-    ).order_by('-timestamp')[:50]
+        context['teams'] = list(team_lead.teams.all())
+    
+    # Unread badges from the read cursors, one grouped query
+    rooms = get_accessible_rooms(user)
+    unread = unread_counts(user, rooms)
+    for team in context.get('teams', []):
+        team.unread = unread.get(f'team:{team.id}', 0)
+    context['unread_direct'] = sum(
+        count for key, count in unread.items() if key.startswith('dm:')
+    )
     
-    context['recent_messages'] = recent_messages
+    # Conversations by latest activity, from the summary table
+    context['conversations'] = inbox(user, rooms, unread)
     
     return render(request, 'LoadSpecsHTML/chat.html', context)
 
@@ -1085,21 +1005,22 @@ def team_chat_view(request, team_id):
     team = get_object_or_404(Team, id=team_id)
     user = request.user
     
-    is_member = False
-    if user.is_employee:
-        is_member = user.employee_profile.team == team
-    elif user.is_team_lead:
-        is_member = team in user.teamlead_profile.teams.all()
-    
-    if not is_member:
+    if not can_access_team(user, team.id):
         messages.error(request, 'You do not have access to this team chat.')
         return redirect('chat')
     
-    messages_list = Message.objects.filter(team=team).order_by('timestamp')
+    # Only the newest page; older history is fetched from the API on scroll
+    key = f'team:{team.id}'
+    messages_list, has_more = recent_messages(
+        conversation_filter(user.id, key), archive_key=storage_key(user.id, key)
+    )
+    if messages_list:
+        mark_conversation_read(user, key, messages_list[-1].id)
     
     context = {
         'team': team,
         'messages': messages_list,
+        'has_more': has_more,
         'user': user
     }
     
@@ -1112,21 +1033,22 @@ def task_chat_view(request, task_id):
     task = get_object_or_404(Task, id=task_id)
     user = request.user
     
-    has_access = False
-    if user.is_employee:
-        has_access = task.assigned_to.user == user
-    elif user.is_team_lead:
-        has_access = task.team in user.teamlead_profile.teams.all()
-    
-    if not has_access:
+    if not can_access_task(user, task.id):
         messages.error(request, 'You do not have access to this task discussion.')
         return redirect('chat')
     
-    messages_list = Message.objects.filter(task=task).order_by('timestamp')
+    # Only the newest page; older history is fetched from the API on scroll
+    key = f'task:{task.id}'
+    messages_list, has_more = recent_messages(
+        conversation_filter(user.id, key), archive_key=storage_key(user.id, key)
+    )
+    if messages_list:
+        mark_conversation_read(user, key, messages_list[-1].id)
     
     context = {
         'task': task,
         'messages': messages_list,
+        'has_more': has_more,
         'user': user
     }
     
@@ -1139,20 +1061,46 @@ def direct_chat_view(request, user_id):
     other_user = get_object_or_404(User, id=user_id)
     user = request.user
     
-    messages_list = Message.objects.filter(
-        (Q(sender=user) & Q(recipient=other_user)) |
-        (Q(sender=other_user) & Q(recipient=user))
-    ).order_by('timestamp')
+    key = f'dm:{other_user.id}'
+    messages_list, has_more = recent_messages(
+        conversation_filter(user.id, key), archive_key=storage_key(user.id, key)
+    )
+    if messages_list:
+        mark_conversation_read(user, key, messages_list[-1].id)
     
     context = {
         'other_user': other_user,
         'messages': messages_list,
+        'has_more': has_more,
         'user': user
     }
     
     return render(request, 'LoadSpecsHTML/direct_chat.html', context)
 
 
+def broadcast_chat_message(message):
+    """Push a message saved over HTTP to WebSocket and event-stream subscribers"""
+    try:
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from .consumers import chat_event, message_group
+    except ImportError:
+        # Channels not installed - recipients see the message on reload
+        return
+    
+    channel_layer = get_channel_layer()
+    group_name = message_group(message)
+    if channel_layer is None or group_name is None:
+        return
+    
+    try:
+        async_to_sync(channel_layer.group_send)(group_name, chat_event(
+            group_name, message.sender, message.content, message.timestamp, message.id
+        ))
+    except Exception as e:
+        print(f"Failed to broadcast message {message.id}: {e}")
+
+
 @login_required
 @require_http_methods(["POST"])
 def send_message_api(request):
@@ -1163,22 +1111,31 @@ def send_message_api(request):
         content = data.get('content')
         target_id = data.get('target_id')
         
-        if not content:
+        if not isinstance(content, str) or not content.strip():
             return JsonResponse({'success': False, 'error': 'Message content is required'})
         
-        message = Message.objects.create(sender=request.user, content=content)
-        
+        # Same access rules as the chat sockets and the history API
         if message_type == 'team':
-            team = Team.objects.get(id=target_id)
-            message.team = team
+            allowed = can_access_team(request.user, target_id)
+            room = {'team_id': int(target_id)}
         elif message_type == 'task':
-            task = Task.objects.get(id=target_id)
-            message.task = task
+            allowed = can_access_task(request.user, target_id)
+            room = {'task_id': int(target_id)}
         elif message_type == 'direct':
-            recipient = User.objects.get(id=target_id)
-            message.recipient = recipient
+            allowed = User.objects.filter(id=target_id).exists()
+            room = {'recipient_id': int(target_id)}
+        else:
+            return JsonResponse({'success': False, 'error': 'Invalid chat type'})
+        
+        if not allowed:
+            return JsonResponse({'success': False, 'error': 'Access denied'}, status=403)
         
-        message.save()
+        # Broadcast only once the message and its conversation summary are
+        # committed, so no subscriber sees a message that was rolled back
+        with transaction.atomic():
+            message = Message.objects.create(sender=request.user, content=content, **room)
+            record_messages([message])
+            transaction.on_commit(lambda: broadcast_chat_message(message))
         
         return JsonResponse({
             'success': True,
@@ -1194,24 +1151,114 @@ def send_message_api(request):
 
 @login_required
 def get_messages_api(request, chat_id):
-    """API endpoint to get messages"""
+    """
+    API endpoint to get messages, one page at a time
+    
+    ?type=team|task|direct selects the conversation (chat_id is the other
+    user for direct). Pages hold up to ?limit messages, oldest first:
+    the newest page by default, ?before_id=<id> for older history and
+    ?after_id=<id> for anything newer than a message.
+    """
     chat_type = request.GET.get('type')
+    user = request.user
     
     if chat_type == 'team':
-        messages_list = Message.objects.filter(team_id=chat_id)
+        allowed = can_access_team(user, chat_id)
+        key = f'team:{chat_id}'
     elif chat_type == 'task':
-        messages_list = Message.objects.filter(task_id=chat_id)
+        allowed = can_access_task(user, chat_id)
+        key = f'task:{chat_id}'
+    elif chat_type == 'direct':
+        allowed = User.objects.filter(id=chat_id).exists()
+        key = f'dm:{chat_id}'
     else:
         return JsonResponse({'success': False, 'error': 'Invalid chat type'})
     
+    if not allowed:
+        return JsonResponse({'success': False, 'error': 'Access denied'}, status=403)
+    
+    try:
+        before_id = request.GET.get('before_id')
+        after_id = request.GET.get('after_id')
+        before_id = int(before_id) if before_id else None
+        after_id = int(after_id) if after_id else None
+        limit = min(max(int(request.GET.get('limit', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid pagination parameters'})
+    
+    rows, has_more = message_page(
+        conversation_filter(user.id, key), before_id, after_id, limit,
+        archive_key=storage_key(user.id, key)
+    )
+    
     messages_data = [{
-        'id': msg.id,
-        'sender': msg.sender.username,
-        'content': msg.content,
-        'timestamp': msg.timestamp.isoformat()
-    } for msg in messages_list.order_by('timestamp')]
+        'id': row['id'],
+        'sender': row['sender__username'],
+        'sender_id': row['sender_id'],
+        'content': row['content'],
+        'timestamp': row['timestamp'].isoformat()
+    } for row in rows]
     
-    return JsonResponse({'success': True, 'messages': messages_data})
+    return JsonResponse({'success': True, 'messages': messages_data, 'has_more': has_more})
+
+
+@login_required
+def search_messages_api(request):
+    """
+    Full-text search over the user's chats and direct messages
+    
+    ?q=<words> returns ranked hits with highlighted snippets; pass
+    ?cursor=<next_cursor> from a response for the following page.
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', message_search.PAGE_SIZE)), 1), message_search.MAX_PAGE_SIZE)
+        hits, next_cursor = message_search.search_messages(
+            request.user, request.GET.get('q', ''), request.GET.get('cursor'), limit
+        )
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid pagination parameters'})
+    
+    results = [dict(hit, timestamp=hit['timestamp'].isoformat()) for hit in hits]
+    return JsonResponse({'success': True, 'results': results, 'next_cursor': next_cursor})
+
+
+async def event_stream_view(request):
+    """
+    Server-Sent Events stream for clients where WebSockets are blocked
+    
+    ?streams=team:3,task:7,dm:2,notifications names the conversations, as
+    on the multiplexed socket. EventSource resends the last event id as
+    Last-Event-ID on reconnect and missed chat messages are replayed.
+    """
+    from asgiref.sync import sync_to_async
+    
+    try:
+        from .consumers import event_stream, resolve_stream
+    except ImportError:
+        return JsonResponse({'success': False, 'error': 'Real-time streaming is unavailable'}, status=503)
+    
+    # login_required is not async-aware in this Django version
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if user is None:
+        return JsonResponse({'success': False, 'error': 'Authentication required'}, status=403)
+    
+    rooms = []
+    for stream in request.GET.get('streams', '').split(','):
+        room = await resolve_stream(user, stream.strip()) if stream.strip() else None
+        if room is not None and room.group_name not in [r.group_name for r in rooms]:
+            rooms.append(room)
+    
+    if not rooms:
+        return JsonResponse({'success': False, 'error': 'No accessible streams requested'}, status=400)
+    
+    response = StreamingHttpResponse(
+        event_stream(user, rooms, request.headers.get('Last-Event-ID')),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 # ============================================
@@ -1449,23 +1496,18 @@ def get_mood_trends_data(request):
         team_lead = user.teamlead_profile
         teams = team_lead.teams.all()
         
+        # The last four calendar weeks, this one included
+        trend = mood_trend(timezone.now() - timedelta(weeks=3), bucket='week', teams=teams)
+        
         data = []
-        for i in range(3, -1, -1):
-            start_date = timezone.now().date() - timedelta(weeks=i+1)
-            end_date = timezone.now().date() - timedelta(weeks=i)
-            
-            moods = MoodCheckin.objects.filter(
-                team__in=teams,
-                timestamp__date__gte=start_date,
-                timestamp__date__lt=end_date
-            )
-            
+        for number, week in enumerate(trend, start=1):
             data.append({
-                'week': f'Week {4-i}',
-                'happy': moods.filter(mood='happy').count(),
-                'neutral': moods.filter(mood='neutral').count(),
-                'stressed': moods.filter(mood='stressed').count(),
-                'burnout': moods.filter(mood='burnout').count()
+                'week': f'Week {number}',
+                'start': week['period'].isoformat(),
+                'happy': week['happy'],
+                'neutral': week['neutral'],
+                'stressed': week['stressed'],
+                'burnout': week['burnout']
             })
         
         return JsonResponse({'success': True, 'data': data})